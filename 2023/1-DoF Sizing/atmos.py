@@ -0,0 +1,119 @@
+# international standard atmosphere, python version of atmos.m
+#
+# atmos.m wrapped matlab's atmosisa and stacked its four outputs into a
+# matrix on every call just to return one row. here isa(altitude) takes
+# scalars or arrays of any shape and returns temperature, speed of sound,
+# pressure and density (atmosisa's order) for the ISA layers up to 84.852 km
+# (geopotential altitude, like atmosisa; above the last layer and below sea
+# level the nearest layer is extended). for the many evaluations of a sizing
+# sweep, AtmosphereTable precomputes the same quantities on a uniform grid:
+# a lookup is an index computation and a linear interpolation between two
+# nodes, whatever the altitude.
+#
+#   python atmos.py isa_profile.csv     writes a column for atmosphere_cache
+
+import numpy as np
+
+G0 = 9.80665  # m/s^2
+R = 287.0531  # specific gas constant of air, J/(kg K), as atmosisa
+GAMMA = 1.4
+T0 = 288.15  # K
+P0 = 101325.0  # Pa
+
+# ISA layers: base geopotential altitude (m) and lapse rate (K/m)
+LAYER_BASES = np.array([0.0, 11000.0, 20000.0, 32000.0, 47000.0, 51000.0, 71000.0, 84852.0])
+LAPSE_RATES = np.array([-0.0065, 0.0, 0.001, 0.0028, 0.0, -0.0028, -0.002])
+
+QUANTITIES = ["temperature", "speed_of_sound", "pressure", "density"]
+
+
+def _layer_bases():
+    # temperature and pressure at the base of every layer
+    temperatures, pressures = [T0], [P0]
+    for base, top, lapse in zip(LAYER_BASES[:-2], LAYER_BASES[1:-1], LAPSE_RATES):
+        temperature, pressure = _in_layer(top - base, temperatures[-1], pressures[-1], lapse)
+        temperatures.append(temperature)
+        pressures.append(pressure)
+    return np.array(temperatures), np.array(pressures)
+
+
+def _in_layer(height, base_temperature, base_pressure, lapse):
+    # temperature and pressure `height` m above the base of a layer
+    temperature = base_temperature + lapse * height
+    with np.errstate(divide="ignore", invalid="ignore"):
+        gradient = base_pressure * (temperature / base_temperature) ** (-G0 / (R * np.where(lapse == 0, 1, lapse)))
+        isothermal = base_pressure * np.exp(-G0 * height / (R * base_temperature))
+    return temperature, np.where(lapse == 0, isothermal, gradient)
+
+
+BASE_TEMPERATURES, BASE_PRESSURES = _layer_bases()
+
+
+def isa(altitude):
+    """Temperature (K), speed of sound (m/s), pressure (Pa) and density (kg/m^3) at `altitude` (m)."""
+    altitude = np.asarray(altitude, dtype=float)
+    layer = np.clip(np.searchsorted(LAYER_BASES, altitude, side="right") - 1, 0, len(LAPSE_RATES) - 1)
+    temperature, pressure = _in_layer(
+        altitude - LAYER_BASES[layer], BASE_TEMPERATURES[layer], BASE_PRESSURES[layer], LAPSE_RATES[layer]
+    )
+    return temperature, np.sqrt(GAMMA * R * temperature), pressure, pressure / (R * temperature)
+
+
+def atmos(altitude, index):
+    """atmos.m: one quantity by atmosisa index, 1 temperature, 2 speed of sound, 3 pressure, 4 density."""
+    return isa(altitude)[index - 1]
+
+
+class AtmosphereTable:
+    """isa() precomputed every `step` m from `minimum` to `maximum`, evaluated by lookup.
+
+    Calling the table returns the same four quantities as isa(); outside the
+    table the end values are held. With the default 1 m step the linear
+    interpolation is within a few parts per billion of isa().
+    """
+
+    def __init__(self, maximum=40000.0, step=1.0, minimum=0.0):
+        self.minimum = float(minimum)
+        self.step = float(step)
+        self.altitudes = np.arange(minimum, maximum + step / 2, step)
+        self.values = np.stack(isa(self.altitudes))
+        # change to the next node, so a lookup is one multiply-add
+        self.slopes = np.diff(self.values, axis=1)
+
+    def _locate(self, altitude):
+        position = np.clip((np.asarray(altitude, dtype=float) - self.minimum) / self.step, 0, len(self.altitudes) - 1)
+        index = np.minimum(position.astype(np.intp), len(self.altitudes) - 2)
+        return index, position - index
+
+    def __call__(self, altitude):
+        index, fraction = self._locate(altitude)
+        return tuple(
+            np.take(values, index) + fraction * np.take(slopes, index) for values, slopes in zip(self.values, self.slopes)
+        )
+
+    def quantity(self, altitude, name):
+        """Only one of QUANTITIES, e.g. "speed_of_sound" for Mach numbers."""
+        k = QUANTITIES.index(name)
+        index, fraction = self._locate(altitude)
+        return np.take(self.values[k], index) + fraction * np.take(self.slopes[k], index)
+
+
+def write_profile(path, top=30000.0, step=250.0, elevation=0.0):
+    """Writes an ISA column (no wind) as csv in the atmosphere_cache profile format."""
+    heights = np.arange(elevation, top + step / 2, step)
+    temperature, _, pressure, _ = isa(heights)
+    np.savetxt(
+        path,
+        np.column_stack((heights, pressure, temperature, np.zeros_like(heights), np.zeros_like(heights))),
+        delimiter=",",
+        header="height,pressure,temperature,wind_u,wind_v",
+        comments="",
+    )
+    return path
+
+
+if __name__ == "__main__":
+    import sys
+
+    path = write_profile(sys.argv[1] if len(sys.argv) > 1 else "isa_profile.csv")
+    print(f"ISA profile written to {path}")
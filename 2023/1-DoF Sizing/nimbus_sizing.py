@@ -0,0 +1,225 @@
+# 1-DoF vertical flight sizing, python version of Nimbus_Sizing_1DOF.slx
+#
+# same model as the simulink diagram (run with Nimbus_Sizing_1DOF_var.m):
+#   - constant thrust V_e*mdot plus the nozzle pressure term A_e*(p0 - p_a),
+#     fuel and oxidiser flows in the OF ratio until the tanks are empty
+#   - mass = dry mass + fuel + oxidiser left
+#   - drag 0.5*rho*Cd*A*V^2 against the velocity; once falling faster than
+#     15 m/s the drogue (above 1500 m) or the main (below) adds its own
+#   - standard atmosphere (the diagram's troposphere is the first ISA
+#     layer, see atmos.py for the layers above 11 km)
+#   - the rocket sits on the ground until thrust beats weight
+# but every argument can be an array: each element is one design and all of
+# them are integrated together as numpy arrays, so a sweep over thousands of
+# designs takes about as long as one design. the burn and the coast are
+# integrated with classic RK4 on a fixed number of steps per design (the
+# step is each design's own burn time or coast estimate over the number of
+# steps), so burnout always falls on a step boundary.
+#
+# differences to the diagram: the parachutes stay open once deployed (in
+# the diagram they close again below 15 m/s), and max Mach uses the speed
+# of sound where the rocket is rather than at 3000 m.
+
+import numpy as np
+
+from atmos import P0, AtmosphereTable
+
+G = 9.81  # m/s^2, constant, we're not going that high
+
+# Nimbus_Sizing_1DOF_var.m
+NIMBUS_DESIGN = {
+    "OF": 3.5,  # oxidiser to fuel mass ratio
+    "m_ox": 14.0,  # oxidiser mass, kg
+    "Isp": 220.0,  # specific impulse, s
+    "thrust": 4500.0,  # N, no regression
+    "m_dry": 70.0,  # kg
+    "Cd": 0.7,
+    "diameter": 0.20,  # m
+    "exit_diameter": 0.060,  # nozzle exit, m
+    "Cd_para": 0.97,
+    "main_diameter": 6.1,  # m
+    "drogue_diameter": 1.22,  # m
+}
+
+# parachutes open when falling faster than this, the drogue above MAIN_ALTITUDE
+DEPLOY_VELOCITY = -15.0
+MAIN_ALTITUDE = 1500.0
+
+
+# looked up at every RK4 stage of every design
+ATMOSPHERE = AtmosphereTable(maximum=40000.0, step=1.0)
+
+
+class Designs:
+    """The design arguments broadcast to one array each, with derived quantities."""
+
+    def __init__(self, **design):
+        unknown = set(design) - set(NIMBUS_DESIGN)
+        if unknown:
+            raise ValueError(f"Unknown design parameters {sorted(unknown)}, choose from {sorted(NIMBUS_DESIGN)}.")
+        values = np.broadcast_arrays(*[np.asarray(design.get(name, default), dtype=float) for name, default in NIMBUS_DESIGN.items()])
+        self.shape = values[0].shape
+        for name, value in zip(NIMBUS_DESIGN, values):
+            setattr(self, name, value.ravel())
+
+        self.m_fuel = self.m_ox / self.OF
+        self.m_propellant = self.m_ox + self.m_fuel
+        self.exhaust_velocity = G * self.Isp
+        self.m_dot = self.thrust / self.exhaust_velocity
+        self.burn_time = self.m_propellant / self.m_dot
+        self.exit_area = np.pi * (self.exit_diameter / 2) ** 2
+        # drag areas times Cd: rocket, rocket + drogue, rocket + main
+        self.area = np.pi * self.diameter**2 / 4
+        self.drag_area = self.Cd * self.area
+        self.drogue_drag_area = self.drag_area + self.Cd_para * np.pi * self.drogue_diameter**2 / 4
+        self.main_drag_area = self.drag_area + self.Cd_para * np.pi * self.main_diameter**2 / 4
+
+
+def _acceleration(designs, t, altitude, velocity, powered, drag_area):
+    _, _, pressure, density = ATMOSPHERE(altitude)
+    if powered:
+        thrust = designs.exhaust_velocity * designs.m_dot + designs.exit_area * (P0 - pressure)
+        mass = designs.m_dry + designs.m_propellant - designs.m_dot * t
+    else:
+        thrust = 0.0
+        mass = designs.m_dry
+    drag = -0.5 * density * drag_area * velocity * np.abs(velocity)
+    acceleration = (thrust + drag) / mass - G
+    # on the pad (or on the ground) until the net force lifts it
+    return np.where((altitude <= 0) & (velocity <= 0) & (acceleration < 0), 0.0, acceleration)
+
+
+def _rk4_step(designs, t, altitude, velocity, dt, powered, drag_area):
+    def derivative(t, altitude, velocity):
+        return velocity, _acceleration(designs, t, altitude, velocity, powered, drag_area)
+
+    k1h, k1v = derivative(t, altitude, velocity)
+    k2h, k2v = derivative(t + dt / 2, altitude + dt / 2 * k1h, velocity + dt / 2 * k1v)
+    k3h, k3v = derivative(t + dt / 2, altitude + dt / 2 * k2h, velocity + dt / 2 * k2v)
+    k4h, k4v = derivative(t + dt, altitude + dt * k3h, velocity + dt * k3v)
+    altitude = altitude + dt / 6 * (k1h + 2 * k2h + 2 * k3h + k4h)
+    velocity = velocity + dt / 6 * (k1v + 2 * k2v + 2 * k3v + k4v)
+    grounded = altitude < 0
+    return np.where(grounded, 0.0, altitude), np.where(grounded, np.maximum(velocity, 0.0), velocity)
+
+
+def fly_designs(burn_steps=100, coast_steps=100, descent=False, descent_step=0.1, max_descent_time=2000.0, **design):
+    """Apogee, max velocity and max Mach of every design (see NIMBUS_DESIGN).
+
+    Design arguments are scalars or arrays, broadcast against each other;
+    every result has their broadcast shape. Returns a dict of arrays:
+    apogee (m), apogeeTime, maxVelocity, maxMach, burnTime, totalImpulse
+    (the motor's, without the pressure term), burnoutAltitude and
+    burnoutVelocity; with `descent` also the landing time and velocity under
+    the parachutes, integrated with fixed steps of `descent_step` s.
+    """
+    designs = Designs(**design)
+    altitude = np.zeros(designs.burn_time.shape)
+    velocity = np.zeros_like(altitude)
+    max_velocity = np.zeros_like(altitude)
+    max_mach = np.zeros_like(altitude)
+
+    # powered ascent, exactly up to each design's burnout
+    dt = designs.burn_time / burn_steps
+    for step in range(burn_steps):
+        altitude, velocity = _rk4_step(designs, step * dt, altitude, velocity, dt, True, designs.drag_area)
+        max_velocity = np.maximum(max_velocity, velocity)
+        max_mach = np.maximum(max_mach, velocity / ATMOSPHERE.quantity(altitude, "speed_of_sound"))
+    burnout_altitude, burnout_velocity = altitude, velocity
+
+    # coast, over the time a drag free coast would need (drag only shortens it)
+    coast_time = np.maximum(velocity, 0) / G
+    dt = np.maximum(coast_time, 1e-6) / coast_steps
+    apogee, apogee_time = altitude.copy(), designs.burn_time.copy()
+    for step in range(coast_steps):
+        previous_altitude, previous_velocity = altitude, velocity
+        altitude, velocity = _rk4_step(designs, 0.0, altitude, velocity, dt, False, designs.drag_area)
+        # the top within the step where the velocity changes sign, taking the
+        # deceleration as constant over the step
+        crossing = (previous_velocity > 0) & (velocity <= 0)
+        deceleration = np.maximum(previous_velocity - velocity, 1e-12) / dt
+        top = previous_altitude + previous_velocity**2 / (2 * deceleration)
+        apogee = np.where(crossing, top, np.maximum(apogee, altitude))
+        apogee_time = np.where(crossing, designs.burn_time + step * dt + previous_velocity / deceleration, apogee_time)
+
+    results = {
+        "apogee": apogee,
+        "apogeeTime": apogee_time,
+        "maxVelocity": max_velocity,
+        "maxMach": max_mach,
+        "burnTime": designs.burn_time,
+        "totalImpulse": designs.thrust * designs.burn_time,
+        "burnoutAltitude": burnout_altitude,
+        "burnoutVelocity": burnout_velocity,
+    }
+    if descent:
+        results.update(_descent(designs, apogee, apogee_time, descent_step, max_descent_time))
+    return {name: value.reshape(designs.shape) for name, value in results.items()}
+
+
+def _descent(designs, apogee, apogee_time, dt, max_time):
+    # from apogee at rest, chutes latch open once falling faster than 15 m/s
+    altitude, velocity = apogee.copy(), np.zeros_like(apogee)
+    deployed = np.zeros(apogee.shape, dtype=bool)
+    landing_time = np.full(apogee.shape, np.nan)
+    landing_velocity = np.full(apogee.shape, np.nan)
+    flying = apogee > 0
+    t = 0.0
+    while flying.any() and t < max_time:
+        deployed |= velocity < DEPLOY_VELOCITY
+        drag_area = np.where(
+            deployed,
+            np.where(altitude > MAIN_ALTITUDE, designs.drogue_drag_area, designs.main_drag_area),
+            designs.drag_area,
+        )
+        new_altitude, new_velocity = _rk4_step(designs, 0.0, altitude, velocity, dt, False, drag_area)
+        # the raw step, before the ground stops it, gives the touchdown
+        landed = flying & (new_altitude <= 0)
+        fraction = np.divide(altitude, altitude - (altitude + dt * velocity), out=np.ones_like(altitude), where=velocity < 0)
+        landing_time = np.where(landed, apogee_time + t + np.clip(fraction, 0, 1) * dt, landing_time)
+        landing_velocity = np.where(landed, velocity, landing_velocity)
+        flying &= ~landed
+        altitude, velocity = np.where(flying, new_altitude, 0.0), np.where(flying, new_velocity, 0.0)
+        t += dt
+    return {"landingTime": landing_time, "landingVelocity": landing_velocity}
+
+
+if __name__ == "__main__":
+    from time import perf_counter
+
+    import matplotlib.pyplot as plt
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+    m_dry = np.linspace(40, 100, 61) # dry mass sweep, kg
+    target_apogee = 3000 # m
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    start_time = perf_counter()
+    results = fly_designs(m_dry = m_dry)
+    print(f"{len(m_dry)} designs in {(perf_counter() - start_time) * 1e3:0.1f} ms")
+    nominal = fly_designs(descent = True)
+    print(
+        f"Nimbus ({NIMBUS_DESIGN['m_dry']} kg dry) - apogee: {nominal['apogee']:0.0f} m, "
+        f"max velocity: {nominal['maxVelocity']:0.1f} m/s, max Mach: {nominal['maxMach']:0.3f}, "
+        f"landing after {nominal['landingTime']:0.0f} s at {-nominal['landingVelocity']:0.1f} m/s"
+    )
+
+    plt.figure()
+    plt.plot(m_dry, results["apogee"])
+    plt.axhline(target_apogee, linewidth = 2)
+    plt.xlabel("Dry Mass (kg)")
+    plt.ylabel("Predicted Apogee (m)")
+    plt.show()
+
+    plt.figure()
+    plt.plot(m_dry, results["maxVelocity"])
+    plt.xlabel("Dry Mass (kg)")
+    plt.ylabel("Max Velocity (m/s)")
+    plt.show()
+
+    plt.figure()
+    plt.plot(m_dry, results["maxMach"])
+    plt.axhline(1, linewidth = 2)
+    plt.xlabel("Dry Mass (kg)")
+    plt.ylabel("Mach Number")
+    plt.show()
@@ -0,0 +1,163 @@
+# offline atmosphere profiles for the launch site
+#
+# a GFS forecast only contributes one vertical column at the launch site to a
+# flight: pressure, temperature and wind against height above sea level. that
+# column (a few dozen levels) is saved once in a small .npz file and every
+# later run, and every worker of a monte carlo campaign, loads it through
+# rocketpy's custom_atmosphere model instead of downloading the forecast
+# again. cached files are named after the forecast model, the forecast cycle,
+# the launch date and hour and the 0.25 deg grid box of the site:
+#   <directory>/gfs_<cycle>_<launch>_<lat>_<lon>.npz
+#
+# a csv with the columns height, pressure, temperature, wind_u, wind_v (m, Pa,
+# K, m/s, m/s) can stand in for the forecast service, e.g. a sounding or a
+# profile exported from another tool.
+
+import glob
+import os
+
+import numpy as np
+
+PROFILE_COLUMNS = ["height", "pressure", "temperature", "wind_u", "wind_v"]
+
+# resolution of the GFS 0.25 deg grid the forecast is interpolated from
+GRID_STEP = 0.25
+
+
+def _grid_box(latitude, longitude):
+    return (
+        f"{round(latitude / GRID_STEP) * GRID_STEP:+.2f}",
+        f"{round(longitude / GRID_STEP) * GRID_STEP:+.2f}",
+    )
+
+
+def _column(function, heights):
+    return np.array([function.get_value(height) for height in heights], dtype=float)
+
+
+def atmosphere_profile(env, heights=None):
+    """Atmosphere column of `env` as a dict of arrays (and its elevation).
+
+    By default the column is taken on the levels of the forecast; models
+    defined by functions (e.g. the standard atmosphere) are sampled up to
+    their maximum expected height.
+    """
+    if heights is None:
+        if callable(env.pressure.source):
+            heights = np.linspace(env.elevation, env.max_expected_height, 64)
+        else:
+            # the forecast Functions are defined on the pressure levels of the model
+            heights = np.unique(np.asarray(env.pressure.source, dtype=float)[:, 0])
+    return {
+        "height": np.asarray(heights, dtype=float),
+        "pressure": _column(env.pressure, heights),
+        "temperature": _column(env.temperature, heights),
+        "wind_u": _column(env.wind_velocity_x, heights),
+        "wind_v": _column(env.wind_velocity_y, heights),
+        "elevation": float(env.elevation),
+    }
+
+
+def save_atmosphere(env, path, **metadata):
+    """Saves the atmosphere column of `env` (e.g. after a Forecast load) to `path`."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temporary_path = path + ".tmp.npz"
+    np.savez_compressed(
+        temporary_path,
+        **atmosphere_profile(env),
+        **{key: str(value) for key, value in metadata.items()},
+    )
+    os.replace(temporary_path, path)
+    return path
+
+
+def read_atmosphere(path):
+    """Profile columns (and metadata) of a cached .npz or a stand-in .csv file."""
+    if path.endswith(".csv"):
+        data = np.genfromtxt(path, delimiter=",", names=True)
+        missing = set(PROFILE_COLUMNS) - set(data.dtype.names)
+        if missing:
+            raise KeyError(f"{path} is missing the atmosphere columns {sorted(missing)}")
+        profile = {name: np.atleast_1d(data[name]) for name in PROFILE_COLUMNS}
+    else:
+        with np.load(path, allow_pickle=False) as data:
+            # metadata is stored as 0-d arrays
+            profile = {name: data[name] if data[name].ndim else data[name][()] for name in data.files}
+
+    order = np.argsort(profile["height"])
+    for name in PROFILE_COLUMNS:
+        profile[name] = np.asarray(profile[name], dtype=float)[order]
+    return profile
+
+
+def set_atmosphere(env, profile):
+    """Sets the atmosphere of `env` from profile columns (see read_atmosphere)."""
+    height = profile["height"]
+    env.set_atmospheric_model(
+        type="custom_atmosphere",
+        pressure=np.column_stack((height, profile["pressure"])),
+        temperature=np.column_stack((height, profile["temperature"])),
+        wind_u=np.column_stack((height, profile["wind_u"])),
+        wind_v=np.column_stack((height, profile["wind_v"])),
+    )
+    # the forecast's own terrain height, so cached runs match the original
+    if "elevation" in profile:
+        env.elevation = float(profile["elevation"])
+    return env
+
+
+def load_atmosphere(env, path):
+    """Sets the atmosphere of `env` from a profile file, no network needed."""
+    return set_atmosphere(env, read_atmosphere(path))
+
+
+class AtmosphereCache:
+    """Directory of forecast columns, one file per cycle, launch hour and grid box.
+
+    `profile(env)` returns the newest cached column for the date and site of
+    `env`, downloading the forecast (and caching it) only when there is none
+    or `refresh` is set. With `offline=True` a missing profile is an error
+    instead of a download.
+    """
+
+    def __init__(self, directory="atmosphere_cache", model="GFS", offline=False):
+        self.directory = directory
+        self.model = model
+        self.offline = offline
+
+    def _pattern(self, env, cycle="*"):
+        latitude, longitude = _grid_box(env.latitude, env.longitude)
+        launch = env.datetime_date.strftime("%Y%m%d%H")
+        name = f"{self.model.lower()}_{cycle}_{launch}_{latitude}_{longitude}.npz"
+        return os.path.join(self.directory, name)
+
+    def find(self, env):
+        """Newest cached profile for the launch date and site of `env`, or None."""
+        # cycles are YYYYMMDDHH, so the names sort by cycle
+        paths = sorted(glob.glob(self._pattern(env)))
+        return paths[-1] if paths else None
+
+    def fetch(self, env):
+        """Downloads the forecast into `env` and caches its column."""
+        env.set_atmospheric_model(type="Forecast", file=self.model)
+        cycle = env.atmospheric_model_init_date.strftime("%Y%m%d%H")
+        return save_atmosphere(
+            env,
+            self._pattern(env, cycle),
+            model=self.model,
+            cycle=cycle,
+            launch=env.datetime_date.isoformat(),
+            latitude=env.latitude,
+            longitude=env.longitude,
+        )
+
+    def profile(self, env, refresh=False):
+        path = None if refresh else self.find(env)
+        if path is not None:
+            return path
+        if self.offline:
+            raise FileNotFoundError(
+                f"No cached {self.model} profile for {env.datetime_date:%Y-%m-%d %H}h UTC "
+                f"at ({env.latitude}, {env.longitude}) in {self.directory}"
+            )
+        return self.fetch(env)
@@ -0,0 +1,318 @@
+# benchmarks of the nimbus simulation pipeline
+#
+# every stage of nimbus.py / monte_carloing.py is timed on its own: the
+# environment (from a local atmosphere file, no forecast download), the
+# tanks and motor with its mass properties, the rocket assembly on a fresh
+# motor (and on a tabulated one, see motor_tables), an ascent-only flight, a
+# full flight with parachutes, the metric export and the analysis of a
+# synthetic 100k row result store. the motor evaluates its tanks lazily, so
+# nothing shared with the flights is built before the motor and rocket
+# stages have been timed. each stage reports its wall time (best and median
+# of a few repeats), its peak python memory (tracemalloc, one extra run) and,
+# for the flights, the integrator steps and derivative evaluations. every run
+# is appended to benchmark_results.jsonl (not versioned) so runs can be
+# compared over time.
+#
+#   python benchmarks.py                      all stages
+#   python benchmarks.py motor rocket -r 5    some stages, 5 repeats
+#   python benchmarks.py --compare            also show the previous run
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import tracemalloc
+from collections import namedtuple
+from datetime import datetime
+from time import perf_counter
+
+import numpy as np
+import rocketpy
+from rocketpy import Environment
+
+from atmosphere_cache import PROFILE_COLUMNS, load_atmosphere
+from flight_metrics import extract_metrics
+from flight_watchdog import FlightWatchdog, WatchedFlight
+from motor_tables import MOTOR_QUANTITIES, apply_motor_table, tabulate_motor
+from nimbus_template import RocketTemplate, build_motor, build_rocket
+from result_store import FAILED, MONTE_CARLO_SCHEMA, OK, OUTPUT_COLUMNS, ResultStore, load_results
+from streaming_stats import CampaignMonitor
+
+RESULTS_FILE = "benchmark_results.jsonl"
+ANALYSIS_ROWS = 100000
+
+Stage = namedtuple("Stage", ["name", "function", "requires", "setup"])
+
+# name -> Stage, in pipeline order
+STAGES = {}
+
+
+def stage(name, requires=(), setup=None):
+    """Registers `function(state)` as the benchmark stage `name`.
+
+    `state` holds the inputs the stage needs (built once, outside the
+    timing); `setup(state)`, if given, adds the inputs only this stage needs,
+    untimed, right before it runs. The function returns a dict of counters
+    (may be empty).
+    """
+
+    def register(function):
+        STAGES[name] = Stage(name, function, requires, setup)
+        return function
+
+    return register
+
+
+# inputs, built once per run and shared by the stages
+def write_atmosphere_file(directory):
+    # standard atmosphere column in the format of a forecast stand-in file
+    env = Environment(latitude=39.232292, longitude=-8.172027, elevation=160)
+    heights = np.linspace(0, 30000, 41)
+    columns = [
+        heights,
+        [env.pressure.get_value(h) for h in heights],
+        [env.temperature.get_value(h) for h in heights],
+        5 * np.sin(heights / 3000),
+        3 * np.cos(heights / 5000),
+    ]
+    path = os.path.join(directory, "atmosphere.csv")
+    np.savetxt(path, np.column_stack(columns), delimiter=",", header=",".join(PROFILE_COLUMNS), comments="")
+    return path
+
+
+def launch_environment(atmosphere_file):
+    Env = Environment(latitude=39.232292, longitude=-8.172027, elevation=160)
+    Env.set_date((2023, 10, 13, 12))
+    return load_atmosphere(Env, atmosphere_file)
+
+
+def write_synthetic_results(path, rows=ANALYSIS_ROWS, seed=0):
+    rng = np.random.default_rng(seed)
+    columns = {name: rng.normal(size=rows) for name, _ in MONTE_CARLO_SCHEMA}
+    columns["index"] = np.arange(rows)
+    columns["status"] = np.where(rng.random(rows) < 0.02, FAILED, OK)
+    with ResultStore(path, MONTE_CARLO_SCHEMA, overwrite=True) as store:
+        store.append_columns(columns)
+
+
+def prepare(names, directory):
+    state = {"directory": directory}
+    needed = set(names)
+    for name in names:
+        needed.update(STAGES[name].requires)
+    state["atmosphere_file"] = write_atmosphere_file(directory)
+    if needed & {"ascent", "full_flight", "metrics"}:
+        state["env"] = launch_environment(state["atmosphere_file"])
+    if "analysis" in needed:
+        state["results_path"] = os.path.join(directory, "synthetic.store")
+        write_synthetic_results(state["results_path"])
+    return state
+
+
+# untimed inputs of the later stages, built after the motor and rocket
+# stages so those start from an unevaluated motor
+def _template_setup(state):
+    if "template" not in state:
+        state["template"] = RocketTemplate.nimbus(build_motor())
+
+
+def _table_setup(state):
+    if "motor_table" not in state:
+        state["motor_table"] = tabulate_motor(build_motor())
+
+
+def _flight_setup(state):
+    _template_setup(state)
+    if "flight" not in state:
+        state["flight"] = _fly(state, terminate_on_apogee=False)[0]
+
+
+def _fly(state, **flight_arguments):
+    watchdog = FlightWatchdog()
+    flight = WatchedFlight(
+        rocket=state["template"].perturb(),
+        environment=state["env"],
+        rail_length=12,
+        inclination=84,
+        heading=133,
+        watchdog=watchdog,
+        **flight_arguments,
+    )
+    return flight, {"steps": len(flight.solution) - 1, "evaluations": watchdog.evaluations}
+
+
+@stage("environment")
+def environment_stage(state):
+    launch_environment(state["atmosphere_file"])
+    return {}
+
+
+@stage("motor")
+def motor_stage(state):
+    # the tank Functions are only composed when first asked for
+    motor = build_motor()
+    for name in MOTOR_QUANTITIES:
+        getattr(motor, name)
+    return {}
+
+
+@stage("rocket", requires=("motor",))
+def rocket_stage(state):
+    # a fresh motor, as every script and worker builds it
+    build_rocket(build_motor())
+    return {}
+
+
+@stage("tabulated_rocket", requires=("motor",), setup=_table_setup)
+def tabulated_rocket_stage(state):
+    build_rocket(apply_motor_table(build_motor(), state["motor_table"]))
+    return {}
+
+
+@stage("ascent", requires=("environment", "rocket"), setup=_template_setup)
+def ascent_stage(state):
+    return _fly(state, terminate_on_apogee=True)[1]
+
+
+@stage("full_flight", requires=("environment", "rocket"), setup=_template_setup)
+def full_flight_stage(state):
+    return _fly(state, terminate_on_apogee=False)[1]
+
+
+@stage("metrics", requires=("full_flight",), setup=_flight_setup)
+def metrics_stage(state):
+    result = extract_metrics(state["flight"])
+    with ResultStore(os.path.join(state["directory"], "metrics.store"), MONTE_CARLO_SCHEMA, overwrite=True) as store:
+        store.append({"index": 0, "status": OK, **result})
+    return {}
+
+
+@stage("analysis")
+def analysis_stage(state):
+    # what monte_carloing.py does with a finished campaign
+    results = load_results(state["results_path"])
+    successful = results["status"] == OK
+    monitor = CampaignMonitor([name for name, _ in OUTPUT_COLUMNS], len(successful))
+    monitor.update_from_results(results, successful)
+    summary = {}
+    for name, _ in OUTPUT_COLUMNS:
+        values = results[name][successful]
+        summary[name] = (np.mean(values), np.std(values), np.histogram(values, bins=int(len(values) ** 0.5)))
+    summary["ellipses"] = monitor.apogee.ellipses() + monitor.impact.ellipses()
+    return {"rows": len(successful)}
+
+
+def run_stage(name, state, repeat):
+    function, setup = STAGES[name].function, STAGES[name].setup
+    if setup is not None:
+        setup(state)
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        counters = function(state)
+        times.append(perf_counter() - start)
+
+    # peak memory in a separate run, tracemalloc slows everything down
+    tracemalloc.start()
+    function(state)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "best_time": min(times),
+        "median_time": float(np.median(times)),
+        "repeat": repeat,
+        "peak_memory": peak,
+        **counters,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(names=None, repeat=3, results_file=RESULTS_FILE):
+    """Runs the stages (all by default), stores and returns the run record."""
+    names = list(STAGES) if not names else names
+    unknown = set(names) - set(STAGES)
+    if unknown:
+        raise ValueError(f"Unknown benchmark stages {sorted(unknown)}, choose from {list(STAGES)}.")
+
+    directory = tempfile.mkdtemp(prefix="nimbus_benchmarks_")
+    try:
+        state = prepare(names, directory)
+        stages = {}
+        for name in names:
+            stages[name] = run_stage(name, state, repeat)
+            print(format_stage(name, stages[name]))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    record = {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "rocketpy": getattr(rocketpy, "__version__", None),
+        "machine": platform.node(),
+        "stages": stages,
+    }
+    if results_file is not None:
+        with open(results_file, "a") as file:
+            file.write(json.dumps(record) + "\n")
+    return record
+
+
+def read_runs(results_file=RESULTS_FILE):
+    if not os.path.exists(results_file):
+        return []
+    with open(results_file, "r") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def format_stage(name, result):
+    line = (
+        f"{name:>16s} - best: {result['best_time'] * 1000:10.2f} ms, "
+        f"median: {result['median_time'] * 1000:10.2f} ms, peak memory: {result['peak_memory'] / 2**20:8.2f} MiB"
+    )
+    if "steps" in result:
+        line += f", steps: {result['steps']}, evaluations: {result['evaluations']}"
+    return line
+
+
+def compare(run, previous):
+    """Best time of every stage of `run` against the `previous` run."""
+    print(f"\nagainst the run of {previous['date']} (commit {previous['commit']}):")
+    for name, result in run["stages"].items():
+        if name not in previous["stages"]:
+            continue
+        before = previous["stages"][name]
+        print(
+            f"{name:>16s} - {before['best_time'] * 1000:10.2f} ms -> {result['best_time'] * 1000:10.2f} ms "
+            f"({result['best_time'] / before['best_time']:0.2f}x), "
+            f"peak memory {before['peak_memory'] / 2**20:0.2f} -> {result['peak_memory'] / 2**20:0.2f} MiB"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks of the Nimbus simulation pipeline.")
+    parser.add_argument("stages", nargs="*", help=f"stages to run, default all of {list(STAGES)}")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="timed runs per stage")
+    parser.add_argument("-o", "--output", default=RESULTS_FILE, help="file the run is appended to")
+    parser.add_argument("--compare", action="store_true", help="compare with the previous stored run")
+    arguments = parser.parse_args()
+
+    # data files (thrust curve, drag, airfoil) are next to this script
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    previous_runs = read_runs(arguments.output)
+    run = run_benchmarks(arguments.stages, arguments.repeat, arguments.output)
+    if arguments.compare and previous_runs:
+        compare(run, previous_runs[-1])
@@ -0,0 +1,218 @@
+# resumable monte carlo campaigns
+#
+# a campaign lives in its own directory:
+#   <directory>/<campaign_id>/manifest.json   id, seed, size, committed rows, completed indices
+#   <directory>/<campaign_id>/results.store/  columnar result store (see result_store.py)
+#   <directory>/<campaign_id>/failures.jsonl  one failure entry per failed sample
+#
+# results are appended and fsync'ed first and only then the manifest is
+# replaced atomically, so after a crash, Ctrl-C or reboot the manifest always
+# describes rows that are really on disk. anything written after the last
+# checkpoint is cut off on the next start and simply re-run. files written
+# next to the results (a trajectory archive, see `attach`) are synced before
+# every checkpoint too, so a completed sample never lacks them. settings come
+# from an index addressable sampler (see sampling.py) seeded by the campaign,
+# so sample i is the same flight no matter when (or in which run) it is
+# simulated.
+
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+
+from result_store import MONTE_CARLO_SCHEMA, ResultStore
+from sampling import make_sampler
+
+MANIFEST_FILE = "manifest.json"
+STORE_DIRECTORY = "results.store"
+FAILURES_FILE = "failures.jsonl"
+
+
+def _write_atomic(path, data):
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "w") as temporary_file:
+        json.dump(data, temporary_file, indent=1)
+        temporary_file.flush()
+        os.fsync(temporary_file.fileno())
+    os.replace(temporary_path, path)
+
+
+class Campaign:
+    """A named, resumable and extendable monte carlo campaign.
+
+    Opening an existing campaign id picks up where it stopped: `pending()`
+    lists the sample indices that still have to be flown, `extend(n)` (or
+    `require(total)`) adds samples without touching the finished ones.
+    Results go in through `record`, which checkpoints every
+    `checkpoint_every` samples; `close` writes a final checkpoint.
+    """
+
+    def __init__(
+        self,
+        campaign_id,
+        directory="monte_carlo_outputs",
+        analysis_parameters=None,
+        seed=None,
+        sampler="random",
+        schema=MONTE_CARLO_SCHEMA,
+        checkpoint_every=16,
+    ):
+        self.campaign_id = campaign_id
+        self.path = os.path.join(directory, campaign_id)
+        self.manifest_path = os.path.join(self.path, MANIFEST_FILE)
+        self.store_path = os.path.join(self.path, STORE_DIRECTORY)
+        self.failures_path = os.path.join(self.path, FAILURES_FILE)
+        self.checkpoint_every = checkpoint_every
+
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r") as manifest_file:
+                self.manifest = json.load(manifest_file)
+            if analysis_parameters is not None and self.manifest["analysis_parameters"] != _jsonable(analysis_parameters):
+                raise ValueError(
+                    f"Campaign {campaign_id} was started with different analysis parameters, "
+                    "use a new campaign id."
+                )
+            if self.manifest.get("sampler", "random") != sampler:
+                raise ValueError(
+                    f"Campaign {campaign_id} uses the {self.manifest.get('sampler', 'random')} sampler, "
+                    "use a new campaign id."
+                )
+        else:
+            os.makedirs(self.path, exist_ok=True)
+            self.manifest = {
+                "campaign_id": campaign_id,
+                "created": datetime.now().isoformat(timespec="seconds"),
+                "seed": int(np.random.SeedSequence().entropy if seed is None else seed),
+                "analysis_parameters": _jsonable(analysis_parameters or {}),
+                "sampler": sampler,
+                "total_number": 0,
+                "rows": 0,
+                "completed": [],
+            }
+            _write_atomic(self.manifest_path, self.manifest)
+
+        self.store = ResultStore(self.store_path, schema, buffer_size=checkpoint_every)
+        # rows past the last checkpoint are not trusted
+        self.store.truncate(min(self.manifest["rows"], len(self.store)))
+        self._uncommitted = 0
+        self._failures_file = None
+        self._attached = []
+
+    @property
+    def seed(self):
+        return self.manifest["seed"]
+
+    @property
+    def total_number(self):
+        return self.manifest["total_number"]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def extend(self, number):
+        """Appends `number` new samples to the campaign."""
+        self.manifest["total_number"] += number
+        _write_atomic(self.manifest_path, self.manifest)
+
+    def require(self, total_number):
+        """Grows the campaign to at least `total_number` samples."""
+        if total_number > self.total_number:
+            self.extend(total_number - self.total_number)
+
+    def completed(self):
+        """Set of the sample indices already stored."""
+        return {
+            index
+            for start, end in self.manifest["completed"]
+            for index in range(start, end)
+        }
+
+    def pending(self):
+        """Sample indices still to be run, in order."""
+        completed = self.completed()
+        return [index for index in range(self.total_number) if index not in completed]
+
+    def settings(self, analysis_parameters, indices):
+        sampler = make_sampler(self.manifest.get("sampler", "random"), analysis_parameters, self.seed)
+        return sampler.settings(indices)
+
+    def attach(self, output):
+        """Flushes `output` (e.g. a TrajectoryArchive) with sync=True on every checkpoint."""
+        self._attached.append(output)
+        return output
+
+    def record(self, row):
+        """Stores the result row of one sample (must contain its "index")."""
+        self.store.append(row)
+        _add_to_ranges(self.manifest["completed"], int(row["index"]))
+        self._uncommitted += 1
+        if self._uncommitted >= self.checkpoint_every:
+            self.checkpoint()
+
+    def record_failure(self, index, failure):
+        """Logs the failure entry of a sample, call it before `record`."""
+        if self._failures_file is None:
+            self._failures_file = open(self.failures_path, "a")
+        self._failures_file.write(json.dumps({"index": int(index), **_jsonable(failure)}) + "\n")
+
+    def failures(self):
+        """Failure entries of the stored samples, by sample index."""
+        if not os.path.exists(self.failures_path):
+            return {}
+        completed = self.completed()
+        failures = {}
+        with open(self.failures_path, "r") as failures_file:
+            for line in failures_file:
+                try:
+                    failure = json.loads(line)
+                except json.JSONDecodeError:
+                    # last line of a crashed run
+                    continue
+                # samples cut off after a crash are re-run and logged again
+                if failure["index"] in completed:
+                    failures[failure["index"]] = failure
+        return failures
+
+    def checkpoint(self):
+        # data first, then the manifest that points at it
+        for output in self._attached:
+            output.flush(sync=True)
+        self.store.flush(sync=True)
+        if self._failures_file is not None:
+            self._failures_file.flush()
+            os.fsync(self._failures_file.fileno())
+        self.manifest["rows"] = len(self.store)
+        _write_atomic(self.manifest_path, self.manifest)
+        self._uncommitted = 0
+
+    def close(self):
+        self.checkpoint()
+        if self._failures_file is not None:
+            self._failures_file.close()
+            self._failures_file = None
+
+
+def _add_to_ranges(ranges, index):
+    # completed indices are kept as sorted [start, end) ranges, samples come
+    # back in order so this nearly always just extends the last range
+    if ranges and ranges[-1][1] == index:
+        ranges[-1][1] += 1
+        return
+    ranges.append([index, index + 1])
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        if start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    ranges[:] = merged
+
+
+def _jsonable(analysis_parameters):
+    # tuples become lists in json, compare like with like
+    return json.loads(json.dumps(analysis_parameters))
@@ -0,0 +1,105 @@
+# clean drag curves for the rocket's power on and power off drag
+#
+# nimbus_Cd.csv is the Cd recorded along a flight: mach goes up to 0.86 and
+# back down, so its 3372 rows repeat most mach numbers, often with Cd values
+# a rounding step apart, and are not sorted. rocketpy interpolates the curve
+# at every evaluation of the equations of motion and expects increasing mach
+# numbers. a drag table is read here once, sorted, duplicate mach numbers are
+# merged into their mean Cd, and the rows linear interpolation can do without
+# (within a Cd tolerance) are dropped; the twenty or so rows left are checked and
+# cached as .npy under the sha1 of the csv, so later runs and every worker
+# skip the csv entirely.
+
+import hashlib
+import os
+
+import numpy as np
+
+from trajectory_archive import decimate
+
+DRAG_CACHE_DIRECTORY = "drag_cache"
+
+# largest Cd change simplifying may cause, the csv has three decimals
+DRAG_TOLERANCE = 1e-3
+
+# tables already loaded in this process, (sha1, tolerance) -> table
+_loaded = {}
+
+
+def read_drag_table(path):
+    """Raw (mach, Cd) rows of a csv, a header line is skipped."""
+    with open(path, "r") as csv_file:
+        first_line = csv_file.readline()
+    skip = 0 if first_line.strip()[:1].isdigit() or first_line.strip()[:1] in "-." else 1
+    return np.loadtxt(path, delimiter=",", skiprows=skip, ndmin=2)[:, :2]
+
+
+def merge_duplicates(table):
+    """Table sorted by mach with one row (the mean Cd) per mach number."""
+    mach, inverse, counts = np.unique(table[:, 0], return_inverse=True, return_counts=True)
+    drag = np.bincount(inverse, weights=table[:, 1]) / counts
+    return np.column_stack((mach, drag))
+
+
+def simplify(table, tolerance=DRAG_TOLERANCE):
+    """Fewest rows whose linear interpolation stays within `tolerance` of every Cd."""
+    return decimate(table, ["mach", "cd"], {"cd": tolerance})
+
+
+def validate_drag_table(table, source="drag table"):
+    table = np.asarray(table, dtype=float)
+    if table.ndim != 2 or table.shape[1] != 2 or len(table) < 2:
+        raise ValueError(f"{source}: needs at least two (mach, Cd) rows, got shape {table.shape}.")
+    if not np.isfinite(table).all():
+        raise ValueError(f"{source}: contains NaN or infinite values.")
+    if np.any(np.diff(table[:, 0]) <= 0):
+        raise ValueError(f"{source}: mach numbers are not strictly increasing.")
+    if table[0, 0] < 0:
+        raise ValueError(f"{source}: negative mach number {table[0, 0]}.")
+    if np.any(table[:, 1] <= 0) or np.any(table[:, 1] > 5):
+        raise ValueError(f"{source}: Cd outside (0, 5], check the columns are mach, Cd.")
+    return table
+
+
+def clean_drag_table(table, tolerance=DRAG_TOLERANCE, source="drag table"):
+    """Sorted, deduplicated, simplified and validated copy of a (mach, Cd) table."""
+    table = np.asarray(table, dtype=float)
+    table = table[np.isfinite(table).all(axis=1)]
+    merged = merge_duplicates(table)
+    cleaned = simplify(merged, tolerance) if tolerance > 0 else merged
+    validate_drag_table(cleaned, source)
+    # the simplification bound, checked on the merged table
+    error = np.max(np.abs(np.interp(merged[:, 0], cleaned[:, 0], cleaned[:, 1]) - merged[:, 1]))
+    if error > tolerance * (1 + 1e-9):
+        raise ValueError(f"{source}: simplified curve is {error:0.2e} off, more than the tolerance {tolerance}.")
+    return cleaned
+
+
+def drag_curve(path, tolerance=DRAG_TOLERANCE, cache_directory=DRAG_CACHE_DIRECTORY):
+    """Clean (mach, Cd) array of the csv at `path`, for power_off_drag/power_on_drag.
+
+    The result is cached in `cache_directory` (None disables the cache) under
+    the hash of the file's content and the tolerance, so an edited csv is
+    cleaned again.
+    """
+    with open(path, "rb") as csv_file:
+        digest = hashlib.sha1(csv_file.read()).hexdigest()
+    key = (digest, float(tolerance))
+    if key in _loaded:
+        return _loaded[key].copy()
+
+    cache_path = None
+    if cache_directory is not None:
+        cache_path = os.path.join(cache_directory, f"{digest}_{tolerance:g}.npy")
+        if os.path.exists(cache_path):
+            _loaded[key] = validate_drag_table(np.load(cache_path), cache_path)
+            return _loaded[key].copy()
+
+    table = clean_drag_table(read_drag_table(path), tolerance, path)
+    if cache_path is not None:
+        os.makedirs(cache_directory, exist_ok=True)
+        temporary_path = cache_path + ".tmp.npy"
+        np.save(temporary_path, table)
+        os.replace(temporary_path, cache_path)
+    _loaded[key] = table
+    return table.copy()
@@ -0,0 +1,344 @@
+# batch comparison of RocketPy flights and OpenRocket exports
+#
+# validating the nimbus model meant CompareFlights for the RocketPy side and
+# OpenRocketPlotter.m for the OpenRocket side, compared by eye. here every
+# flight, whichever tool it comes from, becomes a Track: its times, the
+# compared quantities (altitude above the pad, vertical velocity, stability
+# margin, mach and drag) and its burnout and apogee times. all tracks are
+# then resampled together onto one grid, either time or altitude (the ascent
+# or the descent, where altitude is monotonic), with a single searchsorted:
+# the tracks are laid end to end on one axis, each shifted past the previous
+# one. the errors of every (reference, track) pair follow from one broadcast
+# difference, reduced per quantity and per flight phase (powered, coast,
+# descent, by the reference's burnout and apogee).
+#
+#   python flight_comparison.py "../OpenRocket/OpenRocket Sims/"*.csv
+#   python flight_comparison.py "../OpenRocket/OpenRocket Sims/"*.csv --nimbus --axis altitude -o comparison.csv
+#   python flight_comparison.py "../OpenRocket/OpenRocket Sims/"*.csv --nimbus --atmosphere nimbus_atmosphere.npz
+
+import argparse
+import csv
+import os
+from collections import namedtuple
+
+import numpy as np
+
+from openrocket_csv import load_openrocket
+
+COMPARED_QUANTITIES = ["altitude", "vertical_velocity", "stability_margin", "mach", "drag"]
+PHASES = ["powered", "coast", "descent"]
+
+# OpenRocketPlotter.m column of each quantity; OpenRocket's default units
+# (m, m/s, calibers, N) are already the RocketPy ones
+OPENROCKET_QUANTITIES = {
+    "altitude": "altitude",
+    "vertical_velocity": "vert_vel",
+    "stability_margin": "stability_margin",
+    "mach": "mach",
+    "drag": "drag",
+}
+
+Track = namedtuple("Track", ["name", "time", "values", "burnout_time", "apogee_time"])
+ErrorMetrics = namedtuple("ErrorMetrics", ["rmse", "max_error", "bias", "samples"])
+
+
+def _sampled(function, times):
+    # a rocketpy Function at `times`, from its table when it has one
+    source = function.source if hasattr(function, "source") else None
+    if isinstance(source, np.ndarray) and source.ndim == 2:
+        return np.interp(times, source[:, 0], source[:, 1])
+    return np.array([function.get_value(time) for time in times], dtype=float)
+
+
+def rocketpy_track(flight, name=None, quantities=COMPARED_QUANTITIES):
+    """Track of a RocketPy Flight; drag is the costly quantity, leave it out if unused."""
+    solution = np.asarray(flight.solution, dtype=float)
+    time = solution[:, 0]
+    values = {}
+    # altitude always, the phases and the altitude axis need it
+    for quantity in dict.fromkeys(["altitude", *quantities]):
+        if quantity == "altitude":
+            values[quantity] = solution[:, 3] - flight.env.elevation
+        elif quantity == "vertical_velocity":
+            values[quantity] = solution[:, 6]
+        elif quantity == "stability_margin":
+            values[quantity] = _sampled(flight.rocket.static_margin, time)
+        elif quantity == "mach":
+            values[quantity] = _sampled(flight.mach_number, time)
+        elif quantity == "drag":
+            values[quantity] = _sampled(flight.aerodynamic_drag, time)
+        else:
+            raise ValueError(f"Unknown quantity {quantity}, choose from {COMPARED_QUANTITIES}.")
+    return Track(name or flight.name, time, values, float(flight.rocket.motor.burn_out_time), float(flight.apogee_time))
+
+
+def openrocket_track(export, name=None, quantities=COMPARED_QUANTITIES):
+    """Track of an OpenRocket export (a path or an OpenRocketExport)."""
+    if isinstance(export, (str, os.PathLike)):
+        export = load_openrocket(export)
+    time = np.asarray(export["time"], dtype=float)
+    nan = np.full(len(time), np.nan)
+    values = {
+        quantity: np.asarray(export.get(OPENROCKET_QUANTITIES[quantity], nan), dtype=float)
+        for quantity in dict.fromkeys(["altitude", *quantities])
+    }
+
+    # the event comments when exported, otherwise from the data
+    burnout_time = export.events.get("burnout")
+    if burnout_time is None and "thrust" in export:
+        burning = np.flatnonzero(np.asarray(export["thrust"]) > 0)
+        burnout_time = float(time[burning[-1]]) if len(burning) else 0.0
+    apogee_time = export.events.get("apogee")
+    if apogee_time is None:
+        apogee_time = float(time[np.nanargmax(export["altitude"])])
+    return Track(
+        name or os.path.splitext(os.path.basename(export.path))[0],
+        time,
+        values,
+        float(burnout_time or 0.0),
+        float(apogee_time),
+    )
+
+
+def _branch(track, axis, branch, quantities):
+    # (x, quantities x samples) of the part of a track resampled along `axis`,
+    # x non-decreasing
+    values = np.array([track.values[quantity] for quantity in quantities], dtype=float).reshape(len(quantities), -1)
+    if axis == "time":
+        return track.time, values
+    if axis != "altitude":
+        raise ValueError(f"Unknown axis {axis}, use 'time' or 'altitude'.")
+    altitude = track.values["altitude"]
+    if branch == "ascent":
+        rows = track.time <= track.apogee_time
+        # the wobble on the pad is flattened, altitude must only grow
+        return np.maximum.accumulate(altitude[rows]), values[:, rows]
+    if branch == "descent":
+        rows = track.time >= track.apogee_time
+        # falling, so the axis is the height dropped below the apogee
+        return np.maximum.accumulate(-altitude[rows]), values[:, rows]
+    raise ValueError(f"Unknown branch {branch}, use 'ascent' or 'descent'.")
+
+
+def _batch_interp(xs, ys, grid):
+    # linear interpolation of every track on `grid` at once; NaN outside a
+    # track. xs: non-decreasing arrays, ys: (quantities x len(x)) arrays;
+    # returns (quantities x tracks x len(grid))
+    lengths = np.array([len(x) for x in xs])
+    if np.any(lengths < 2):
+        raise ValueError("Every track needs at least two samples to be resampled.")
+    low = min(grid.min(), *(x[0] for x in xs))
+    high = max(grid.max(), *(x[-1] for x in xs))
+    width = high - low + 1.0
+    shift = np.arange(len(xs)) * width
+    x = np.concatenate([x - low + s for x, s in zip(xs, shift)])
+    y = np.concatenate(ys, axis=1)
+
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    queries = grid[None, :] - low + shift[:, None]
+    index = np.searchsorted(x, queries, side="right") - 1
+    index = np.clip(index, starts[:, None], (starts + lengths - 2)[:, None])
+    x0, x1 = x[index], x[index + 1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fraction = np.where(x1 > x0, (queries - x0) / (x1 - x0), 0.0)
+    result = y[:, index] + fraction * (y[:, index + 1] - y[:, index])
+    first = np.array([x[0] for x in xs])[:, None]
+    last = np.array([x[-1] for x in xs])[:, None]
+    return np.where((grid[None, :] < first) | (grid[None, :] > last), np.nan, result)
+
+
+def resample(tracks, grid, axis="time", branch="ascent", quantities=COMPARED_QUANTITIES):
+    """Dict of quantity -> (tracks x len(grid)) array of every track on `grid`.
+
+    With axis "altitude" the grid is the altitude above the pad (m) along
+    the ascent or, with branch "descent", along the descent.
+    """
+    grid = np.asarray(grid, dtype=float)
+    branches = [_branch(track, axis, branch, quantities) for track in tracks]
+    x_grid = -grid if axis == "altitude" and branch == "descent" else grid
+    order = np.argsort(x_grid)
+    values = np.empty((len(quantities), len(tracks), len(grid)))
+    values[:, :, order] = _batch_interp([x for x, _ in branches], [y for _, y in branches], x_grid[order])
+    return dict(zip(quantities, values))
+
+
+def _phases(tracks, grid, axis, branch):
+    # PHASES index of every grid point for every track
+    if axis == "altitude":
+        if branch == "descent":
+            return np.full((len(tracks), len(grid)), PHASES.index("descent"))
+        burnout_altitude = np.array(
+            [np.interp(track.burnout_time, track.time, track.values["altitude"]) for track in tracks]
+        )
+        return np.where(grid[None, :] <= burnout_altitude[:, None], PHASES.index("powered"), PHASES.index("coast"))
+    burnout_time = np.array([track.burnout_time for track in tracks])[:, None]
+    apogee_time = np.array([track.apogee_time for track in tracks])[:, None]
+    return np.where(
+        grid[None, :] <= burnout_time,
+        PHASES.index("powered"),
+        np.where(grid[None, :] <= apogee_time, PHASES.index("coast"), PHASES.index("descent")),
+    )
+
+
+def default_grid(tracks, axis="time", branch="ascent", step=None):
+    """Time grid (every 0.05 s) up to the longest track, or altitude grid (every 5 m) up to the highest apogee."""
+    if axis == "time":
+        return np.arange(0.0, max(track.time[-1] for track in tracks) + 1e-9, step or 0.05)
+    top = max(np.nanmax(track.values["altitude"]) for track in tracks)
+    grid = np.arange(0.0, top + 1e-9, step or 5.0)
+    return grid[::-1] if branch == "descent" else grid
+
+
+class Comparison:
+    """Tracks resampled on one grid, with the errors of every (reference, track) pair.
+
+    `values[quantity]` is (tracks x grid), `phases` the PHASES index of every
+    grid point per track. `errors[quantity, phase]` is an ErrorMetrics of
+    (references x tracks) arrays: rmse, largest absolute error and mean of
+    track minus reference over the grid points of that phase of the
+    reference where both have a value, and the number of those points.
+    """
+
+    def __init__(self, tracks, grid, axis, branch, quantities, references):
+        self.names = [track.name for track in tracks]
+        self.grid = grid
+        self.axis = axis
+        self.branch = branch
+        self.references = list(references)
+        self.values = resample(tracks, grid, axis, branch, quantities)
+        self.phases = _phases(tracks, grid, axis, branch)
+
+        reference_phases = self.phases[self.references]
+        self.errors = {}
+        for quantity, values in self.values.items():
+            # (references x tracks x grid)
+            difference = values[None, :, :] - values[self.references][:, None, :]
+            valid = np.isfinite(difference)
+            for number, phase in enumerate(PHASES):
+                mask = valid & (reference_phases == number)[:, None, :]
+                samples = mask.sum(axis=2)
+                masked = np.where(mask, difference, 0.0)
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    rmse = np.sqrt(np.sum(masked**2, axis=2) / samples)
+                    bias = np.sum(masked, axis=2) / samples
+                max_error = np.where(samples > 0, np.max(np.abs(masked), axis=2), np.nan)
+                self.errors[quantity, phase] = ErrorMetrics(rmse, max_error, bias, samples)
+
+    def rows(self):
+        """One dict per reference, other track, quantity and phase with samples."""
+        rows = []
+        for (quantity, phase), metrics in self.errors.items():
+            for row, reference in enumerate(self.references):
+                for track, name in enumerate(self.names):
+                    if track == reference or metrics.samples[row, track] == 0:
+                        continue
+                    rows.append(
+                        {
+                            "reference": self.names[reference],
+                            "track": name,
+                            "quantity": quantity,
+                            "phase": phase,
+                            "rmse": float(metrics.rmse[row, track]),
+                            "max_error": float(metrics.max_error[row, track]),
+                            "bias": float(metrics.bias[row, track]),
+                            "samples": int(metrics.samples[row, track]),
+                        }
+                    )
+        return rows
+
+    def to_csv(self, path):
+        rows = self.rows()
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "w", newline="") as csv_file:
+            writer = csv.DictWriter(
+                csv_file, ["reference", "track", "quantity", "phase", "rmse", "max_error", "bias", "samples"]
+            )
+            writer.writeheader()
+            writer.writerows(rows)
+        os.replace(temporary_path, path)
+        return path
+
+
+def compare_tracks(tracks, grid=None, axis="time", branch="ascent", quantities=COMPARED_QUANTITIES, references=None):
+    """Comparison of `tracks` on `grid` (default_grid if None).
+
+    `references` are the indices of the tracks the others are measured
+    against, all of them by default (every pair, both ways).
+    """
+    tracks = list(tracks)
+    grid = default_grid(tracks, axis, branch) if grid is None else np.asarray(grid, dtype=float)
+    references = range(len(tracks)) if references is None else references
+    return Comparison(tracks, grid, axis, branch, list(quantities), references)
+
+
+def compare_flights(flights=(), exports=(), **comparison_arguments):
+    """Comparison of RocketPy Flights and OpenRocket exports (paths or OpenRocketExport).
+
+    The exports come first, so with references=range(len(exports)) every
+    flight is measured against every OpenRocket export.
+    """
+    quantities = comparison_arguments.get("quantities", COMPARED_QUANTITIES)
+    tracks = [openrocket_track(export, quantities=quantities) for export in exports]
+    tracks += [rocketpy_track(flight, quantities=quantities) for flight in flights]
+    return compare_tracks(tracks, **comparison_arguments)
+
+
+def _nimbus_flight(atmosphere_file=None):
+    # the nimbus model at the launch site, in a saved forecast column (see
+    # atmosphere_cache) or else the standard atmosphere, like OpenRocket's
+    from rocketpy import Environment, Flight
+
+    from atmosphere_cache import load_atmosphere
+    from nimbus_template import RocketTemplate, build_motor
+
+    environment = Environment(latitude=39.232292, longitude=-8.172027, elevation=160)
+    if atmosphere_file is None:
+        environment.set_atmospheric_model(type="standard_atmosphere")
+    else:
+        load_atmosphere(environment, atmosphere_file)
+    return Flight(
+        rocket=RocketTemplate.nimbus(build_motor()).perturb(),
+        environment=environment,
+        rail_length=12,
+        inclination=84,
+        heading=133,
+        name="rocketpy nimbus",
+    )
+
+
+if __name__ == "__main__":
+    from time import perf_counter
+
+    parser = argparse.ArgumentParser(description="Error metrics between OpenRocket exports and RocketPy flights.")
+    parser.add_argument("exports", nargs="*", help="OpenRocket csv exports")
+    parser.add_argument("--nimbus", action="store_true", help="also fly the RocketPy nimbus model and compare it")
+    parser.add_argument(
+        "--atmosphere",
+        default=None,
+        help="atmosphere profile (.npz or .csv, see atmosphere_cache) for --nimbus, default the standard atmosphere",
+    )
+    parser.add_argument("--axis", choices=["time", "altitude"], default="time")
+    parser.add_argument("--branch", choices=["ascent", "descent"], default="ascent", help="with --axis altitude")
+    parser.add_argument("-o", "--output", default=None, help="csv to write the metrics to")
+    arguments = parser.parse_args()
+
+    flights = []
+    if arguments.nimbus:
+        flights.append(_nimbus_flight(arguments.atmosphere))
+    references = range(len(arguments.exports)) if flights else None
+
+    start_time = perf_counter()
+    comparison = compare_flights(
+        flights, arguments.exports, axis=arguments.axis, branch=arguments.branch, references=references
+    )
+    print(
+        f"{len(comparison.names)} tracks on {len(comparison.grid)} {arguments.axis} points "
+        f"compared in {(perf_counter() - start_time) * 1e3:0.0f} ms"
+    )
+    for row in comparison.rows():
+        print(
+            f"{row['track']:>28} vs {row['reference']:<28} {row['quantity']:>17} {row['phase']:>8}: "
+            f"rmse {row['rmse']:10.3f}  max {row['max_error']:10.3f}  bias {row['bias']:10.3f}"
+        )
+    if arguments.output:
+        print(f"metrics written to {comparison.to_csv(arguments.output)}")
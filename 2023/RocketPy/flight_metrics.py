@@ -0,0 +1,225 @@
+# summary metrics of a single flight
+#
+# the state history in Flight.solution ([t, x, y, z, vx, vy, vz, e0, e1, e2,
+# e3, w1, w2, w3] per row) is turned into numpy arrays once; speed, mach,
+# acceleration and dynamic pressure are then computed for every row in one
+# vectorized pass, and each metric is a cheap reduction over those arrays.
+#
+# new metrics are added to the registry with the @metric decorator, the
+# monte carlo result schema (result_store.OUTPUT_COLUMNS) follows it.
+
+from collections import namedtuple
+
+import numpy as np
+
+Metric = namedtuple("Metric", ["name", "function", "dtype"])
+
+# name -> Metric, in export order
+METRICS = {}
+
+# altitude resolution used to evaluate the atmosphere along the trajectory
+ATMOSPHERE_GRID_POINTS = 256
+
+
+def metric(name, dtype="<f8"):
+    """Registers `function(arrays)` as the flight metric `name`."""
+
+    def register(function):
+        METRICS[name] = Metric(name, function, dtype)
+        return function
+
+    return register
+
+
+def _profile(function, z):
+    # atmosphere Functions are often python callables that only take scalars,
+    # so sample them on a small altitude grid and interpolate along the path
+    grid = np.linspace(z.min(), z.max(), ATMOSPHERE_GRID_POINTS)
+    values = np.array([function.get_value(height) for height in grid])
+    return np.interp(z, grid, values)
+
+
+class FlightArrays:
+    """Per-row arrays of a flight, computed once and shared by all metrics."""
+
+    def __init__(self, flight):
+        self.flight = flight
+        self.env = flight.env
+
+        solution = np.asarray(flight.solution, dtype=float)
+        self.t = solution[:, 0]
+        self.z = solution[:, 3]
+        self.velocity = solution[:, 4:7]
+        self.speed = np.sqrt(np.einsum("ij,ij->i", self.velocity, self.velocity))
+
+        # free stream velocity relative to the wind
+        wind = np.zeros_like(self.velocity)
+        wind[:, 0] = _profile(self.env.wind_velocity_x, self.z)
+        wind[:, 1] = _profile(self.env.wind_velocity_y, self.z)
+        air_velocity = self.velocity - wind
+        self.air_speed = np.sqrt(np.einsum("ij,ij->i", air_velocity, air_velocity))
+        self.mach = self.air_speed / _profile(self.env.speed_of_sound, self.z)
+        self.dynamic_pressure = 0.5 * _profile(self.env.density, self.z) * self.air_speed**2
+
+        # rows at the same instant (phase changes) carry no acceleration info
+        dt = np.diff(self.t)
+        valid = dt > 0
+        dv = np.diff(self.velocity, axis=0)[valid]
+        self.acceleration = np.sqrt(np.einsum("ij,ij->i", dv, dv)) / dt[valid]
+
+    def at(self, time, values):
+        """`values` (one per row) linearly interpolated at `time`."""
+        return float(np.interp(time, self.t, values))
+
+    def parachute_event(self, name, fallback_position):
+        # events are [trigger time, Parachute]; find by name, and by order
+        # only when the rocket has no parachute of that name at all
+        events = self.flight.parachute_events
+        for event in events:
+            if event[1].name.lower() == name:
+                return event
+        if any(parachute.name.lower() == name for parachute in self.flight.rocket.parachutes):
+            return None
+        return events[fallback_position] if len(events) > fallback_position else None
+
+
+def extract_metrics(flight, metrics=None):
+    """Dict of every registered metric (or only `metrics`) for one flight."""
+    arrays = FlightArrays(flight)
+    names = METRICS if metrics is None else metrics
+    return {name: METRICS[name].function(arrays) for name in names}
+
+
+@metric("outOfRailTime")
+def out_of_rail_time(a):
+    return a.flight.out_of_rail_time
+
+
+@metric("outOfRailVelocity")
+def out_of_rail_velocity(a):
+    return a.flight.out_of_rail_velocity
+
+
+@metric("apogeeTime")
+def apogee_time(a):
+    return a.flight.apogee_time
+
+
+@metric("apogeeAltitude")
+def apogee_altitude(a):
+    return a.flight.apogee - a.env.elevation
+
+
+@metric("apogeeX")
+def apogee_x(a):
+    return a.flight.apogee_x
+
+
+@metric("apogeeY")
+def apogee_y(a):
+    return a.flight.apogee_y
+
+
+@metric("impactX")
+def impact_x(a):
+    return a.flight.x_impact
+
+
+@metric("impactY")
+def impact_y(a):
+    return a.flight.y_impact
+
+
+@metric("impactVelocity")
+def impact_velocity(a):
+    return a.flight.impact_velocity
+
+
+@metric("initialStaticMargin")
+def initial_static_margin(a):
+    return a.flight.rocket.static_margin(0)
+
+
+@metric("outOfRailStaticMargin")
+def out_of_rail_static_margin(a):
+    return a.flight.rocket.static_margin(a.flight.out_of_rail_time)
+
+
+@metric("finalStaticMargin")
+def final_static_margin(a):
+    return a.flight.rocket.static_margin(a.flight.rocket.motor.burn_out_time)
+
+
+@metric("numberOfEvents", "<i4")
+def number_of_events(a):
+    return len(a.flight.parachute_events)
+
+
+@metric("maxVelocity")
+def max_velocity(a):
+    return float(np.max(a.speed))
+
+
+@metric("maxMach")
+def max_mach(a):
+    return float(np.max(a.mach))
+
+
+@metric("maxAcceleration")
+def max_acceleration(a):
+    return float(np.max(a.acceleration)) if len(a.acceleration) else 0.0
+
+
+@metric("maxDynamicPressure")
+def max_dynamic_pressure(a):
+    return float(np.max(a.dynamic_pressure))
+
+
+def _trigger_time(a, name, position):
+    event = a.parachute_event(name, position)
+    return event[0] if event is not None else 0
+
+
+def _inflated_time(a, name, position):
+    event = a.parachute_event(name, position)
+    return event[0] + event[1].lag if event is not None else 0
+
+
+def _inflated_state(a, name, position, values):
+    event = a.parachute_event(name, position)
+    return a.at(event[0] + event[1].lag, values) if event is not None else 0
+
+
+@metric("drogueTriggerTime")
+def drogue_trigger_time(a):
+    return _trigger_time(a, "drogue", 0)
+
+
+@metric("drogueInflatedTime")
+def drogue_inflated_time(a):
+    return _inflated_time(a, "drogue", 0)
+
+
+@metric("drogueInflatedVelocity")
+def drogue_inflated_velocity(a):
+    return _inflated_state(a, "drogue", 0, a.speed)
+
+
+@metric("mainTriggerTime")
+def main_trigger_time(a):
+    return _trigger_time(a, "main", 1)
+
+
+@metric("mainInflatedTime")
+def main_inflated_time(a):
+    return _inflated_time(a, "main", 1)
+
+
+@metric("mainInflatedVelocity")
+def main_inflated_velocity(a):
+    return _inflated_state(a, "main", 1, a.speed)
+
+
+@metric("mainInflatedAltitude")
+def main_inflated_altitude(a):
+    return _inflated_state(a, "main", 1, a.z - a.env.elevation)
@@ -0,0 +1,179 @@
+# staged flights: one ascent, any number of branches from its end state
+#
+# nimbus.py flies the ascent to apogee and then the booster descent and the
+# marge payload one after the other, each starting from the ascent. the
+# branches do not depend on each other, so FlightPipeline flies the ascent
+# once and hands its end state to a process pool where all branches run at
+# the same time: the mission takes the ascent plus the slowest branch instead
+# of the sum of all of them.
+#
+# rocketpy Flights cannot be pickled, so branches flown in worker processes
+# come back as a BranchResult (solution array and a small summary); with
+# workers=1 everything runs in this process and the Flight objects are kept,
+# e.g. for CompareFlights.
+
+import datetime
+import os
+from collections import namedtuple
+
+import numpy as np
+from rocketpy import Environment, Flight
+
+from atmosphere_cache import AtmosphereCache, load_atmosphere
+from monte_carlo_engine import run_monte_carlo
+from nimbus_template import MARGE_MASS, RocketTemplate, build_descent_rocket, build_marge, build_motor
+
+# `build_rocket(*build_args)` must be a module level function, it is called
+# in the worker that flies the branch
+Branch = namedtuple("Branch", ["name", "build_rocket", "build_args", "flight_arguments"])
+# `flight` is only set for branches flown in this process, `error` is the
+# failure entry of a branch that raised (see monte_carlo_engine)
+BranchResult = namedtuple("BranchResult", ["name", "solution", "summary", "flight", "error"])
+MissionResult = namedtuple("MissionResult", ["ascent", "branches"])
+
+
+def environment_from_file(latitude, longitude, elevation, date, atmosphere_file):
+    """Environment with its atmosphere from a local profile, for the workers."""
+    env = Environment(latitude=latitude, longitude=longitude, elevation=elevation)
+    env.set_date(date)
+    return load_atmosphere(env, atmosphere_file)
+
+
+def fly_branch(env, branch, initial_solution):
+    # rail and launch angles are not used when starting from a state
+    arguments = {"rail_length": 1, "inclination": 90, "heading": 0, **branch.flight_arguments}
+    return Flight(
+        rocket=branch.build_rocket(*branch.build_args),
+        environment=env,
+        initial_solution=initial_solution,
+        name=branch.name,
+        **arguments,
+    )
+
+
+def branch_summary(flight):
+    last = flight.solution[-1]
+    return {
+        "endTime": last[0],
+        "impactX": last[1],
+        "impactY": last[2],
+        "impactVelocity": last[6],
+        "parachuteEvents": [(parachute.name, time) for time, parachute in flight.parachute_events],
+    }
+
+
+def _branch_result(flight, branch, keep_flight):
+    return BranchResult(
+        branch.name,
+        np.asarray(flight.solution, dtype=float),
+        branch_summary(flight),
+        flight if keep_flight else None,
+        None,
+    )
+
+
+def _simulate_branch(env, setting):
+    branch, initial_solution = setting
+    return _branch_result(fly_branch(env, branch, initial_solution), branch, False)
+
+
+class FlightPipeline:
+    """An ascent and the branch flights that fork from its end state.
+
+    `setup_environment(*setup_args)` builds the environment, once here for
+    the ascent and once in every worker; it must be a module level function
+    (see environment_from_file). `run` flies the ascent and then all the
+    branches in parallel.
+    """
+
+    def __init__(self, setup_environment, setup_args=()):
+        self.setup_environment = setup_environment
+        self.setup_args = setup_args
+        self.ascent_rocket = None
+        self.ascent_arguments = {}
+        self.branches = []
+
+    def ascent(self, rocket, **flight_arguments):
+        """Rocket and Flight arguments of the ascent, flown to apogee by default."""
+        self.ascent_rocket = rocket
+        self.ascent_arguments = {"terminate_on_apogee": True, **flight_arguments}
+        return self
+
+    def branch(self, name, build_rocket, build_args=(), **flight_arguments):
+        """Adds a branch flown from the end of the ascent by `build_rocket(*build_args)`."""
+        if any(branch.name == name for branch in self.branches):
+            raise ValueError(f"There already is a branch called {name}.")
+        self.branches.append(Branch(name, build_rocket, build_args, flight_arguments))
+        return self
+
+    def run(self, workers=None):
+        if self.ascent_rocket is None:
+            raise ValueError("Declare the ascent before running the pipeline.")
+
+        env = self.setup_environment(*self.setup_args)
+        ascent = Flight(rocket=self.ascent_rocket, environment=env, **self.ascent_arguments)
+        # the end state is all the branches need from the ascent
+        initial_solution = [float(value) for value in ascent.solution[-1]]
+
+        workers = min(workers or os.cpu_count() or 1, max(len(self.branches), 1))
+        results = {}
+        if workers == 1:
+            for branch in self.branches:
+                results[branch.name] = _branch_result(fly_branch(env, branch, initial_solution), branch, True)
+        else:
+            for sample in run_monte_carlo(
+                self.setup_environment,
+                _simulate_branch,
+                [(branch, initial_solution) for branch in self.branches],
+                len(self.branches),
+                workers=workers,
+                setup_args=self.setup_args,
+                max_chunk=1,
+            ):
+                branch = sample.setting[0]
+                results[branch.name] = sample.result or BranchResult(branch.name, None, None, None, sample.error)
+        return MissionResult(ascent, results)
+
+
+if __name__ == "__main__":
+    from time import perf_counter
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+    atmosphere_file = None # local profile csv/npz standing in for the forecast, None uses the cached GFS forecast
+    workers = None # None flies every branch in its own process, 1 keeps the Flight objects
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    # lat and long are for euroc
+    site = dict(latitude = 39.232292, longitude = -008.172027, elevation = 160)
+    launch_day = datetime.date.today() + datetime.timedelta(days = 1)
+    date = (launch_day.year, launch_day.month, launch_day.day, 14) # Hour given in UTC time
+
+    if atmosphere_file is None:
+        Env = Environment(**site)
+        Env.set_date(date)
+        atmosphere_file = AtmosphereCache().profile(Env)
+
+    NimbusAscent = RocketTemplate.nimbus(build_motor()).rocket
+
+    pipeline = (
+        FlightPipeline(environment_from_file, (*site.values(), date, atmosphere_file))
+        .ascent(NimbusAscent, rail_length = 12, inclination = 84, heading = 133, name = "Nimbus Ascent Trajectory")
+        .branch("Nimbus Descent Trajectory", build_descent_rocket)
+        .branch("Payload Flight", build_marge, (MARGE_MASS,))
+        .branch("Nimbus Chute Failure", build_descent_rocket, (50.2 - MARGE_MASS, ()))
+    )
+
+    start_time = perf_counter()
+    mission = pipeline.run(workers)
+    print(f"Mission flown in {perf_counter() - start_time:0.1f} s")
+
+    print(f"{'Nimbus Ascent Trajectory':>28s} - apogee: {mission.ascent.apogee - mission.ascent.env.elevation:0.1f} m AGL at t = {mission.ascent.apogee_time:0.2f} s")
+    for name, branch in mission.branches.items():
+        if branch.error is not None:
+            print(f"{name:>28s} - failed: {branch.error}")
+            continue
+        summary = branch.summary
+        print(
+            f"{name:>28s} - landed at t = {summary['endTime']:0.1f} s, "
+            f"({summary['impactX']:0.1f}, {summary['impactY']:0.1f}) m, {summary['impactVelocity']:0.1f} m/s"
+        )
@@ -0,0 +1,124 @@
+# apogee snapshots for descent-only simulations
+#
+# tuning the recovery (main lag, cd_s, the 450 m trigger) only changes the
+# descent, yet nimbus.py flies the powered ascent again every time. a
+# snapshot keeps what a descent needs from the ascent in a small .npz: the
+# state [t, x, y, z, vx, vy, vz, e0, e1, e2, e3, w1, w2, w3] at apogee (or at
+# the end of the flight), the rocket's mass properties at that instant and
+# the environment (launch site, date and atmosphere column), so descents can
+# start from it in a later session or on another machine. one file can hold
+# any number of states, e.g. the apogees of a dispersed campaign, as a
+# library for recovery studies; they share the environment of the first.
+
+import os
+from datetime import datetime
+
+import numpy as np
+from rocketpy import Environment, Flight
+
+from atmosphere_cache import PROFILE_COLUMNS, atmosphere_profile, set_atmosphere
+
+STATE_COLUMNS = ["t", "x", "y", "z", "vx", "vy", "vz", "e0", "e1", "e2", "e3", "w1", "w2", "w3"]
+MASS_COLUMNS = ["totalMass", "centerOfMass", "I_11", "I_22", "I_33"]
+
+
+def flight_state(flight, at="apogee"):
+    """State row of `flight` at its apogee or at its "end"."""
+    if at == "apogee":
+        if len(flight.apogee_state) == 1:
+            raise ValueError(f"{flight.name} did not reach apogee.")
+        return np.array([flight.apogee_time, *flight.apogee_state], dtype=float)
+    if at == "end":
+        return np.array(flight.solution[-1], dtype=float)
+    raise ValueError(f"Unknown snapshot point {at}, use 'apogee' or 'end'.")
+
+
+def mass_properties(rocket, t):
+    return [
+        rocket.total_mass.get_value(t),
+        rocket.center_of_mass.get_value(t),
+        rocket.I_11.get_value(t),
+        rocket.I_22.get_value(t),
+        rocket.I_33.get_value(t),
+    ]
+
+
+def save_snapshots(path, flights, at="apogee", **metadata):
+    """Saves the states of `flights` at `at` ("apogee" or "end") to `path`."""
+    flights = list(flights)
+    states = np.array([flight_state(flight, at) for flight in flights])
+    masses = np.array([mass_properties(flight.rocket, state[0]) for flight, state in zip(flights, states)])
+    env = flights[0].env
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temporary_path = path + ".tmp.npz"
+    np.savez_compressed(
+        temporary_path,
+        states=states,
+        mass_properties=masses,
+        names=np.array([flight.name for flight in flights]),
+        latitude=env.latitude,
+        longitude=env.longitude,
+        date=env.datetime_date.strftime("%Y-%m-%dT%H:%M:%S"),
+        **{f"atmosphere_{name}": values for name, values in atmosphere_profile(env).items()},
+        **{key: str(value) for key, value in metadata.items()},
+    )
+    os.replace(temporary_path, path)
+    return path
+
+
+def save_snapshot(flight, path, at="apogee", **metadata):
+    return save_snapshots(path, [flight], at, **metadata)
+
+
+class FlightSnapshots:
+    """States saved by save_snapshots, ready to start descents from.
+
+    `descent(rocket, index)` flies `rocket` from state `index`, in the saved
+    environment unless another one is given. `states` and `mass_properties`
+    hold one row per saved flight (see STATE_COLUMNS and MASS_COLUMNS).
+    """
+
+    def __init__(self, path):
+        with np.load(path, allow_pickle=False) as data:
+            self.states = data["states"]
+            self.mass_properties = data["mass_properties"]
+            self.names = list(data["names"])
+            self.latitude = float(data["latitude"])
+            self.longitude = float(data["longitude"])
+            self.date = datetime.strptime(str(data["date"]), "%Y-%m-%dT%H:%M:%S")
+            self.atmosphere = {name: data[f"atmosphere_{name}"] for name in PROFILE_COLUMNS}
+            self.elevation = float(data["atmosphere_elevation"])
+        self.path = path
+        self._environment = None
+
+    def __len__(self):
+        return len(self.states)
+
+    def state(self, index=0):
+        return [float(value) for value in self.states[index]]
+
+    def environment(self):
+        """The saved environment, rebuilt once, no network needed."""
+        if self._environment is None:
+            env = Environment(latitude=self.latitude, longitude=self.longitude, elevation=self.elevation)
+            env.set_date((self.date.year, self.date.month, self.date.day, self.date.hour), timezone="UTC")
+            self._environment = set_atmosphere(env, {**self.atmosphere, "elevation": self.elevation})
+        return self._environment
+
+    def descent(self, rocket, index=0, environment=None, **flight_arguments):
+        """Flight of `rocket` starting from saved state `index`."""
+        # rail and launch angles are not used when starting from a state
+        arguments = {
+            "rail_length": 1,
+            "inclination": 90,
+            "heading": 0,
+            "name": f"{self.names[index]} descent",
+            **flight_arguments,
+        }
+        return Flight(
+            rocket=rocket,
+            environment=environment or self.environment(),
+            initial_solution=self.state(index),
+            **arguments,
+        )
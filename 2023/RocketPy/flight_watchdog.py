@@ -0,0 +1,112 @@
+# wall clock and step budget for single flights
+#
+# `max_time` of a Flight limits simulated time only: a sample whose integrator
+# stalls on tiny steps, or that keeps oscillating under the parachute, can
+# still hold a worker for many minutes. WatchedFlight checks a budget of wall
+# time and derivative evaluations on every evaluation and aborts the flight
+# as soon as either runs out. whatever stops a flight, the failure comes back
+# as a FlightFailure that knows the flight phase, the simulated time reached
+# and the wall time spent, so failures can be grouped by cause.
+
+from time import perf_counter
+
+from rocketpy import Flight
+
+
+class BudgetExceeded(RuntimeError):
+    """A flight used up its wall time or derivative evaluation budget."""
+
+
+class FlightWatchdog:
+    """Budget and progress (phase, simulated time) of one flight.
+
+    `max_wall_time` is in seconds, `max_evaluations` counts calls of the
+    equations of motion (the solver makes several per step); None disables
+    either limit.
+    """
+
+    def __init__(self, max_wall_time=None, max_evaluations=None):
+        self.max_wall_time = max_wall_time
+        self.max_evaluations = max_evaluations
+        self.start_time = perf_counter()
+        self.evaluations = 0
+        self.phase = None
+        self.time = 0.0
+
+    @property
+    def wall_time(self):
+        return perf_counter() - self.start_time
+
+    def check(self, phase, t):
+        self.phase = phase
+        self.time = t
+        self.evaluations += 1
+        if self.max_evaluations is not None and self.evaluations > self.max_evaluations:
+            raise BudgetExceeded(f"budget of {self.max_evaluations} evaluations used up")
+        # perf_counter is cheap, but no need to read it on every evaluation
+        if self.max_wall_time is not None and self.evaluations % 64 == 0 and self.wall_time > self.max_wall_time:
+            raise BudgetExceeded(f"budget of {self.max_wall_time} s wall time used up")
+
+    def failure(self, exception):
+        return FlightFailure(exception, self)
+
+
+class FlightFailure(Exception):
+    """A failed flight, with where (phase, simulated time) and how long it ran.
+
+    `details` is the structured failure entry: type and message of the
+    original exception, phase, simulated time, wall time and evaluations.
+    """
+
+    def __init__(self, exception, watchdog):
+        self.details = {
+            "type": type(exception).__name__,
+            "message": str(exception),
+            "phase": watchdog.phase,
+            "time": watchdog.time,
+            "wall_time": watchdog.wall_time,
+            "evaluations": watchdog.evaluations,
+        }
+        super().__init__(f"{self.details['type']} during {watchdog.phase} at t = {watchdog.time:0.2f} s: {exception}")
+
+
+class WatchedFlight(Flight):
+    """Flight that reports its progress to a FlightWatchdog while it integrates."""
+
+    def __init__(self, *args, watchdog, **kwargs):
+        self.watchdog = watchdog
+        super().__init__(*args, **kwargs)
+
+    def _ascent_phase(self, t):
+        return "powered ascent" if t < self.rocket.motor.burn_out_time else "coast"
+
+    # post processing re-evaluates the same equations after the flight, it is
+    # not part of the budget
+    def udot_rail1(self, t, u, post_processing=False):
+        if not post_processing:
+            self.watchdog.check("rail", t)
+        return super().udot_rail1(t, u, post_processing)
+
+    def u_dot(self, t, u, post_processing=False):
+        if not post_processing:
+            self.watchdog.check(self._ascent_phase(t), t)
+        return super().u_dot(t, u, post_processing)
+
+    def u_dot_generalized(self, t, u, post_processing=False):
+        if not post_processing:
+            self.watchdog.check(self._ascent_phase(t), t)
+        return super().u_dot_generalized(t, u, post_processing)
+
+    def u_dot_parachute(self, t, u, post_processing=False):
+        if not post_processing:
+            self.watchdog.check("parachute", t)
+        return super().u_dot_parachute(t, u, post_processing)
+
+
+def run_watched_flight(max_wall_time=None, max_evaluations=None, **flight_arguments):
+    """WatchedFlight within the given budget, any failure raised as FlightFailure."""
+    watchdog = FlightWatchdog(max_wall_time, max_evaluations)
+    try:
+        return WatchedFlight(watchdog=watchdog, **flight_arguments)
+    except Exception as E:
+        raise watchdog.failure(E) from E
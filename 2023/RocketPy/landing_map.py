@@ -0,0 +1,244 @@
+# landing probability map of a monte carlo campaign
+#
+# the dispersion ellipses come from one 2x2 covariance, i.e. they assume the
+# landing points are gaussian, which they are not with a bimodal wind or a
+# failed main. a LandingGrid counts the impact points on a fixed east/north
+# grid instead. counting is a bincount, so it takes hundreds of thousands of
+# points at once, can be fed one sample at a time while the campaign runs,
+# and two grids with the same extent are merged by adding their counts (e.g.
+# a resumed campaign, or grids saved by other processes). the probability
+# per cell is the raw histogram or a binned kernel density estimate (the
+# histogram smoothed with a gaussian kernel); the contours of the smallest
+# regions holding 50/90/99 % of the landings replace the ellipses.
+
+import csv
+import os
+import warnings
+
+import numpy as np
+
+
+class LandingGrid:
+    """Counts of landing points on an east/north grid around the launch point.
+
+    The grid spans `east` and `north` (min, max in m) with square cells of
+    `cell` m; points outside are counted in `outside` so probabilities stay
+    relative to every landing. NaN points (failed samples) are skipped.
+    """
+
+    def __init__(self, east=(-4000, 4000), north=(-4000, 4000), cell=10.0):
+        self.cell = float(cell)
+        self.east_edges = np.arange(east[0], east[1] + self.cell / 2, self.cell, dtype=float)
+        self.north_edges = np.arange(north[0], north[1] + self.cell / 2, self.cell, dtype=float)
+        # counts[i, j]: north cell i, east cell j, the layout imshow/contour expect
+        self.counts = np.zeros((len(self.north_edges) - 1, len(self.east_edges) - 1), dtype=np.int64)
+        self.outside = 0
+
+    @property
+    def shape(self):
+        return self.counts.shape
+
+    @property
+    def total(self):
+        return int(self.counts.sum()) + self.outside
+
+    @property
+    def east_centres(self):
+        return (self.east_edges[:-1] + self.east_edges[1:]) / 2
+
+    @property
+    def north_centres(self):
+        return (self.north_edges[:-1] + self.north_edges[1:]) / 2
+
+    def update(self, east, north):
+        if east != east or north != north:
+            return
+        column = int(np.floor((east - self.east_edges[0]) / self.cell))
+        row = int(np.floor((north - self.north_edges[0]) / self.cell))
+        if 0 <= column < self.shape[1] and 0 <= row < self.shape[0]:
+            self.counts[row, column] += 1
+        else:
+            self.outside += 1
+
+    def update_array(self, east, north):
+        east = np.asarray(east, dtype=float)
+        north = np.asarray(north, dtype=float)
+        valid = ~(np.isnan(east) | np.isnan(north))
+        east, north = east[valid], north[valid]
+        column = np.floor((east - self.east_edges[0]) / self.cell).astype(np.int64)
+        row = np.floor((north - self.north_edges[0]) / self.cell).astype(np.int64)
+        inside = (column >= 0) & (column < self.shape[1]) & (row >= 0) & (row < self.shape[0])
+        self.outside += int(np.sum(~inside))
+        self.counts += np.bincount(
+            row[inside] * self.shape[1] + column[inside], minlength=self.counts.size
+        ).reshape(self.shape)
+
+    def merge(self, other):
+        """Adds the counts of a grid with the same extent and cells."""
+        if not (
+            np.array_equal(self.east_edges, other.east_edges) and np.array_equal(self.north_edges, other.north_edges)
+        ):
+            raise ValueError("Only grids with the same extent and cell size can be merged.")
+        self.counts += other.counts
+        self.outside += other.outside
+
+    def bandwidth(self):
+        """Scott's rule bandwidth (east, north) in m, from the counts themselves."""
+        if self.counts.sum() < 2:
+            return (self.cell, self.cell)
+        weights = self.counts / self.counts.sum()
+        east_weights, north_weights = weights.sum(axis=0), weights.sum(axis=1)
+        east_std = np.sqrt(np.sum(east_weights * (self.east_centres - np.sum(east_weights * self.east_centres)) ** 2))
+        north_std = np.sqrt(
+            np.sum(north_weights * (self.north_centres - np.sum(north_weights * self.north_centres)) ** 2)
+        )
+        factor = self.counts.sum() ** (-1 / 6)
+        return (max(east_std * factor, self.cell / 2), max(north_std * factor, self.cell / 2))
+
+    def probability(self, bandwidth=None):
+        """Probability of landing in each cell.
+
+        `bandwidth` (m, one value or (east, north)) smooths the histogram with
+        a gaussian kernel, None picks it with Scott's rule and 0 returns the
+        plain histogram. The cells sum to the share of landings on the grid.
+        """
+        if self.total == 0:
+            return np.zeros(self.shape)
+        probability = self.counts / self.total
+        if bandwidth is None:
+            bandwidth = self.bandwidth()
+        east_bandwidth, north_bandwidth = np.broadcast_to(np.asarray(bandwidth, dtype=float), (2,))
+        if east_bandwidth > 0:
+            probability = _smooth(probability, east_bandwidth / self.cell, axis=1)
+        if north_bandwidth > 0:
+            probability = _smooth(probability, north_bandwidth / self.cell, axis=0)
+        return probability
+
+    def levels(self, masses=(0.5, 0.9, 0.99), probability=None):
+        """Cell probabilities whose contours enclose the smallest regions holding `masses`.
+
+        Masses are shares of all landings; a mass beyond what lands on the
+        grid gets level 0.
+        """
+        probability = self.probability() if probability is None else probability
+        ordered = np.sort(probability, axis=None)[::-1]
+        cumulative = np.cumsum(ordered)
+        positions = np.searchsorted(cumulative, masses)
+        return [float(ordered[position]) if position < len(ordered) else 0.0 for position in positions]
+
+    def region_probability(self, east, north, probability=None):
+        """Probability of landing in the cells inside the (east, north) ranges."""
+        probability = self.probability(0) if probability is None else probability
+        columns = (self.east_centres >= east[0]) & (self.east_centres <= east[1])
+        rows = (self.north_centres >= north[0]) & (self.north_centres <= north[1])
+        return float(probability[np.ix_(rows, columns)].sum())
+
+    def contours(self, masses=(0.5, 0.9, 0.99), bandwidth=None):
+        """Polylines (n x 2 arrays of east, north) of the `masses` regions, per mass."""
+        from contourpy import contour_generator
+
+        probability = self.probability(bandwidth)
+        generator = contour_generator(self.east_centres, self.north_centres, probability)
+        return {
+            mass: generator.lines(level)
+            for mass, level in zip(masses, self.levels(masses, probability))
+            if level > 0
+        }
+
+    def plot(self, ax, masses=(0.5, 0.9, 0.99), bandwidth=None, cmap="Blues", **contour_arguments):
+        """Draws the probability map and the `masses` contours on `ax`."""
+        probability = self.probability(bandwidth)
+        extent = [self.east_edges[0], self.east_edges[-1], self.north_edges[0], self.north_edges[-1]]
+        image = ax.imshow(
+            np.ma.masked_equal(probability, 0), origin="lower", extent=extent, cmap=cmap, interpolation="nearest"
+        )
+        levels = self.levels(masses, probability)
+        # contour wants increasing levels, i.e. the largest mass first
+        drawn = sorted((level, mass) for mass, level in zip(masses, levels) if level > 0)
+        if drawn:
+            lines = ax.contour(
+                self.east_centres,
+                self.north_centres,
+                probability,
+                levels=[level for level, _ in drawn],
+                **{"colors": "black", "linewidths": 0.8, **contour_arguments},
+            )
+            ax.clabel(lines, fmt={level: f"{mass:0.0%}" for level, mass in drawn}, fontsize=8)
+        return image
+
+    def export_cells(self, path, bandwidth=None, minimum=0.0):
+        """Writes east, north (cell centres) and probability of every cell above `minimum` to a csv."""
+        probability = self.probability(bandwidth)
+        rows, columns = np.nonzero(probability > minimum)
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "w", newline="") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(["east", "north", "probability"])
+            writer.writerows(
+                zip(
+                    self.east_centres[columns].round(3),
+                    self.north_centres[rows].round(3),
+                    probability[rows, columns],
+                )
+            )
+        os.replace(temporary_path, path)
+        return path
+
+    def export_contours(self, path, masses=(0.5, 0.9, 0.99), bandwidth=None):
+        """Writes the contour polylines to a csv: mass, line number, east, north."""
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "w", newline="") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(["mass", "line", "east", "north"])
+            for mass, lines in self.contours(masses, bandwidth).items():
+                for number, line in enumerate(lines):
+                    writer.writerows((mass, number, round(east, 3), round(north, 3)) for east, north in line)
+        os.replace(temporary_path, path)
+        return path
+
+    def save(self, path):
+        temporary_path = path + ".tmp.npz"
+        np.savez_compressed(
+            temporary_path,
+            counts=self.counts,
+            outside=self.outside,
+            east_edges=self.east_edges,
+            north_edges=self.north_edges,
+        )
+        os.replace(temporary_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        grid = cls.__new__(cls)
+        with np.load(path, allow_pickle=False) as data:
+            grid.counts = data["counts"]
+            grid.outside = int(data["outside"])
+            grid.east_edges = data["east_edges"]
+            grid.north_edges = data["north_edges"]
+        grid.cell = float(grid.east_edges[1] - grid.east_edges[0])
+        return grid
+
+
+def _smooth(values, sigma, axis):
+    # gaussian convolution along one axis, kernel cut at 4 sigma (in cells)
+    radius = max(int(np.ceil(4 * sigma)), 1)
+    kernel = np.exp(-0.5 * (np.arange(-radius, radius + 1) / sigma) ** 2)
+    kernel /= kernel.sum()
+    padding = [(0, 0), (0, 0)]
+    padding[axis] = (radius, radius)
+    padded = np.pad(values, padding)
+    smoothed = np.zeros_like(values, dtype=float)
+    length = values.shape[axis]
+    for offset, weight in enumerate(kernel):
+        smoothed += weight * (padded[offset:offset + length] if axis == 0 else padded[:, offset:offset + length])
+    return smoothed
+
+
+def landing_grid_from_results(results, successful, **grid_arguments):
+    """LandingGrid of the successful samples of a result store (see load_results)."""
+    grid = LandingGrid(**grid_arguments)
+    grid.update_array(results["impactX"][successful], results["impactY"][successful])
+    if grid.outside:
+        warnings.warn(f"{grid.outside} landing points fall outside the grid, widen it to map them.")
+    return grid
@@ -0,0 +1,147 @@
+# process-pool monte carlo engine
+#
+# every worker process builds its expensive, shared objects (environment,
+# motor, ...) once through `setup` and then keeps pulling samples in chunks.
+# chunks are sized dynamically (guided scheduling): big while plenty of work
+# is left so the pool overhead stays small, shrinking towards single samples
+# at the end so one slow 600 s descent cannot leave the other cores idle.
+# results are handed back to the caller strictly in sample order.
+
+import os
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+from time import perf_counter
+
+# one finished sample: `result` is whatever `simulate` returned, `error` the
+# failure entry of the exception it raised (exactly one of the two is None)
+SampleResult = namedtuple("SampleResult", ["index", "setting", "result", "error"])
+
+# per-process state built by `setup`, lives for the whole life of the worker
+_context = None
+
+
+def _init_worker(setup, setup_args):
+    global _context
+    _context = setup(*setup_args)
+
+
+def failure_entry(exception, wall_time):
+    """Dict describing a failed sample.
+
+    Exceptions can add to (or override) the type, message and wall time
+    through a `details` dict, e.g. flight_watchdog.FlightFailure.
+    """
+    entry = {"type": type(exception).__name__, "message": str(exception), "wall_time": wall_time}
+    entry.update(getattr(exception, "details", {}))
+    return entry
+
+
+def _run_sample(simulate, context, index, setting, pass_index=False):
+    start_time = perf_counter()
+    try:
+        result = simulate(context, setting, index) if pass_index else simulate(context, setting)
+        return SampleResult(index, setting, result, None)
+    except Exception as E:
+        return SampleResult(index, setting, None, failure_entry(E, perf_counter() - start_time))
+
+
+def _run_chunk(simulate, indices, settings, pass_index=False):
+    return [
+        _run_sample(simulate, _context, index, setting, pass_index)
+        for index, setting in zip(indices, settings)
+    ]
+
+
+def chunk_size(remaining, workers, min_chunk=1, max_chunk=64):
+    """Guided chunk size: a fraction of the work left per worker."""
+    return max(min_chunk, min(max_chunk, remaining // (4 * workers)))
+
+
+def run_monte_carlo(
+    setup,
+    simulate,
+    settings,
+    total_number,
+    workers=None,
+    setup_args=(),
+    min_chunk=1,
+    max_chunk=64,
+    indices=None,
+    pass_index=False,
+):
+    """Runs `simulate(context, setting)` for every setting over a process pool.
+
+    `setup(*setup_args)` is called once per worker and its return value is the
+    `context` passed to every `simulate` call in that worker. Both must be
+    module level functions so they can be sent to the workers. `settings` can
+    be any iterable (e.g. the `flight_settings` generator), it is consumed
+    lazily and only `total_number` samples are taken from it. `indices` gives
+    the sample index of each setting (default 0, 1, ...), e.g. the samples
+    still missing from a resumed campaign. With pass_index=True the index is
+    given to `simulate(context, setting, index)` too, e.g. to seed the
+    sample's own random generator.
+
+    Yields a SampleResult per sample, in sample order, as soon as all earlier
+    samples are done. With workers=1 everything runs in this process.
+    """
+    workers = workers or os.cpu_count() or 1
+    settings = iter(settings)
+    indices = list(range(total_number)) if indices is None else list(indices)[:total_number]
+    total_number = len(indices)
+
+    if workers == 1:
+        context = setup(*setup_args)
+        for index, setting in zip(indices, islice(settings, total_number)):
+            yield _run_sample(simulate, context, index, setting, pass_index)
+        return
+
+    # positions 0..total_number-1 are mapped to sample indices in the chunks
+    next_start = 0
+    end_index = total_number
+    next_to_yield = 0
+    finished = {}
+    in_flight = set()
+    positions = {}
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(setup, setup_args)
+    ) as pool:
+
+        def submit_next():
+            nonlocal next_start
+            size = chunk_size(end_index - next_start, workers, min_chunk, max_chunk)
+            chunk = list(islice(settings, min(size, end_index - next_start)))
+            if not chunk:
+                next_start = end_index
+                return
+            chunk_indices = indices[next_start:next_start + len(chunk)]
+            future = pool.submit(_run_chunk, simulate, chunk_indices, chunk, pass_index)
+            positions[future] = next_start
+            in_flight.add(future)
+            next_start += len(chunk)
+
+        # keep two chunks queued per worker so nobody waits on the parent
+        while next_start < end_index and len(in_flight) < 2 * workers:
+            submit_next()
+
+        try:
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    in_flight.remove(future)
+                    start = positions.pop(future)
+                    for offset, sample in enumerate(future.result()):
+                        finished[start + offset] = sample
+                    if next_start < end_index:
+                        submit_next()
+
+                # merge back in sample order
+                while next_to_yield in finished:
+                    yield finished.pop(next_to_yield)
+                    next_to_yield += 1
+        finally:
+            # the caller stopped early (stopping rule, Ctrl-C): drop the queued
+            # chunks, only the ones already running are waited for
+            for future in in_flight:
+                future.cancel()
@@ -1,17 +1,29 @@
+import os
 from datetime import datetime 
 from time import process_time, perf_counter, time 
 # import glob
 
-from rocketpy import Environment, Rocket, Flight, Function
-from rocketpy.motors import CylindricalTank, Fluid, MassFlowRateBasedTank, LiquidMotor
+from rocketpy import Environment
 
 import numpy as np
-from numpy.random import normal, uniform, choice
 from IPython.display import display
 
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 
+from atmosphere_cache import AtmosphereCache, load_atmosphere
+from campaign import Campaign
+from flight_metrics import extract_metrics
+from flight_watchdog import run_watched_flight
+from landing_map import LandingGrid
+from monte_carlo_engine import run_monte_carlo
+from motor_tables import MOTOR_TABLE_DIRECTORY, tabulated_motor
+from nimbus_template import RocketTemplate, build_motor
+from result_store import FAILED, OK, OUTPUT_COLUMNS, load_results
+from sampling import StoppingRule
+from streaming_stats import CampaignMonitor
+from trajectory_archive import TrajectoryArchive, decimate
+
 mpl.rcParams["figure.figsize"] = [8,5]
 mpl.rcParams["figure.dpi"] = 120
 mpl.rcParams["font.size"] = 14
@@ -23,607 +35,489 @@ analysis_parameters = {
     "inclination": (84, 2),
     "heading": (133, 5),
     "railLength": (12, 0.005), 
+    # "dragFactor": (1, 0.05),
+    # "thrustFactor": (1, 0.02),
 }
 
-# flight settings generator
-def flight_settings(analysis_parameters, total_number):
-    i = 0
-    while i < total_number:
-        flight_setting = {}
-        for parameter_key, parameter_value in analysis_parameters.items():
-            if type(parameter_value) is tuple:
-                flight_setting[parameter_key] = normal(*parameter_value)
-            else:
-                flight_setting[parameter_key] = choice(parameter_value)
-
-        i += 1
-        yield flight_setting 
-
-# export function
-def export_flight_data(flight_setting, flight_data, exec_time):
-    flight_result = {
-        "outOfRailTime": flight_data.out_of_rail_time,
-        "outOfRailVelocity": flight_data.out_of_rail_velocity,
-        "apogeeTime": flight_data.apogee_time,
-        "apogeeAltitude": flight_data.apogee - Env.elevation,
-        "apogeeX": flight_data.apogee_x,
-        "apogeeY": flight_data.apogee_y,
-        # "impactTime": flight_data.impact_time,
-        "impactX": flight_data.x_impact,
-        "impactY": flight_data.y_impact,
-        "impactVelocity": flight_data.impact_velocity,
-        "initialStaticMargin": flight_data.rocket.static_margin(0),
-        "outOfRailStaticMargin": flight_data.rocket.static_margin(TestFlight.out_of_rail_time),
-        "finalStaticMargin": flight_data.rocket.static_margin(TestFlight.rocket.motor.burn_out_time),
-        "numberOfEvents": len(flight_data.parachute_events),
-        "executionTime": exec_time,
-    }
+# summary of a single flight, runs inside the worker so only this small dict
+# (and not the whole Flight object) has to travel back to the main process
+def flight_summary(flight_data, exec_time):
+    flight_result = extract_metrics(flight_data)
+    flight_result["executionTime"] = exec_time
+    return flight_result
 
-    sol = np.array(flight_data.solution)
+# export functions, one row per sample in the campaign's result store
+def export_flight_data(campaign, index, flight_setting, flight_result):
+    campaign.record({"index": index, "status": OK, **flight_setting, **flight_result})
 
-    flight_data.vx = Function(
-        sol[:, [0,4]], "Time (s)", "Vx (m/s)", "linear", extrapolation = "natural"
-    )
 
-    flight_data.vy = Function(
-        sol[:, [0,5]], "Time (s)", "Vy (m/s)", "linear", extrapolation = "natural"
-    )
+def export_flight_error(campaign, index, flight_setting, failure):
+    campaign.record_failure(index, failure)
+    campaign.record({"index": index, "status": FAILED, **flight_setting})
 
-    flight_data.vz = Function(
-        sol[:, [0,6]], "Time (s)", "Vz (m/s)", "linear", extrapolation = "natural"
-    )
+campaign_directory = "monte_carlo_outputs"
 
-    flight_data.v = (flight_data.vx**2 + flight_data.vy**2 + flight_data.vx**2) ** 0.5
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+campaign_id = "nimbus"
+simulation_number = 10 # campaign size, re-running resumes it and a larger number extends it
+workers = None # number of worker processes, None uses every core
+sampling_method = "sobol" # "random", "sobol", "halton" or "lhs", fixed once the campaign exists
+stopping_rule = StoppingRule(statistics = ("apogeeMean", "impactEllipse"), tolerance = 0.01) # None runs every sample
+atmosphere_file = None # local profile csv/npz standing in for the forecast, None uses the cached GFS forecast
+atmosphere_cache_directory = "atmosphere_cache"
+offline = False # only use cached forecasts, never download
+max_wall_time = 60 # s of wall clock per sample, a normal flight takes a few seconds
+max_evaluations = 100000 # equations of motion calls per sample, a normal flight needs under a thousand
+archive_trajectories = True # keep every decimated trajectory in the campaign's "trajectories" archive
+landing_grid = {"east": (-4000, 4000), "north": (-4000, 4000), "cell": 10} # m around the launch point, for the landing probability map
+motor_tables = True # motor mass, centre of mass and inertias from tables computed once and shared by the workers (see motor_tables.py)
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 
-    flight_data.max_vel = np.amax(flight_data.v.source[:,1])
-    flight_result["maxVelocity"] = flight_data.max_vel
+import datetime
 
-    if len(flight_data.parachute_events) > 0:
-        flight_result["drogueTriggerTime"] = flight_data.parachute_events[0][0]
-        flight_result["drogueInflatedTime"] = (
-            flight_data.parachute_events[0][0] + flight_data.parachute_events[0][1].lag
-        )
-        flight_data["drogueInflatedVelocity"] = flight_data.v(
-            flight_data.parachute_events[0][0] + flight_data.parachute_events[0][1].lag
+# launch site and date, without atmosphere
+def launch_site():
+    Env = Environment( 
+        latitude   = 39.232292, 
+        longitude  = -008.172027, 
+        elevation  = 160,
         )
-    else:
-        flight_result["drogueTriggerTime"] = 0
-        flight_result["drogueInflatedTime"] = 0
-        flight_result["drogueInflatedVelocity"] = 0
 
-    monte_carlo_input_file.write(str(flight_setting) + "\n")
-    monte_carlo_output_file.write(str(flight_result) + "\n")
+    # set date and time
+    tomorrow = datetime.date.today() + datetime.timedelta(days = 14)
+    Env.set_date((tomorrow.year, tomorrow.month, tomorrow.day, 12))  # Hour given in UTC time
+    return Env
+
+# environment, the GFS forecast column comes from a local file so workers
+# start without touching the network and all fly the same atmosphere
+def build_environment(atmosphere_file):
+    return load_atmosphere(launch_site(), atmosphere_file)
+
+# runs once in every worker process: environment, motor and the rocket
+# template are shared by all the samples that worker simulates
+def setup_worker(atmosphere_file, motor_table_directory = None, seed = None, tolerances = None):
+    THANOS = build_motor()
+    if motor_table_directory is not None:
+        THANOS = tabulated_motor(THANOS, motor_table_directory)
+    return {
+        "Env": build_environment(atmosphere_file),
+        "NimbusTemplate": RocketTemplate.nimbus(THANOS),
+        "seed": seed,
+        "tolerances": tolerances,
+    }
 
+# runs one dispersed flight inside a worker
+def simulate_flight(context, setting, index):
+    start_time = process_time()
 
-def export_flight_error(flight_setting):
-    monte_carlo_error_file.write(str(flight_setting) + "\n")
+    # the parachute noise of a sample comes from (campaign seed, index), so a
+    # resumed or rerun campaign flies it again exactly; the trailing 1 keeps
+    # it apart from the random sampler's (seed, index) stream
+    rng = np.random.default_rng((context["seed"], index, 1))
+    NimbusAscent = context["NimbusTemplate"].sample(setting, rng)
+
+    TestFlight = run_watched_flight(
+        max_wall_time = max_wall_time,
+        max_evaluations = max_evaluations,
+        rocket = NimbusAscent,
+        environment = context["Env"],
+        rail_length = setting["railLength"],
+        inclination = setting["inclination"],
+        heading = setting["heading"],
+        max_time = 600,
+    ) 
+
+    flight_result = flight_summary(TestFlight, process_time() - start_time)
+    # decimated in the worker with the archive's tolerances, so only the kept rows travel back
+    if context["tolerances"] is not None:
+        flight_result["trajectory"] = decimate(TestFlight.solution, tolerances = context["tolerances"])
+    return flight_result
+
+
+if __name__ == "__main__":
+    # download the forecast (once per cycle) in the main process only
+    if atmosphere_file is None:
+        atmosphere_file = AtmosphereCache(atmosphere_cache_directory, offline = offline).profile(launch_site())
+    print(f"Atmosphere: {atmosphere_file}")
+
+    # tabulate (and validate) the motor once here, the workers then only read the table
+    motor_table_directory = MOTOR_TABLE_DIRECTORY if motor_tables else None
+    if motor_table_directory is not None:
+        tabulated_motor(build_motor(), motor_table_directory)
+
+    campaign = Campaign(campaign_id, campaign_directory, analysis_parameters, sampler = sampling_method)
+    campaign.require(simulation_number)
+    pending = campaign.pending()
+    print(f"Campaign {campaign_id}: {campaign.total_number - len(pending)} samples done, {len(pending)} to run")
+
+    # live statistics, samples from earlier runs of the campaign included
+    monitor = CampaignMonitor(
+        [name for name, _ in OUTPUT_COLUMNS], campaign.total_number, campaign.total_number - len(pending)
+    )
+    landing = LandingGrid(**landing_grid)
+    if len(pending) < campaign.total_number:
+        stored_results = load_results(campaign.store_path)
+        monitor.update_from_results(stored_results, stored_results["status"] == OK)
+        landing.update_array(stored_results["impactX"][stored_results["status"] == OK], stored_results["impactY"][stored_results["status"] == OK])
+        del stored_results
+        for failure in campaign.failures().values():
+            monitor.update_failure(failure)
+
+    # synced on every campaign checkpoint, so the trajectory of a committed sample is never lost
+    archive = campaign.attach(TrajectoryArchive(os.path.join(campaign.path, "trajectories"))) if archive_trajectories else None
+
+    # counter initialisation
+    i = 0
 
-filename = "monte_carlo_outputs/nimbus"
+    initial_wall_time = time()
+    initial_cpu_time = process_time()
+
+    out = display("Starting", display_id = True)
+    # the campaign is checkpointed as results come in, a crash or Ctrl-C only
+    # loses the samples since the last checkpoint
+    try:
+        for sample in run_monte_carlo(
+            setup_worker,
+            simulate_flight,
+            campaign.settings(analysis_parameters, pending),
+            len(pending),
+            workers = workers,
+            setup_args = (atmosphere_file, motor_table_directory, campaign.seed, archive.tolerances if archive is not None else None),
+            indices = pending,
+            pass_index = True,
+        ):
+            i += 1
+
+            if sample.error is None:
+                trajectory = sample.result.pop("trajectory", None)
+                if archive is not None and trajectory is not None:
+                    archive.append(sample.index, trajectory, decimated = True)
+                export_flight_data(campaign, sample.index, sample.setting, sample.result)
+                monitor.update(sample.result)
+                landing.update(sample.result["impactX"], sample.result["impactY"])
+            else:
+                export_flight_error(campaign, sample.index, sample.setting, sample.error)
+                # a systematic failure shows up with its first sample
+                failure = {"index": sample.index, **sample.error}
+                if monitor.update_failure(failure):
+                    print(f"New failure cause in sample {sample.index}: {failure}")
+                monitor.update(None)
+            # display() only returns a handle inside IPython/Jupyter
+            if out is not None:
+                out.update(monitor.progress())
+            else:
+                print(monitor.progress())
+
+            if stopping_rule is not None and stopping_rule.update(monitor):
+                print(f"Converged after {i} samples (last relative change {stopping_rule.last_change:0.4f}), stopping early")
+                break
+    finally:
+        # the final checkpoint syncs the archive too
+        campaign.close()
+        if archive is not None:
+            archive.close()
+
+    final_string = f"Completed {i} iterations successfully. Total CPU time: {process_time() - initial_cpu_time} s. Total wall time {time() - initial_wall_time} s"
+    # out.update(final_string)
+    print(final_string)
+    print(monitor.summary())
+
+    # every column comes back as a (memory mapped) numpy array
+    all_results = load_results(campaign.store_path)
+    successful = all_results["status"] == OK
+
+    dispersion_results = {
+        parameter_key: all_results[parameter_key][successful]
+        for parameter_key, _ in OUTPUT_COLUMNS
+    }
 
-#-------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-simulation_number = 10
-#-------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+    N = int(np.sum(successful))
+    print("Number of simulations: ", N)
 
+    print(
+        f'Out of Rail Time -         Mean Value: {np.mean(dispersion_results["outOfRailTime"]):0.3f} s'
+    )
+    print(
+        f'Out of Rail Time - Standard Deviation: {np.std(dispersion_results["outOfRailTime"]):0.3f} s'
+    )
 
-monte_carlo_error_file = open(str(filename) + ".disp_errors.txt", "w")
-monte_carlo_input_file = open(str(filename) + ".disp_inputs.txt", "w")
-monte_carlo_output_file = open(str(filename) + ".disp_outputs.txt", "w")
+    plt.figure()
+    plt.hist(dispersion_results["outOfRailTime"], bins=int(N**0.5))
+    plt.title("Out of Rail Time")
+    plt.xlabel("Time (s)")
+    plt.ylabel("Number of Occurences")
+    plt.show()
 
-# counter initialisation
-i = 0
+    print(
+        f'Out of Rail Velocity -         Mean Value: {np.mean(dispersion_results["outOfRailVelocity"]):0.3f} m/s'
+    )
+    print(
+        f'Out of Rail Velocity - Standard Deviation: {np.std(dispersion_results["outOfRailVelocity"]):0.3f} m/s'
+    )
 
-initial_wall_time = time()
-initial_cpu_time = process_time()
+    plt.figure()
+    plt.hist(dispersion_results["outOfRailVelocity"], bins=int(N**0.5))
+    plt.title("Out of Rail Velocity")
+    plt.xlabel("Velocity (m/s)")
+    plt.ylabel("Number of Occurences")
+    plt.show()
 
-# environment
-Env = Environment( 
-    latitude   = 39.232292, 
-    longitude  = -008.172027, 
-    elevation  = 160,
+    print(
+        f'Apogee Time -         Mean Value: {np.mean(dispersion_results["apogeeTime"]):0.3f} s'
+    )
+    print(
+        f'Apogee Time - Standard Deviation: {np.std(dispersion_results["apogeeTime"]):0.3f} s'
     )
 
-# set date and time
-import datetime
-tomorrow = datetime.date.today() + datetime.timedelta(days = 14)
-Env.set_date((tomorrow.year, tomorrow.month, tomorrow.day, 12))  # Hour given in UTC time
-
-# GFS forecast to get the atmospheric conditions for flight.
-Env.set_atmospheric_model(type="Forecast", file="GFS")
-
-# tank geometries
-oxidiser_tank_shape = CylindricalTank(0.086, 0.639, True)
-fuel_tank_shape = CylindricalTank(0.114/2, 0.332, True)
-nitrogen_tank_shape = CylindricalTank(0.096/2, 0.214, True)
-
-# define fluids 
-oxidizer_liq = Fluid(name="N2O_l", density=800, quality=1)
-oxidizer_gas = Fluid(name="N2O_g", density=1.9277, quality=1)
-fuel_liq = Fluid(name="methanol_l", density=786, quality=1)
-fuel_gas = Fluid(name="methanol_g", density=1.59, quality=1)
-
-# some tanks 
-oxidizer_tank = MassFlowRateBasedTank(
-    name = "oxidizer tank",
-    geometry = oxidiser_tank_shape,
-    flux_time = 6.75,
-    initial_liquid_mass = 7,
-    initial_gas_mass = 0,
-    liquid_mass_flow_rate_in = 0,
-    # liquid_mass_flow_rate_out = 1.01,
-    liquid_mass_flow_rate_out = 0.875, 
-    gas_mass_flow_rate_in = 0.078,
-    gas_mass_flow_rate_out = 0,
-    liquid = oxidizer_liq,
-    gas = oxidizer_gas
-)
-
-fuel_tank = MassFlowRateBasedTank(
-    name = "fuel tank",
-    geometry = fuel_tank_shape,
-    flux_time = 6.75,
-    initial_liquid_mass = 2,
-    initial_gas_mass = 0,
-    liquid_mass_flow_rate_in = 0,
-    # liquid_mass_flow_rate_out = 0.29,
-    liquid_mass_flow_rate_out = 0.2,
-    gas_mass_flow_rate_in = 0.022,
-    gas_mass_flow_rate_out = 0,
-    liquid = fuel_liq,
-    gas = fuel_gas,
-)
- 
-# liquid engine 
-THANOS = LiquidMotor(
-    thrust_source = "nimbus_thrust.eng",
-    center_of_dry_mass = 0,
-    # burn_time = 6,
-    dry_mass = 0,
-    dry_inertia = (0,0,0),
-    nozzle_radius = 0.037385,
-)
-
-THANOS.add_tank(oxidizer_tank, 0.98)
-THANOS.add_tank(fuel_tank, 1.68)
-
-
-def drogue_trigger(p, h, y):
-    # p = pressure considering parachute noise signal
-    # h = height above ground level considering parachute noise signal
-    # y = [x, y, z, vx, vy, vz, e0, e1, e2, e3, w1, w2, w3]
-
-    # activate drogue when vz < 0 m/s.
-    return True if y[5] < 0 else False
-
-
-def main_trigger(p, h, y):
-    # p = pressure considering parachute noise signal
-    # h = height above ground level considering parachute noise signal
-    # y = [x, y, z, vx, vy, vz, e0, e1, e2, e3, w1, w2, w3]
-
-    # activate main when vz < 0 m/s and z < 800 m
-    return True if y[5] < 0 and h < 450 else False
-
-out = display("Starting", display_id = True)
-for setting in flight_settings(analysis_parameters, simulation_number):
+    plt.figure()
+    plt.hist(dispersion_results["apogeeTime"], bins=int(N**0.5))
+    plt.title("Apogee Time")
+    plt.xlabel("Time (s)")
+    plt.ylabel("Number of Occurences")
+    plt.show()
 
-    start_time = process_time()
-    i += 1
-
-    NimbusAscent = Rocket(
-        radius = 0.194/2,
-        mass = setting["rocketMass"],
-        # inertia = (4.75*10**10, 4.75*10**10, 2.387*10**8,
-        #            -23063, -8.278*10**6, -2.584*10**6),
-        inertia = (4.75*10**10, 4.75*10**10, 2.387*10**8,
-                -23063, -8.278*10**6, -2.584*10**6),
-        power_off_drag = "nimbus_Cd.csv",
-        power_on_drag = "nimbus_Cd.csv",
-        center_of_mass_without_motor = 0,
-        coordinate_system_orientation = "tail_to_nose",
+    print(
+        f'Apogee Altitude -         Mean Value: {np.mean(dispersion_results["apogeeAltitude"]):0.3f} m'
+    )
+    print(
+        f'Apogee Altitude - Standard Deviation: {np.std(dispersion_results["apogeeAltitude"]):0.3f} m'
     )
 
-    NimbusAscent.set_rail_buttons(
-        upper_button_position = 0.65,
-        lower_button_position = -1.30,
-        angular_position = 60,
-        )
+    plt.figure()
+    plt.hist(dispersion_results["apogeeAltitude"], bins=int(N**0.5))
+    plt.title("Apogee Altitude")
+    plt.xlabel("Altitude (m)")
+    plt.ylabel("Number of Occurences")
+    plt.show()
 
-    NimbusAscent.add_motor(THANOS, position = -1.82)
+    print(
+        f'Apogee X Position -         Mean Value: {np.mean(dispersion_results["apogeeX"]):0.3f} m'
+    )
+    print(
+        f'Apogee X Position - Standard Deviation: {np.std(dispersion_results["apogeeX"]):0.3f} m'
+    )
 
-    NoseCone = NimbusAscent.add_nose(length = 0.6, 
-                            kind = "vonKarman", 
-                            position = 0.6 + 2.06)
+    plt.figure()
+    plt.hist(dispersion_results["apogeeX"], bins=int(N**0.5))
+    plt.title("Apogee X Position")
+    plt.xlabel("Apogee X Position (m)")
+    plt.ylabel("Number of Occurences")
+    plt.show()
 
-    Tail = NimbusAscent.add_tail(
-        top_radius = 0.097, 
-        bottom_radius = 0.076, 
-        length = 0.322, 
-        position = -1.5
+    print(
+        f'Apogee Y Position -         Mean Value: {np.mean(dispersion_results["apogeeY"]):0.3f} m'
     )
-
-    Fins = NimbusAscent.add_trapezoidal_fins(
-        n = 3,
-        span = 0.21,
-        root_chord = 0.320,
-        tip_chord = 0.150,
-        position = -1.4,
-        cant_angle = 0,
-        # sweep_length = 0.085,
-        sweep_angle = 21.942, # leading edge sweep
-        radius = 0.194/2,
-        airfoil = None,
+    print(
+        f'Apogee Y Position - Standard Deviation: {np.std(dispersion_results["apogeeY"]):0.3f} m'
     )
 
-    Canards = NimbusAscent.add_trapezoidal_fins(
-        n = 3,
-        span = 0.05,
-        root_chord = 0.11,
-        tip_chord = 0.045,
-        position = 1.05,
-        cant_angle = 0,
-        # sweep_length = 0.07,
-        sweep_angle = 54.5,
-        radius = 0.194/2,
-        airfoil = ["xf-n0012-il-100000.csv", "degrees"],
+    plt.figure()
+    plt.hist(dispersion_results["apogeeY"], bins=int(N**0.5))
+    plt.title("Apogee Y Position")
+    plt.xlabel("Apogee Y Position (m)")
+    plt.ylabel("Number of Occurences")
+    plt.show()
+
+    # print(
+    #     f'Impact Time -         Mean Value: {np.mean(dispersion_results["impactTime"]):0.3f} s'
+    # )
+    # print(
+    #     f'Impact Time - Standard Deviation: {np.std(dispersion_results["impactTime"]):0.3f} s'
+    # )
+
+    # plt.figure()
+    # plt.hist(dispersion_results["impactTime"], bins=int(N**0.5))
+    # plt.title("Impact Time")
+    # plt.xlabel("Time (s)")
+    # plt.ylabel("Number of Occurences")
+    # plt.show()
+
+    print(
+        f'Impact X Position -         Mean Value: {np.mean(dispersion_results["impactX"]):0.3f} m'
     )
+    print(
+        f'Impact X Position - Standard Deviation: {np.std(dispersion_results["impactX"]):0.3f} m'
+    )
+
+    plt.figure()
+    plt.hist(dispersion_results["impactX"], bins=int(N**0.5))
+    plt.title("Impact X Position")
+    plt.xlabel("Impact X Position (m)")
+    plt.ylabel("Number of Occurences")
+    plt.show()
 
-    # Parachutes
-    Main = NimbusAscent.add_parachute(
-        "Main",
-        cd_s = 0.97*np.pi*6.10**2 / 4,
-        trigger = main_trigger,
-        sampling_rate = 105,
-        lag = 1.5,
-        noise = (0, 8.3, 0.5),
+    print(
+        f'Impact Y Position -         Mean Value: {np.mean(dispersion_results["impactY"]):0.3f} m'
+    )
+    print(
+        f'Impact Y Position - Standard Deviation: {np.std(dispersion_results["impactY"]):0.3f} m'
     )
 
-    Drogue = NimbusAscent.add_parachute(
-        "Drogue",
-        cd_s = 0.9*np.pi*0.914**2 / 4,
-        trigger = drogue_trigger,
-        sampling_rate = 105,
-        lag = 1.0,
-        noise = (0, 8.3, 0.5),
+    plt.figure()
+    plt.hist(dispersion_results["impactY"], bins=int(N**0.5))
+    plt.title("Impact Y Position")
+    plt.xlabel("Impact Y Position (m)")
+    plt.ylabel("Number of Occurences")
+    plt.show()
+
+    print(
+        f'Impact Velocity -         Mean Value: {np.mean(dispersion_results["impactVelocity"]):0.3f} m/s'
+    )
+    print(
+        f'Impact Velocity - Standard Deviation: {np.std(dispersion_results["impactVelocity"]):0.3f} m/s'
     )
 
-    try: 
-        TestFlight = Flight(
-            rocket = NimbusAscent,
-            environment = Env,
-            rail_length = setting["railLength"],
-            inclination = setting["inclination"],
-            heading = setting["heading"],
-            max_time = 600,
-        ) 
-
-        export_flight_data(setting, TestFlight, process_time() - start_time)
-    except Exception as E:
-        print(E)
-        export_flight_error(setting)
-
-    # out.update(
-    #     f"Current iteration: {i:06d} | Average Time per Iteration: {(process_time() - initial_cpu_time)/i:2.6f} s"
-    # )
+    plt.figure()
+    plt.hist(dispersion_results["impactVelocity"], bins=int(N**0.5))
+    plt.title("Impact Velocity")
+    # plt.grid()
+    plt.xlim(-35, 0)
+    plt.xlabel("Velocity (m/s)")
+    plt.ylabel("Number of Occurences")
+    plt.show()
+
+    print(
+        f'Initial Static Margin -             Mean Value: {np.mean(dispersion_results["initialStaticMargin"]):0.3f} c'
+    )
+    print(
+        f'Initial Static Margin -     Standard Deviation: {np.std(dispersion_results["initialStaticMargin"]):0.3f} c'
+    )
 
-final_string = f"Completed {i} iterations successfully. Total CPU time: {process_time() - initial_cpu_time} s. Total wall time {time() - initial_wall_time} s"
-# out.update(final_string)
-monte_carlo_input_file.write(final_string + "\n")
-monte_carlo_output_file.write(final_string + "\n")
-monte_carlo_error_file.write(final_string + "\n")
-
-monte_carlo_input_file.close()
-monte_carlo_output_file.close()
-monte_carlo_error_file.close()
-
-filename = "monte_carlo_outputs/nimbus"
-
-dispersion_general_results = []
-
-dispersion_results = {
-    "outOfRailTime": [],
-    "outOfRailVelocity": [],
-    "apogeeTime": [],
-    "apogeeAltitude": [],
-    "apogeeX": [],
-    "apogeeY": [],
-    # "impactTime": [],
-    "impactX": [],
-    "impactY": [],
-    "impactVelocity": [],
-    "initialStaticMargin": [],
-    "outOfRailStaticMargin": [],
-    "finalStaticMargin": [],
-    "numberOfEvents": [],
-    "maxVelocity": [],
-    "drogueTriggerTime": [],
-    "drogueInflatedTime": [],
-    "drogueInflatedVelocity": [],
-    "executionTime": [],
-}
+    print(
+        f'Out of Rail Static Margin -         Mean Value: {np.mean(dispersion_results["outOfRailStaticMargin"]):0.3f} c'
+    )
+    print(
+        f'Out of Rail Static Margin - Standard Deviation: {np.std(dispersion_results["outOfRailStaticMargin"]):0.3f} c'
+    )
 
-monte_carlo_output_file = open(str(filename) + ".disp_outputs.txt", "r+")
-
-for line in monte_carlo_output_file:
-    if line[0] != "{":
-        continue
-    flight_result = eval(line)
-    dispersion_general_results.append(flight_result)
-    for parameter_key, parameter_value in flight_result.items():
-        dispersion_results[parameter_key].append(parameter_value)
-
-monte_carlo_output_file.close()
-
-N = len(dispersion_general_results)
-print("Number of simulations: ", N)
-
-print(
-    f'Out of Rail Time -         Mean Value: {np.mean(dispersion_results["outOfRailTime"]):0.3f} s'
-)
-print(
-    f'Out of Rail Time - Standard Deviation: {np.std(dispersion_results["outOfRailTime"]):0.3f} s'
-)
-
-plt.figure()
-plt.hist(dispersion_results["outOfRailTime"], bins=int(N**0.5))
-plt.title("Out of Rail Time")
-plt.xlabel("Time (s)")
-plt.ylabel("Number of Occurences")
-plt.show()
-
-print(
-    f'Out of Rail Velocity -         Mean Value: {np.mean(dispersion_results["outOfRailVelocity"]):0.3f} m/s'
-)
-print(
-    f'Out of Rail Velocity - Standard Deviation: {np.std(dispersion_results["outOfRailVelocity"]):0.3f} m/s'
-)
-
-plt.figure()
-plt.hist(dispersion_results["outOfRailVelocity"], bins=int(N**0.5))
-plt.title("Out of Rail Velocity")
-plt.xlabel("Velocity (m/s)")
-plt.ylabel("Number of Occurences")
-plt.show()
-
-print(
-    f'Apogee Time -         Mean Value: {np.mean(dispersion_results["apogeeTime"]):0.3f} s'
-)
-print(
-    f'Apogee Time - Standard Deviation: {np.std(dispersion_results["apogeeTime"]):0.3f} s'
-)
-
-plt.figure()
-plt.hist(dispersion_results["apogeeTime"], bins=int(N**0.5))
-plt.title("Apogee Time")
-plt.xlabel("Time (s)")
-plt.ylabel("Number of Occurences")
-plt.show()
-
-print(
-    f'Apogee Altitude -         Mean Value: {np.mean(dispersion_results["apogeeAltitude"]):0.3f} m'
-)
-print(
-    f'Apogee Altitude - Standard Deviation: {np.std(dispersion_results["apogeeAltitude"]):0.3f} m'
-)
-
-plt.figure()
-plt.hist(dispersion_results["apogeeAltitude"], bins=int(N**0.5))
-plt.title("Apogee Altitude")
-plt.xlabel("Altitude (m)")
-plt.ylabel("Number of Occurences")
-plt.show()
-
-print(
-    f'Apogee X Position -         Mean Value: {np.mean(dispersion_results["apogeeX"]):0.3f} m'
-)
-print(
-    f'Apogee X Position - Standard Deviation: {np.std(dispersion_results["apogeeX"]):0.3f} m'
-)
-
-plt.figure()
-plt.hist(dispersion_results["apogeeX"], bins=int(N**0.5))
-plt.title("Apogee X Position")
-plt.xlabel("Apogee X Position (m)")
-plt.ylabel("Number of Occurences")
-plt.show()
-
-print(
-    f'Apogee Y Position -         Mean Value: {np.mean(dispersion_results["apogeeY"]):0.3f} m'
-)
-print(
-    f'Apogee Y Position - Standard Deviation: {np.std(dispersion_results["apogeeY"]):0.3f} m'
-)
-
-plt.figure()
-plt.hist(dispersion_results["apogeeY"], bins=int(N**0.5))
-plt.title("Apogee Y Position")
-plt.xlabel("Apogee Y Position (m)")
-plt.ylabel("Number of Occurences")
-plt.show()
-
-# print(
-#     f'Impact Time -         Mean Value: {np.mean(dispersion_results["impactTime"]):0.3f} s'
-# )
-# print(
-#     f'Impact Time - Standard Deviation: {np.std(dispersion_results["impactTime"]):0.3f} s'
-# )
-
-# plt.figure()
-# plt.hist(dispersion_results["impactTime"], bins=int(N**0.5))
-# plt.title("Impact Time")
-# plt.xlabel("Time (s)")
-# plt.ylabel("Number of Occurences")
-# plt.show()
-
-print(
-    f'Impact X Position -         Mean Value: {np.mean(dispersion_results["impactX"]):0.3f} m'
-)
-print(
-    f'Impact X Position - Standard Deviation: {np.std(dispersion_results["impactX"]):0.3f} m'
-)
-
-plt.figure()
-plt.hist(dispersion_results["impactX"], bins=int(N**0.5))
-plt.title("Impact X Position")
-plt.xlabel("Impact X Position (m)")
-plt.ylabel("Number of Occurences")
-plt.show()
-
-print(
-    f'Impact Y Position -         Mean Value: {np.mean(dispersion_results["impactY"]):0.3f} m'
-)
-print(
-    f'Impact Y Position - Standard Deviation: {np.std(dispersion_results["impactY"]):0.3f} m'
-)
-
-plt.figure()
-plt.hist(dispersion_results["impactY"], bins=int(N**0.5))
-plt.title("Impact Y Position")
-plt.xlabel("Impact Y Position (m)")
-plt.ylabel("Number of Occurences")
-plt.show()
-
-print(
-    f'Impact Velocity -         Mean Value: {np.mean(dispersion_results["impactVelocity"]):0.3f} m/s'
-)
-print(
-    f'Impact Velocity - Standard Deviation: {np.std(dispersion_results["impactVelocity"]):0.3f} m/s'
-)
-
-plt.figure()
-plt.hist(dispersion_results["impactVelocity"], bins=int(N**0.5))
-plt.title("Impact Velocity")
-# plt.grid()
-plt.xlim(-35, 0)
-plt.xlabel("Velocity (m/s)")
-plt.ylabel("Number of Occurences")
-plt.show()
-
-print(
-    f'Initial Static Margin -             Mean Value: {np.mean(dispersion_results["initialStaticMargin"]):0.3f} c'
-)
-print(
-    f'Initial Static Margin -     Standard Deviation: {np.std(dispersion_results["initialStaticMargin"]):0.3f} c'
-)
-
-print(
-    f'Out of Rail Static Margin -         Mean Value: {np.mean(dispersion_results["outOfRailStaticMargin"]):0.3f} c'
-)
-print(
-    f'Out of Rail Static Margin - Standard Deviation: {np.std(dispersion_results["outOfRailStaticMargin"]):0.3f} c'
-)
-
-print(
-    f'Final Static Margin -               Mean Value: {np.mean(dispersion_results["finalStaticMargin"]):0.3f} c'
-)
-print(
-    f'Final Static Margin -       Standard Deviation: {np.std(dispersion_results["finalStaticMargin"]):0.3f} c'
-)
-
-plt.figure()
-plt.hist(dispersion_results["initialStaticMargin"], label="Initial", bins=int(N**0.5))
-plt.hist(dispersion_results["outOfRailStaticMargin"], label="Out of Rail", bins=int(N**0.5))
-plt.hist(dispersion_results["finalStaticMargin"], label="Final", bins=int(N**0.5))
-plt.legend()
-plt.title("Static Margin")
-plt.xlabel("Static Margin (c)")
-plt.ylabel("Number of Occurences")
-plt.show()
-
-print(
-    f'Maximum Velocity -         Mean Value: {np.mean(dispersion_results["maxVelocity"]):0.3f} m/s'
-)
-print(
-    f'Maximum Velocity - Standard Deviation: {np.std(dispersion_results["maxVelocity"]):0.3f} m/s'
-)
-
-plt.figure()
-plt.hist(dispersion_results["maxVelocity"], bins=int(N**0.5))
-plt.title("Maximum Velocity")
-plt.xlabel("Velocity (m/s)")
-plt.ylabel("Number of Occurences")
-plt.show()
-
-# from here 
-from matplotlib.patches import Ellipse
-
-# get dispersion data for apogee and impact X and Y position
-apogeeX = np.array(dispersion_results["apogeeX"])
-apogeeY = np.array(dispersion_results["apogeeY"])
-impactX = np.array(dispersion_results["impactX"])
-impactY = np.array(dispersion_results["impactY"])
-
-# calculate eigen values
-def eigsorted(cov):
-    vals, vecs = np.linalg.eigh(cov)
-    order = vals.argsort()[::-1]
-    return vals[order], vecs[:, order]
-
-# plotting
-plt.figure(num=None, figsize=(8, 6), dpi=150, facecolor="w", edgecolor="k")
-ax = plt.subplot(111)
-
-# error ellipses for impact
-impactCov = np.cov(impactX, impactY)
-impactVals, impactVecs = eigsorted(impactCov)
-impactTheta = np.degrees(np.arctan2(*impactVecs[:, 0][::-1]))
-impactW, impactH = 2 * np.sqrt(impactVals)
-
-impact_ellipses = []
-for j in [1, 2, 3]:
-    impactEll = Ellipse(
-        xy=(np.mean(impactX), np.mean(impactY)),
-        width=impactW * j,
-        height=impactH * j,
-        angle=impactTheta,
-        color="black",
+    print(
+        f'Final Static Margin -               Mean Value: {np.mean(dispersion_results["finalStaticMargin"]):0.3f} c'
     )
-    impactEll.set_facecolor((0, 0, 1, 0.2))
-    impact_ellipses.append(impactEll)
-    ax.add_artist(impactEll)
-
-#  error ellipses for apogee
-apogeeCov = np.cov(apogeeX, apogeeY)
-apogeeVals, apogeeVecs = eigsorted(apogeeCov)
-apogeeTheta = np.degrees(np.arctan2(*apogeeVecs[:, 0][::-1]))
-apogeeW, apogeeH = 2 * np.sqrt(apogeeVals)
-
-for j in [1, 2, 3]:
-    apogeeEll = Ellipse(
-        xy=(np.mean(apogeeX), np.mean(apogeeY)),
-        width=apogeeW * j,
-        height=apogeeH * j,
-        angle=apogeeTheta,
-        color="black",
+    print(
+        f'Final Static Margin -       Standard Deviation: {np.std(dispersion_results["finalStaticMargin"]):0.3f} c'
     )
-    apogeeEll.set_facecolor((0, 1, 0, 0.2))
-    ax.add_artist(apogeeEll)
 
+    plt.figure()
+    plt.hist(dispersion_results["initialStaticMargin"], label="Initial", bins=int(N**0.5))
+    plt.hist(dispersion_results["outOfRailStaticMargin"], label="Out of Rail", bins=int(N**0.5))
+    plt.hist(dispersion_results["finalStaticMargin"], label="Final", bins=int(N**0.5))
+    plt.legend()
+    plt.title("Static Margin")
+    plt.xlabel("Static Margin (c)")
+    plt.ylabel("Number of Occurences")
+    plt.show()
+
+    print(
+        f'Maximum Velocity -         Mean Value: {np.mean(dispersion_results["maxVelocity"]):0.3f} m/s'
+    )
+    print(
+        f'Maximum Velocity - Standard Deviation: {np.std(dispersion_results["maxVelocity"]):0.3f} m/s'
+    )
 
-plt.scatter(0, 0, s=30, marker="*", color="black", label="Launch Point")
+    plt.figure()
+    plt.hist(dispersion_results["maxVelocity"], bins=int(N**0.5))
+    plt.title("Maximum Velocity")
+    plt.xlabel("Velocity (m/s)")
+    plt.ylabel("Number of Occurences")
+    plt.show()
+
+    # from here 
+    from matplotlib.patches import Ellipse
+
+    # get dispersion data for apogee and impact X and Y position
+    apogeeX = np.array(dispersion_results["apogeeX"])
+    apogeeY = np.array(dispersion_results["apogeeY"])
+    impactX = np.array(dispersion_results["impactX"])
+    impactY = np.array(dispersion_results["impactY"])
+
+    # calculate eigen values
+    def eigsorted(cov):
+        vals, vecs = np.linalg.eigh(cov)
+        order = vals.argsort()[::-1]
+        return vals[order], vecs[:, order]
+
+    # plotting
+    plt.figure(num=None, figsize=(8, 6), dpi=150, facecolor="w", edgecolor="k")
+    ax = plt.subplot(111)
+
+    # error ellipses for impact
+    impactCov = np.cov(impactX, impactY)
+    impactVals, impactVecs = eigsorted(impactCov)
+    impactTheta = np.degrees(np.arctan2(*impactVecs[:, 0][::-1]))
+    impactW, impactH = 2 * np.sqrt(impactVals)
+
+    impact_ellipses = []
+    for j in [1, 2, 3]:
+        impactEll = Ellipse(
+            xy=(np.mean(impactX), np.mean(impactY)),
+            width=impactW * j,
+            height=impactH * j,
+            angle=impactTheta,
+            color="black",
+        )
+        impactEll.set_facecolor((0, 0, 1, 0.2))
+        impact_ellipses.append(impactEll)
+        ax.add_artist(impactEll)
+
+    #  error ellipses for apogee
+    apogeeCov = np.cov(apogeeX, apogeeY)
+    apogeeVals, apogeeVecs = eigsorted(apogeeCov)
+    apogeeTheta = np.degrees(np.arctan2(*apogeeVecs[:, 0][::-1]))
+    apogeeW, apogeeH = 2 * np.sqrt(apogeeVals)
+
+    for j in [1, 2, 3]:
+        apogeeEll = Ellipse(
+            xy=(np.mean(apogeeX), np.mean(apogeeY)),
+            width=apogeeW * j,
+            height=apogeeH * j,
+            angle=apogeeTheta,
+            color="black",
+        )
+        apogeeEll.set_facecolor((0, 1, 0, 0.2))
+        ax.add_artist(apogeeEll)
 
-plt.scatter(apogeeX, apogeeY, s=5, marker="^", color="green", label="Simulated Apogee")
 
-plt.scatter(impactX, impactY, s=5, marker="v", color="blue", label="Simulated Landing Point")
+    plt.scatter(0, 0, s=30, marker="*", color="black", label="Launch Point")
 
-plt.legend()
+    plt.scatter(apogeeX, apogeeY, s=5, marker="^", color="green", label="Simulated Apogee")
 
-ax.set_title(
-    "1$\sigma$, 2$\sigma$ and 3$\sigma$ Dispersion Ellipses: Apogee and Lading Points"
-)
-ax.set_ylabel("North (m)")
-ax.set_xlabel("East (m)")
+    plt.scatter(impactX, impactY, s=5, marker="v", color="blue", label="Simulated Landing Point")
 
-# # Add background image to plot
-# # You can translate the basemap by changing dx and dy (in meters)
-# dx = 0
-# dy = 0
-# plt.imshow(img, zorder=0, extent=[-1000 - dx, 1000 - dx, -1000 - dy, 1000 - dy])
-# plt.axhline(0, color="black", linewidth=0.5)
-# plt.axvline(0, color="black", linewidth=0.5)
-# plt.xlim(-100, 700)
-# plt.ylim(-300, 300)
+    plt.legend()
 
-# # Save plot and show result
-# plt.savefig(str(filename) + ".pdf", bbox_inches="tight", pad_inches=0)
-# plt.savefig(str(filename) + ".svg", bbox_inches="tight", pad_inches=0)
-plt.show()
\ No newline at end of file
+    ax.set_title(
+        "1$\sigma$, 2$\sigma$ and 3$\sigma$ Dispersion Ellipses: Apogee and Lading Points"
+    )
+    ax.set_ylabel("North (m)")
+    ax.set_xlabel("East (m)")
+
+    # # Add background image to plot
+    # # You can translate the basemap by changing dx and dy (in meters)
+    # dx = 0
+    # dy = 0
+    # plt.imshow(img, zorder=0, extent=[-1000 - dx, 1000 - dx, -1000 - dy, 1000 - dy])
+    # plt.axhline(0, color="black", linewidth=0.5)
+    # plt.axvline(0, color="black", linewidth=0.5)
+    # plt.xlim(-100, 700)
+    # plt.ylim(-300, 300)
+
+    # # Save plot and show result
+    # plt.savefig(os.path.join(campaign.path, "dispersion.pdf"), bbox_inches="tight", pad_inches=0)
+    # plt.savefig(os.path.join(campaign.path, "dispersion.svg"), bbox_inches="tight", pad_inches=0)
+    plt.show()
+    # landing probability map, no gaussian assumption: smallest regions
+    # holding 50, 90 and 99 % of the landings
+    plt.figure(num=None, figsize=(8, 6), dpi=150, facecolor="w", edgecolor="k")
+    ax = plt.subplot(111)
+    image = landing.plot(ax, masses = (0.5, 0.9, 0.99))
+    plt.colorbar(image, ax = ax, label = "Landing probability per cell")
+    plt.scatter(0, 0, s=30, marker="*", color="black", label="Launch Point")
+    plt.legend()
+    ax.set_title(f"Landing Probability ({landing.cell:0.0f} m cells, {landing.outside} landings off the map)")
+    ax.set_ylabel("North (m)")
+    ax.set_xlabel("East (m)")
+    plt.show()
+
+    landing.save(os.path.join(campaign.path, "landing_grid.npz"))
+    landing.export_cells(os.path.join(campaign.path, "landing_probability.csv"))
+    landing.export_contours(os.path.join(campaign.path, "landing_contours.csv"))
@@ -0,0 +1,196 @@
+# precomputed mass property tables of a liquid motor
+#
+# a LiquidMotor derives its mass, centre of mass and inertias from its tanks
+# by composing rocketpy Functions (liquid and gas heights, masses, centres of
+# mass, ... of every tank). the composition is evaluated lazily, the first
+# time each quantity is asked for, which for THANOS costs about 0.7 s: in
+# every process that builds the motor, i.e. in every monte carlo worker and
+# every script run, before the first flight. here those quantities are
+# evaluated once on a dense time grid over the burn, checked against the
+# original between the grid points, and saved as one small .npz of arrays
+# named after a fingerprint of the motor's inputs (thrust curve, tanks,
+# fluids, flow rates, positions). a tabulated motor is a copy of the motor
+# whose quantities are linearly interpolated from those arrays, so building
+# it costs a file read and every query is a table lookup.
+
+import copy
+import hashlib
+import os
+from collections import namedtuple
+
+import numpy as np
+from rocketpy import Function
+
+MOTOR_TABLE_DIRECTORY = "motor_tables"
+
+# everything rocket.add_motor, the rocket's evaluate_* and Flight ask the
+# motor for, besides the thrust curve (already a table)
+MOTOR_QUANTITIES = [
+    "total_mass",
+    "propellant_mass",
+    "mass_flow_rate",
+    "center_of_mass",
+    "center_of_propellant_mass",
+    "I_11",
+    "I_22",
+    "I_33",
+    "I_12",
+    "I_13",
+    "I_23",
+]
+
+# grid step (s) and largest interpolation error allowed, relative to the
+# largest absolute value of the quantity over the burn
+TABLE_STEP = 0.005
+TABLE_TOLERANCE = 1e-4
+
+MotorTable = namedtuple("MotorTable", ["fingerprint", "time", "values", "extrapolation", "errors"])
+
+
+def _feed(digest, value):
+    # the bytes of a motor input: numbers, strings, arrays, Function tables
+    # (or samples of a Function defined by a callable) and containers of those
+    if isinstance(value, Function):
+        source = value.source
+        if isinstance(source, np.ndarray):
+            digest.update(np.ascontiguousarray(source, dtype=float).tobytes())
+        else:
+            digest.update(np.array([value.get_value(t) for t in np.linspace(0, 10, 41)], dtype=float).tobytes())
+    elif isinstance(value, np.ndarray):
+        digest.update(np.ascontiguousarray(value, dtype=float).tobytes())
+    elif isinstance(value, dict):
+        for key in sorted(value, key=str):
+            digest.update(str(key).encode())
+            _feed(digest, value[key])
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _feed(digest, item)
+    elif hasattr(value, "__dict__"):
+        digest.update(type(value).__name__.encode())
+        _feed(digest, _inputs(value))
+    else:
+        digest.update(repr(value).encode())
+
+
+def _inputs(instance):
+    # attributes set by the constructor; quantities derived on demand are
+    # cached properties, stored in the instance under a name the class has
+    return {
+        key: value
+        for key, value in vars(instance).items()
+        if key not in ("prints", "plots") and not hasattr(type(instance), key)
+    }
+
+
+def motor_fingerprint(motor):
+    """sha1 of the motor's inputs (tanks included), nothing is evaluated."""
+    digest = hashlib.sha1()
+    _feed(digest, motor)
+    return digest.hexdigest()
+
+
+def _evaluate(function, times):
+    return np.array([function.get_value(t) for t in times], dtype=float)
+
+
+def _table_span(motor):
+    # the burn, or longer while the tanks still flow: after burnout the
+    # propellant left keeps draining until the end of the tanks' flux time
+    start, end = motor.burn_start_time, motor.burn_out_time
+    for name in MOTOR_QUANTITIES:
+        source = getattr(motor, name).source
+        if isinstance(source, np.ndarray):
+            start, end = min(start, source[0, 0]), max(end, source[-1, 0])
+    return start, end
+
+
+def tabulate_motor(motor, step=TABLE_STEP, tolerance=TABLE_TOLERANCE):
+    """MotorTable of `motor` over its burn and flux time, validated between the grid points.
+
+    Raises ValueError when linear interpolation on the grid is further than
+    `tolerance` (relative) from the original anywhere checked.
+    """
+    fingerprint = motor_fingerprint(motor)
+    start, end = _table_span(motor)
+    time = np.linspace(start, end, max(int(np.ceil((end - start) / step)), 1) + 1)
+    middle = (time[:-1] + time[1:]) / 2
+    values = np.empty((len(MOTOR_QUANTITIES), len(time)))
+    errors = np.empty(len(MOTOR_QUANTITIES))
+    # beyond the table, as the original (e.g. no mass flow after the flux time)
+    extrapolation = []
+    for row, name in enumerate(MOTOR_QUANTITIES):
+        function = getattr(motor, name)
+        extrapolation.append(function.__extrapolation__ or "constant")
+        values[row] = _evaluate(function, time)
+        # halfway between nodes is where linear interpolation is worst
+        original = _evaluate(function, middle)
+        scale = max(np.max(np.abs(values[row])), np.max(np.abs(original)), 1e-12)
+        errors[row] = np.max(np.abs((values[row, :-1] + values[row, 1:]) / 2 - original)) / scale
+        if not errors[row] <= tolerance:
+            raise ValueError(
+                f"Motor {name} is {errors[row]:0.2e} off between {step} s table points, "
+                f"more than the tolerance {tolerance}; use a smaller step."
+            )
+    return MotorTable(fingerprint, time, values, extrapolation, errors)
+
+
+def save_motor_table(path, table):
+    temporary_path = path + ".tmp.npz"
+    np.savez_compressed(
+        temporary_path,
+        fingerprint=table.fingerprint,
+        time=table.time,
+        values=table.values,
+        extrapolation=np.array(table.extrapolation),
+        errors=table.errors,
+        quantities=np.array(MOTOR_QUANTITIES),
+    )
+    os.replace(temporary_path, path)
+    return path
+
+
+def load_motor_table(path):
+    with np.load(path, allow_pickle=False) as data:
+        if list(data["quantities"]) != MOTOR_QUANTITIES:
+            raise ValueError(f"{path} holds other quantities than {MOTOR_QUANTITIES}, tabulate the motor again.")
+        return MotorTable(
+            str(data["fingerprint"]), data["time"], data["values"], list(data["extrapolation"]), data["errors"]
+        )
+
+
+def apply_motor_table(motor, table):
+    """Copy of `motor` whose MOTOR_QUANTITIES are interpolated from `table`."""
+    tabulated = copy.copy(motor)
+    for name, values, extrapolation in zip(MOTOR_QUANTITIES, table.values, table.extrapolation):
+        # the Functions are cached properties, so the tables are put in their place
+        tabulated.__dict__[name] = Function(
+            np.column_stack((table.time, values)),
+            "Time (s)",
+            name,
+            interpolation="linear",
+            extrapolation=extrapolation,
+        )
+    return tabulated
+
+
+def tabulated_motor(motor, directory=MOTOR_TABLE_DIRECTORY, step=TABLE_STEP, tolerance=TABLE_TOLERANCE):
+    """`motor` with table lookups for its mass properties.
+
+    The table is read from `directory` when a motor with the same inputs was
+    tabulated before (by any process), otherwise it is computed, validated
+    and saved there. None as `directory` tabulates without saving.
+    """
+    fingerprint = motor_fingerprint(motor)
+    path = None
+    if directory is not None:
+        path = os.path.join(directory, f"{fingerprint}.npz")
+        if os.path.exists(path):
+            table = load_motor_table(path)
+            if table.fingerprint == fingerprint:
+                return apply_motor_table(motor, table)
+
+    table = tabulate_motor(motor, step, tolerance)
+    if path is not None:
+        os.makedirs(directory, exist_ok=True)
+        save_motor_table(path, table)
+    return apply_motor_table(motor, table)
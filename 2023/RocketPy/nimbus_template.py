@@ -0,0 +1,172 @@
+# build-once nimbus vehicle for monte carlo campaigns
+#
+# building the rocket is the expensive bit of a short run: every add_* call
+# re-evaluates the static margin, the drag curves and the canard airfoil are
+# read from csv, and the motor recomputes its tank Functions. the template
+# does all of that once per worker; every sample then gets a shallow copy
+# where only the perturbed values and the quantities depending on them are
+# re-evaluated. the vehicle itself is configs/nimbus_2023.json, built through
+# vehicle_config, so every tool that flies the nimbus flies that one.
+
+import copy
+import os
+
+import numpy as np
+from rocketpy import Function, Rocket
+
+from drag_tables import drag_curve
+from parachute_triggers import ParachuteSpec, Trigger
+from vehicle_config import load_config, make_motor, make_rocket, merge_configs, parachute_specs
+
+
+# the nimbus (tanks, motor, rocket, surfaces, parachutes) is defined once,
+# as data, in configs/nimbus_2023.json
+NIMBUS_CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "configs", "nimbus_2023.json")
+NIMBUS_CONFIG = load_config(NIMBUS_CONFIG_FILE)
+
+
+# liquid engine with its tanks, a fresh one on every call
+def build_motor(thrust_source=None):
+    config = NIMBUS_CONFIG
+    if thrust_source is not None:
+        config = merge_configs(config, {"motor": {"thrust_source": thrust_source}})
+    return make_motor(config)
+
+
+# drogue at apogee, main below 450 m AGL; parachutes keep per-flight noise
+# and pressure signals so every sample gets its own fresh Parachute objects
+NIMBUS_PARACHUTES = parachute_specs(NIMBUS_CONFIG)
+DROGUE_TRIGGER = Trigger(apogee = True)
+
+MARGE_PARACHUTES = [
+    ParachuteSpec(
+        name = "Drogue",
+        cd_s = 0.9*np.pi*0.914**2 / 4,
+        trigger = DROGUE_TRIGGER,
+        sampling_rate = 105,
+        lag = 1.0,
+        noise = (0, 8.3, 0.5),
+    ),
+]
+
+
+# nimbus ascent configuration without parachutes; mass and fin cant default
+# to the config's
+def build_rocket(THANOS, mass=None, fin_cant=None):
+    changes = {}
+    if mass is not None:
+        changes["rocket"] = {"mass": mass}
+    if fin_cant is not None:
+        changes["surfaces"] = {"Fins": {"cant_angle": fin_cant}}
+    return make_rocket(merge_configs(NIMBUS_CONFIG, changes), THANOS)
+
+
+MARGE_MASS = 3.2 # payload mass with chute
+
+
+# nimbus after the payload separated, no motor, flies on its own parachutes
+# (an empty `parachutes` gives the chute failure case)
+def build_descent_rocket(mass=NIMBUS_CONFIG["rocket"]["mass"] - MARGE_MASS, parachutes=NIMBUS_PARACHUTES, rng=None):
+    NimbusDescent = Rocket(
+        radius = NIMBUS_CONFIG["rocket"]["radius"],
+        mass = mass,
+        inertia = (47.6, 47.6, 0.2487,
+                   -0.0003062, -0.09418, -0.02619),
+        power_off_drag = drag_curve(NIMBUS_CONFIG["rocket"]["power_off_drag"]),
+        power_on_drag = drag_curve(NIMBUS_CONFIG["rocket"]["power_on_drag"]),
+        center_of_mass_without_motor = 0,
+        coordinate_system_orientation = "tail_to_nose",
+    )
+    for parachute in parachutes:
+        parachute.add_to(NimbusDescent, rng)
+    return NimbusDescent
+
+
+# marge payload with its own drogue
+def build_marge(mass=MARGE_MASS, parachutes=MARGE_PARACHUTES, rng=None):
+    Marge = Rocket(
+        radius = 0.05,
+        mass = mass,
+        inertia = (0.1,0.1,0.001),
+        power_off_drag = 0.5,
+        power_on_drag = 0.5,
+        center_of_mass_without_motor = 0
+    )
+    for parachute in parachutes:
+        parachute.add_to(Marge, rng)
+    return Marge
+
+
+def scale_function(function, factor):
+    """Array based Function with its values multiplied by `factor`.
+
+    Unlike `function * factor` this keeps the interpolation and extrapolation
+    of the original, so a scaled thrust curve still drops to zero after
+    burn out.
+    """
+    source = np.array(function.source, dtype=float)
+    source[:, 1] *= factor
+    return Function(
+        source,
+        function.__inputs__,
+        function.__outputs__,
+        function.__interpolation__,
+        function.__extrapolation__,
+    )
+
+
+class RocketTemplate:
+    """Rocket (surfaces, drag curves, motor) built once, perturbed per sample.
+
+    `rocket` is a fully assembled Rocket without parachutes, `parachutes` a
+    list of ParachuteSpec. `perturb` returns an independent shallow copy
+    ready to fly; the template itself is never modified.
+    """
+
+    def __init__(self, rocket, parachutes=()):
+        self.rocket = rocket
+        self.parachutes = list(parachutes)
+
+    @classmethod
+    def nimbus(cls, THANOS, mass=None):
+        return cls(build_rocket(THANOS, mass), NIMBUS_PARACHUTES)
+
+    def perturb(self, mass=None, drag_factor=1.0, thrust_factor=1.0, rng=None):
+        rocket = copy.copy(self.rocket)
+
+        if mass is not None:
+            # a numpy scalar would turn the mass Functions into arrays
+            rocket.mass = float(mass)
+        if drag_factor != 1:
+            rocket.power_off_drag = scale_function(self.rocket.power_off_drag, drag_factor)
+            rocket.power_on_drag = scale_function(self.rocket.power_on_drag, drag_factor)
+        if thrust_factor != 1:
+            rocket.motor = copy.copy(self.rocket.motor)
+            rocket.motor.thrust = scale_function(self.rocket.motor.thrust, thrust_factor)
+
+        # `rng` (seed or Generator) makes the parachute noise repeatable
+        rocket.parachutes = []
+        for parachute in self.parachutes:
+            parachute.add_to(rocket, rng)
+
+        # only the quantities that depend on mass (and thrust) are refreshed,
+        # aerodynamic surfaces and motor positions are shared with the template
+        rocket.evaluate_dry_mass()
+        rocket.evaluate_total_mass()
+        rocket.evaluate_center_of_dry_mass()
+        rocket.evaluate_center_of_mass()
+        rocket.evaluate_dry_inertias()
+        rocket.evaluate_inertias()
+        rocket.evaluate_reduced_mass()
+        rocket.evaluate_thrust_to_weight()
+        rocket.evaluate_static_margin()
+        return rocket
+
+    def sample(self, setting, rng=None):
+        """Perturbed rocket for a monte carlo flight setting, `rng` seeds the parachute noise."""
+        return self.perturb(
+            mass=setting.get("rocketMass"),
+            drag_factor=setting.get("dragFactor", 1.0),
+            thrust_factor=setting.get("thrustFactor", 1.0),
+            rng=rng,
+        )
@@ -0,0 +1,214 @@
+# OpenRocket csv exports as typed numpy columns, with a binary cache
+#
+# OpenRocketPlotter.m read the exports (OpenRocket Sims/*.csv, all 54
+# variables, no comments) with readtable and renamed the columns by hand.
+# here the same 54 names are built in: a plain export gets them in order, an
+# export with its field description comment ("# Time (s),Altitude (m),...")
+# gets them by field name, so exports with fewer, more or reordered variables
+# load too (unknown fields keep a name made from their description, extra
+# unnamed columns are column_<n>). every value is a float, empty fields are
+# NaN, and the columns that are NaN all the way down (the roll and damping
+# coefficients of a 3-DoF export, ...) are dropped. flight event comments
+# ("# Event APOGEE occurred at t=20.9 seconds") are kept as events.
+#
+# values are in the units of the export (OpenRocket's defaults: g for the
+# masses, cm for cp/cg, mbar, degC, ...), nothing is converted.
+#
+# the parsed table is cached as an .npy of columns (plus a small json of names
+# and events) under the sha1 of the csv, and opened memory mapped, so loading
+# an export again costs the hash of the file.
+
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+
+OPENROCKET_CACHE_DIRECTORY = "openrocket_cache"
+
+# OpenRocketPlotter.m's names of the 54 exported variables, in export order
+OPENROCKET_COLUMNS = [
+    "time", "altitude", "vert_vel", "vert_acc", "tot_vel", "tot_acc", "pos_east", "pos_north", "lat_dist",
+    "lat_dir", "lat_vel", "lat_acc", "latitude", "longitude", "grav_acc", "aoa", "roll_rate", "pitch_rate",
+    "yaw_rate", "mass", "prop_mass", "longitudinal_moment_of_inertia", "rotational_moment_of_inertia", "cp", "cg",
+    "stability_margin", "mach", "re", "thrust", "drag", "cd", "axial_cd", "friction_cd", "pressure_cd", "base_cd",
+    "normal_force_coeff", "pitch_moment_coeff", "yaw_moment_coeff", "side_force_coeff", "roll_moment_coeff",
+    "roll_forcing_coeff", "roll_damping_coeff", "pitch_damping_coeff", "coriolis_coeff", "ref_length", "ref_area",
+    "zenith", "azimuth", "v_wind", "air_temp", "pressure_air", "speed_of_sound", "simulation_step_time",
+    "computation_time",
+]
+
+# OpenRocket's field descriptions (lower case, without the unit) of the same
+# variables, for exports written with the field description comment
+OPENROCKET_FIELDS = dict(
+    zip(
+        [
+            "time", "altitude", "vertical velocity", "vertical acceleration", "total velocity",
+            "total acceleration", "position east of launch", "position north of launch", "lateral distance",
+            "lateral direction", "lateral velocity", "lateral acceleration", "latitude", "longitude",
+            "gravitational acceleration", "angle of attack", "roll rate", "pitch rate", "yaw rate", "mass",
+            "propellant mass", "longitudinal moment of inertia", "rotational moment of inertia", "cp location",
+            "cg location", "stability margin calibers", "mach number", "reynolds number", "thrust", "drag force",
+            "drag coefficient", "axial drag coefficient", "friction drag coefficient", "pressure drag coefficient",
+            "base drag coefficient", "normal force coefficient", "pitch moment coefficient",
+            "yaw moment coefficient", "side force coefficient", "roll moment coefficient",
+            "roll forcing coefficient", "roll damping coefficient", "pitch damping coefficient",
+            "coriolis acceleration", "reference length", "reference area", "vertical orientation (zenith)",
+            "lateral orientation (azimuth)", "wind velocity", "air temperature", "air pressure", "speed of sound",
+            "simulation time step", "computation time",
+        ],
+        OPENROCKET_COLUMNS,
+    )
+)
+# older OpenRocket versions
+OPENROCKET_FIELDS["motor mass"] = "prop_mass"
+OPENROCKET_FIELDS["stability margin"] = "stability_margin"
+
+_event = re.compile(r"#\s*Event\s+(\w+)\s+occurred at t\s*=\s*([-+0-9.eE]+)")
+_unit = re.compile(r"\s*\([^()]*\)\s*$")
+
+
+def _column_names(fields, count):
+    # names of `count` columns, from the field description comment if any
+    names = []
+    for number in range(count):
+        if fields is None or number >= len(fields):
+            name = OPENROCKET_COLUMNS[number] if fields is None and number < len(OPENROCKET_COLUMNS) else None
+        else:
+            description = _unit.sub("", fields[number]).strip().lower()
+            name = OPENROCKET_FIELDS.get(description, re.sub(r"\W+", "_", description).strip("_") or None)
+        if name is None or name in names:
+            name = f"column_{number + 1}"
+        names.append(name)
+    return names
+
+
+def _parse_rows(lines, columns):
+    # floats of the data lines, one row per line. numpy parses them all in one
+    # go when no field is empty; otherwise one line at a time, short lines
+    # padded with NaN and long ones cut
+    try:
+        values = np.array(" ".join(lines).replace(",", " ").split(), dtype=float)
+    except ValueError:
+        values = np.empty(0)
+    if values.size == len(lines) * columns:
+        return values.reshape(len(lines), columns)
+
+    table = np.full((len(lines), columns), np.nan)
+    for row, line in enumerate(lines):
+        for number, field in enumerate(line.split(",")[:columns]):
+            try:
+                table[row, number] = float(field)
+            except ValueError:
+                pass
+    return table
+
+
+def parse_openrocket_csv(path):
+    """(names, columns x rows float array, events) of an OpenRocket csv export."""
+    fields, events, lines = None, {}, []
+    with open(path, "r", errors="replace") as csv_file:
+        for line in csv_file:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("#"):
+                event = _event.match(line)
+                if event:
+                    events.setdefault(event.group(1).lower(), float(event.group(2)))
+                elif fields is None and "," in line and "(" in line:
+                    fields = [field.strip() for field in line.lstrip("#").split(",")]
+                continue
+            lines.append(line)
+    if not lines:
+        raise ValueError(f"{path}: no data rows.")
+
+    count = max(len(fields) if fields else 0, max(line.count(",") for line in lines) + 1)
+    table = _parse_rows(lines, count).T
+    names = _column_names(fields, count)
+    # columns with no value at all
+    kept = ~np.isnan(table).all(axis=1)
+    return [name for name, keep in zip(names, kept) if keep], np.ascontiguousarray(table[kept]), events
+
+
+class OpenRocketExport:
+    """The columns of an OpenRocket csv export, by OpenRocketPlotter.m name.
+
+    export["altitude"] is a float array (a read only memory map when it came
+    from the cache); `columns` lists the columns kept and `events` maps the
+    flight events of the export (lower case) to their time in s.
+    """
+
+    def __init__(self, path, columns, data, events):
+        self.path = path
+        self.columns = list(columns)
+        self.data = data
+        self.events = dict(events)
+        self._index = {name: number for number, name in enumerate(self.columns)}
+
+    def __len__(self):
+        return self.data.shape[1]
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __getitem__(self, name):
+        try:
+            return self.data[self._index[name]]
+        except KeyError:
+            raise KeyError(f"{os.path.basename(self.path)} has no column {name!r} (all NaN or not exported).") from None
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+    def as_dict(self):
+        return {name: self.data[number] for number, name in enumerate(self.columns)}
+
+
+def load_openrocket(path, cache_directory=OPENROCKET_CACHE_DIRECTORY):
+    """OpenRocketExport of the csv at `path`.
+
+    The parsed columns are cached in `cache_directory` (None disables the
+    cache) under the hash of the file's content, so an edited or re-exported
+    csv is parsed again.
+    """
+    if cache_directory is None:
+        return OpenRocketExport(path, *parse_openrocket_csv(path))
+
+    with open(path, "rb") as csv_file:
+        digest = hashlib.sha1(csv_file.read()).hexdigest()
+    data_path = os.path.join(cache_directory, f"{digest}.npy")
+    header_path = os.path.join(cache_directory, f"{digest}.json")
+    # the header is written last, so it only exists next to complete data
+    if os.path.exists(header_path):
+        with open(header_path, "r") as header_file:
+            header = json.load(header_file)
+        data = np.load(data_path, mmap_mode="r")
+        if data.shape[0] == len(header["columns"]):
+            return OpenRocketExport(path, header["columns"], data, header["events"])
+
+    columns, data, events = parse_openrocket_csv(path)
+    os.makedirs(cache_directory, exist_ok=True)
+    temporary_path = data_path + ".tmp.npy"
+    np.save(temporary_path, data)
+    os.replace(temporary_path, data_path)
+    temporary_path = header_path + ".tmp"
+    with open(temporary_path, "w") as header_file:
+        json.dump({"source": os.path.basename(path), "columns": columns, "events": events}, header_file)
+    os.replace(temporary_path, header_path)
+    return OpenRocketExport(path, columns, np.load(data_path, mmap_mode="r"), events)
+
+
+if __name__ == "__main__":
+    import sys
+    from time import perf_counter
+
+    for path in sys.argv[1:]:
+        start_time = perf_counter()
+        export = load_openrocket(path)
+        print(
+            f"{path}: {len(export)} rows, {len(export.columns)} columns kept "
+            f"in {(perf_counter() - start_time) * 1e3:0.1f} ms"
+            + (f", events {export.events}" if export.events else "")
+        )
@@ -0,0 +1,182 @@
+# declarative parachute triggers
+#
+# every script used to copy the same trigger callables (`y[5] < 0 and
+# h < 450`). a Trigger describes the condition instead: after apogee, above a
+# descent rate, below an altitude AGL, above a pressure, each held for a
+# delay; all given conditions must be met. triggers and whole parachutes
+# (ParachuteSpec) are plain data, so they go to json and to worker processes,
+# which lambdas and closures cannot.
+#
+# rocketpy still asks the trigger at `sampling_rate` Hz during the flight, so
+# the scalar check is kept to a handful of comparisons. the same conditions
+# can be evaluated on whole arrays (`Trigger.evaluate`, `first_trigger`),
+# e.g. to find the trigger times along stored trajectories. the pressure
+# noise is drawn in batches from a per-flight generator instead of one
+# np.random call per sample, so a seeded flight also gets repeatable noise.
+
+import copy
+
+import numpy as np
+
+
+class Trigger:
+    """Ejection condition, all given (not None) conditions must hold.
+
+    `apogee`: vertical speed below zero; `descent_rate`: sinking at least
+    this fast (m/s); `altitude`: below this height AGL (m); `pressure`: above
+    this pressure (Pa), both as seen by the noisy sensor; `delay`: the
+    conditions have to hold for this long (s) before the trigger fires.
+    """
+
+    fields = ["apogee", "descent_rate", "altitude", "pressure", "delay"]
+
+    def __init__(self, apogee=False, descent_rate=None, altitude=None, pressure=None, delay=0.0):
+        self.apogee = apogee
+        self.descent_rate = descent_rate
+        self.altitude = altitude
+        self.pressure = pressure
+        self.delay = delay
+        # thresholds in the form the checks use, vz < max_vz
+        self.max_vz = -descent_rate if descent_rate is not None else (0.0 if apogee else np.inf)
+        self.max_altitude = np.inf if altitude is None else altitude
+        self.min_pressure = -np.inf if pressure is None else pressure
+        # per flight state, see `bind`
+        self.parachute = None
+        self.since = None
+
+    def __repr__(self):
+        arguments = ", ".join(f"{field}={value!r}" for field, value in self.to_dict().items())
+        return f"Trigger({arguments})"
+
+    def __eq__(self, other):
+        return isinstance(other, Trigger) and self.to_dict() == other.to_dict()
+
+    def __hash__(self):
+        return hash(tuple(self.to_dict().values()))
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.fields}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def bind(self, parachute):
+        """Fresh copy for one flight of `parachute`.
+
+        Delays need the time of each check, which rocketpy only passes to
+        the parachute's pressure signal, so the copy keeps the parachute.
+        """
+        trigger = copy.copy(self)
+        trigger.parachute = parachute
+        trigger.since = None
+        return trigger
+
+    def __call__(self, p, h, y):
+        # p = pressure considering parachute noise signal
+        # h = height above ground level considering parachute noise signal
+        # y = [x, y, z, vx, vy, vz, e0, e1, e2, e3, w1, w2, w3]
+        if y[5] < self.max_vz and h < self.max_altitude and p > self.min_pressure:
+            if not self.delay:
+                return True
+            t = self.parachute.clean_pressure_signal[-1][0]
+            if self.since is None:
+                self.since = t
+            return t - self.since >= self.delay
+        self.since = None
+        return False
+
+    def evaluate(self, p, h, vz):
+        """Conditions (without the delay) for arrays of pressure, height AGL and vz."""
+        return (np.asarray(vz) < self.max_vz) & (np.asarray(h) < self.max_altitude) & (np.asarray(p) > self.min_pressure)
+
+    def first_trigger(self, t, p, h, vz):
+        """Time the trigger fires along a sampled trajectory, None if it never does."""
+        t = np.asarray(t, dtype=float)
+        met = self.evaluate(p, h, vz)
+        # start time of the run of met samples each sample belongs to
+        starts = np.flatnonzero(met & ~np.concatenate(([False], met[:-1])))
+        if len(starts) == 0:
+            return None
+        run_start = np.full(len(t), np.nan)
+        run_start[starts] = t[starts]
+        run_start = np.fmax.accumulate(run_start)
+        fired = np.flatnonzero(met & (t - run_start >= self.delay))
+        return float(t[fired[0]]) if len(fired) else None
+
+
+class BatchedNoise:
+    """Pressure noise of one parachute, drawn `batch_size` values at a time.
+
+    Same process as rocketpy's own noise_function: normal(bias, deviation)
+    correlated with the previous sample by `correlation`.
+    """
+
+    def __init__(self, parachute, bias, deviation, correlation, rng=None, batch_size=1024):
+        self.parachute = parachute
+        self.bias = bias
+        self.deviation = deviation
+        self.alpha = correlation
+        self.beta = (1 - correlation**2) ** 0.5
+        self.rng = np.random.default_rng(rng)
+        self.batch_size = batch_size
+        self._batch = np.empty(0)
+        self._next = 0
+
+    def draw(self):
+        if self._next == len(self._batch):
+            self._batch = self.rng.normal(self.bias, self.deviation, self.batch_size)
+            self._next = 0
+        value = self._batch[self._next]
+        self._next += 1
+        return value
+
+    def __call__(self):
+        return self.alpha * self.parachute.noise_signal[-1][1] + self.beta * self.draw()
+
+
+class ParachuteSpec:
+    """Everything add_parachute needs, with a declarative Trigger."""
+
+    fields = ["name", "cd_s", "trigger", "sampling_rate", "lag", "noise"]
+
+    def __init__(self, name, cd_s, trigger, sampling_rate=100, lag=0, noise=(0, 0, 0)):
+        self.name = name
+        self.cd_s = cd_s
+        self.trigger = trigger if isinstance(trigger, Trigger) else Trigger.from_dict(trigger)
+        self.sampling_rate = sampling_rate
+        self.lag = lag
+        self.noise = tuple(noise)
+
+    def __repr__(self):
+        return f"ParachuteSpec({self.name!r}, cd_s={self.cd_s:0.4f}, trigger={self.trigger!r}, lag={self.lag})"
+
+    def to_dict(self):
+        data = {field: getattr(self, field) for field in self.fields}
+        data["trigger"] = self.trigger.to_dict()
+        data["noise"] = list(self.noise)
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def replace(self, **changes):
+        """Copy with some fields changed, e.g. spec.replace(lag=3.0)."""
+        return ParachuteSpec(**{**self.to_dict(), **changes})
+
+    def add_to(self, rocket, rng=None):
+        """Adds a fresh parachute (own trigger state and noise) to `rocket`."""
+        parachute = rocket.add_parachute(
+            self.name,
+            cd_s=self.cd_s,
+            trigger=self.trigger,
+            sampling_rate=self.sampling_rate,
+            lag=self.lag,
+            noise=self.noise,
+        )
+        parachute.trigger = parachute.triggerfunc = self.trigger.bind(parachute)
+        noise = BatchedNoise(parachute, *self.noise, rng=rng)
+        parachute.noise_function = noise
+        parachute.noise_signal = [[-1e-6, noise.draw()]]
+        return parachute
@@ -0,0 +1,308 @@
+# parameter sweeps over rocket, parachute and flight parameters
+#
+# the speed(mass) study in this_nimbus_works.py deep-copied the whole rocket
+# and re-ran every evaluate_* for each point, one point after the other.
+# here a sweep is a grid of named parameters (one or many, the full product
+# is flown) run on the monte carlo engine: every worker builds the
+# environment, motor and rocket once (see nimbus_template.RocketTemplate),
+# each point is only a cheap perturbation of that. points already flown are
+# kept in a cache file, so growing or refining a grid only flies what is new.
+# cached points are keyed by the vehicle too (the nimbus config, the files it
+# names and the code building it), so a changed rocket is flown again.
+#
+# parameters use the names of the monte carlo settings (rocketMass,
+# railLength, ...) and are registered with the @parameter decorator; the
+# metrics are the ones of flight_metrics.
+
+import hashlib
+import inspect
+import itertools
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
+from rocketpy import Flight
+
+import nimbus_template
+import vehicle_config
+from flight_metrics import METRICS, extract_metrics
+from flight_pipeline import environment_from_file
+from monte_carlo_engine import run_monte_carlo
+from nimbus_template import NIMBUS_CONFIG, NIMBUS_PARACHUTES, RocketTemplate, build_motor, build_rocket
+from parachute_triggers import Trigger
+
+# `stage` is what the parameter changes: "build" (build_rocket arguments,
+# needs a new rocket), "rocket" (RocketTemplate.perturb arguments),
+# "parachutes" (the list of ParachuteSpec) or "flight" (Flight arguments);
+# `apply(current, value)` returns the new arguments of that stage
+Parameter = namedtuple("Parameter", ["name", "stage", "apply"])
+
+# name -> Parameter
+PARAMETERS = {}
+
+
+def parameter(name, stage):
+    """Registers `apply(current, value)` as the sweep parameter `name`."""
+
+    def register(apply):
+        PARAMETERS[name] = Parameter(name, stage, apply)
+        return apply
+
+    return register
+
+
+@parameter("finCant", "build")
+def _fin_cant(arguments, value):
+    return {**arguments, "fin_cant": value}
+
+
+@parameter("rocketMass", "rocket")
+def _rocket_mass(arguments, value):
+    return {**arguments, "mass": value}
+
+
+@parameter("dragFactor", "rocket")
+def _drag_factor(arguments, value):
+    return {**arguments, "drag_factor": value}
+
+
+@parameter("thrustFactor", "rocket")
+def _thrust_factor(arguments, value):
+    return {**arguments, "thrust_factor": value}
+
+
+def _replace_parachute(parachutes, name, **changes):
+    return [parachute.replace(**changes) if parachute.name == name else parachute for parachute in parachutes]
+
+
+@parameter("mainAltitude", "parachutes")
+def _main_altitude(parachutes, value):
+    main = next(parachute for parachute in parachutes if parachute.name == "Main")
+    return _replace_parachute(parachutes, "Main", trigger=Trigger(**{**main.trigger.to_dict(), "altitude": value}))
+
+
+@parameter("mainLag", "parachutes")
+def _main_lag(parachutes, value):
+    return _replace_parachute(parachutes, "Main", lag=value)
+
+
+@parameter("railLength", "flight")
+def _rail_length(arguments, value):
+    return {**arguments, "rail_length": value}
+
+
+@parameter("inclination", "flight")
+def _inclination(arguments, value):
+    return {**arguments, "inclination": value}
+
+
+@parameter("heading", "flight")
+def _heading(arguments, value):
+    return {**arguments, "heading": value}
+
+
+def grid_points(grid):
+    """Every combination of the values in `grid` (name -> values), first name slowest."""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+
+
+def _point_arguments(point, base):
+    arguments = {
+        "build": {},
+        "rocket": {},
+        "parachutes": NIMBUS_PARACHUTES,
+        "flight": {"rail_length": 12, "inclination": 84, "heading": 133, "max_time": 600, **base},
+    }
+    for name, value in point.items():
+        parameter = PARAMETERS[name]
+        arguments[parameter.stage] = parameter.apply(arguments[parameter.stage], value)
+    return arguments
+
+
+def _file_sha1(path):
+    with open(path, "rb") as data_file:
+        return hashlib.sha1(data_file.read()).hexdigest()
+
+
+def vehicle_identity():
+    """sha1 of what the swept rocket is built from.
+
+    The nimbus config with the content of the files it names (thrust curve,
+    drag curves, airfoil) and the code that builds and perturbs it: editing
+    any of them invalidates the cached points.
+    """
+    digest = hashlib.sha1(vehicle_config.content_hash(NIMBUS_CONFIG).encode())
+    for module in (nimbus_template, vehicle_config):
+        digest.update(inspect.getsource(module).encode())
+    return digest.hexdigest()
+
+
+# worker side
+def setup_sweep(environment_arguments):
+    return {"Env": environment_from_file(*environment_arguments), "motor": build_motor(), "templates": {}}
+
+
+def point_seed(key):
+    """Seed of the parachute noise of the point with cache `key`."""
+    return int(hashlib.sha1(key.encode()).hexdigest()[:16], 16)
+
+
+def fly_point(context, setting):
+    point, base, metrics, seed = setting
+    arguments = _point_arguments(point, base)
+
+    # a new rocket only for build parameters, once per distinct value
+    build_key = tuple(sorted(arguments["build"].items()))
+    if build_key not in context["templates"]:
+        context["templates"][build_key] = build_rocket(context["motor"], **arguments["build"])
+    template = RocketTemplate(context["templates"][build_key], arguments["parachutes"])
+
+    flight = Flight(
+        # seeded per point, so the cached metrics are the ones a rerun gets
+        rocket=template.perturb(**arguments["rocket"], rng=np.random.default_rng(seed)),
+        environment=context["Env"],
+        **arguments["flight"],
+    )
+    return extract_metrics(flight, metrics)
+
+
+class SweepCache:
+    """Metrics of points already flown, one json line per point."""
+
+    def __init__(self, path):
+        self.path = path
+        self.results = {}
+        if path is not None and os.path.exists(path):
+            with open(path, "r") as cache_file:
+                for line in cache_file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.results[entry["key"]] = entry["result"]
+
+    @staticmethod
+    def key(point, base, environment, vehicle, seed):
+        return json.dumps(
+            {"point": point, "base": base, "environment": environment, "vehicle": vehicle, "seed": seed},
+            sort_keys=True,
+            default=float,
+        )
+
+    def get(self, key, metrics):
+        result = self.results.get(key)
+        if result is None or any(metric not in result for metric in metrics):
+            return None
+        return result
+
+    def add(self, key, result):
+        self.results[key] = {**self.results.get(key, {}), **result}
+        if self.path is not None:
+            with open(self.path, "a") as cache_file:
+                cache_file.write(json.dumps({"key": key, "result": self.results[key]}, default=float) + "\n")
+
+
+class SweepResult:
+    """Table of a sweep: one row per point, parameter and metric columns.
+
+    For grids, `array(metric)` gives the metric shaped like the grid
+    (first parameter along the first axis).
+    """
+
+    def __init__(self, grid, points, results, metrics):
+        self.grid = grid
+        self.parameters = list(dict.fromkeys(name for point in points for name in point))
+        self.metrics = list(metrics)
+        self.columns = {
+            name: np.array([point.get(name, np.nan) for point in points], dtype=float) for name in self.parameters
+        }
+        for metric in self.metrics:
+            self.columns[metric] = np.array(
+                [np.nan if result is None else result[metric] for result in results], dtype=float
+            )
+        self.failed = [point for point, result in zip(points, results) if result is None]
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def array(self, metric):
+        if self.grid is None:
+            raise ValueError("The sweep was given a list of points, not a grid.")
+        return self.columns[metric].reshape([len(values) for values in self.grid.values()])
+
+
+def sweep(
+    grid,
+    metrics=("apogeeAltitude",),
+    atmosphere_file=None,
+    environment=None,
+    site=(39.232292, -8.172027, 160),
+    date=None,
+    base=None,
+    seed=0,
+    workers=None,
+    cache="sweep_cache.jsonl",
+):
+    """Flies every point of `grid` and returns a SweepResult of `metrics`.
+
+    `grid` maps parameter names (see PARAMETERS) to their values, all
+    combinations are flown; a list of point dicts flies just those. `base`
+    holds fixed Flight arguments (e.g. terminate_on_apogee=True). The
+    workers fly the site and launch date of `environment` (a rocketpy
+    Environment, e.g. the one `atmosphere_file` was saved from), or else
+    `site` (latitude, longitude, elevation) on `date`, with the atmosphere of
+    the local profile `atmosphere_file`. The parachute noise of every point
+    is seeded from `seed` and the point. Points already in the `cache` file
+    (None disables it) are not flown again; failed points get NaN metrics
+    and are listed in `failed`.
+    """
+    if atmosphere_file is None:
+        raise ValueError("Sweeps run offline, pass a local atmosphere profile (see atmosphere_cache).")
+    points = grid_points(grid) if isinstance(grid, dict) else [dict(point) for point in grid]
+    unknown = {name for point in points for name in point} - set(PARAMETERS)
+    if unknown:
+        raise ValueError(f"Unknown sweep parameters {sorted(unknown)}, choose from {sorted(PARAMETERS)}.")
+    unknown = set(metrics) - set(METRICS)
+    if unknown:
+        raise ValueError(f"Unknown metrics {sorted(unknown)}.")
+    if environment is not None:
+        site = (environment.latitude, environment.longitude, environment.elevation)
+        if environment.datetime_date is not None:
+            # utc, as environment_from_file sets it
+            date = tuple(environment.datetime_date.timetuple()[:4])
+    if date is None:
+        raise ValueError("Pass the launch date, or an environment with its date set.")
+
+    base = dict(base or {})
+    metrics = list(metrics)
+    environment_arguments = (*site, tuple(date), os.path.abspath(atmosphere_file))
+    cache = SweepCache(cache)
+    # the profile's content, not its path, identifies the atmosphere
+    environment_key = [*site, *date, _file_sha1(atmosphere_file)]
+    vehicle = vehicle_identity()
+    keys = [SweepCache.key(point, base, environment_key, vehicle, seed) for point in points]
+
+    results = [cache.get(key, metrics) for key in keys]
+    pending = [position for position, result in enumerate(results) if result is None]
+    if pending:
+        for sample in run_monte_carlo(
+            setup_sweep,
+            fly_point,
+            [(points[position], base, metrics, point_seed(keys[position])) for position in pending],
+            len(pending),
+            workers=workers,
+            setup_args=(environment_arguments,),
+            indices=pending,
+        ):
+            if sample.error is None:
+                results[sample.index] = sample.result
+                cache.add(keys[sample.index], sample.result)
+            else:
+                print(f"Sweep point {points[sample.index]} failed: {sample.error}")
+
+    return SweepResult(grid if isinstance(grid, dict) else None, points, results, metrics)
@@ -0,0 +1,204 @@
+# columnar binary store for monte carlo results
+#
+# a store is a directory holding one raw little-endian binary file per column
+# plus a small schema.json. rows are only ever appended, so every column file
+# just grows, and the analysis side can np.memmap each column straight into a
+# numpy array without parsing anything (no more str(dict) + eval).
+
+import ast
+import json
+import os
+
+import numpy as np
+
+from flight_metrics import METRICS
+
+# status column values
+OK = 0
+FAILED = 1
+
+# dispersed input parameters (keys of `analysis_parameters`)
+INPUT_COLUMNS = [
+    ("rocketMass", "<f8"),
+    ("inclination", "<f8"),
+    ("heading", "<f8"),
+    ("railLength", "<f8"),
+    ("dragFactor", "<f8"),
+    ("thrustFactor", "<f8"),
+]
+
+# flight metrics exported for every successful sample, one per registered
+# metric (see flight_metrics.py) plus the time the sample took
+OUTPUT_COLUMNS = [(name, metric.dtype) for name, metric in METRICS.items()] + [
+    ("executionTime", "<f8"),
+]
+
+MONTE_CARLO_SCHEMA = [("index", "<i8"), ("status", "<u1")] + INPUT_COLUMNS + OUTPUT_COLUMNS
+
+SCHEMA_FILE = "schema.json"
+
+
+def _column_file(path, name):
+    return os.path.join(path, name + ".bin")
+
+
+def _fill_value(dtype):
+    # what a column holds when a row does not provide it (e.g. failed runs)
+    return np.nan if np.dtype(dtype).kind == "f" else 0
+
+
+def read_schema(path):
+    with open(os.path.join(path, SCHEMA_FILE), "r") as schema_file:
+        return [tuple(column) for column in json.load(schema_file)["columns"]]
+
+
+class ResultStore:
+    """Append-only columnar result file.
+
+    Rows are dicts keyed by column name; columns missing from a row are
+    filled with NaN (integers with 0), unknown keys raise a KeyError so a
+    typo in a metric name cannot silently disappear. Rows are buffered and
+    written `buffer_size` at a time, call `flush`/`close` (or use it as a
+    context manager) to get everything on disk.
+    """
+
+    def __init__(self, path, schema=MONTE_CARLO_SCHEMA, overwrite=False, buffer_size=256):
+        self.path = path
+        self.buffer_size = buffer_size
+        self._buffer = []
+
+        if overwrite and os.path.isdir(path):
+            for file_name in os.listdir(path):
+                if file_name.endswith(".bin") or file_name == SCHEMA_FILE:
+                    os.remove(os.path.join(path, file_name))
+
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(os.path.join(path, SCHEMA_FILE)):
+            stored_schema = read_schema(path)
+            if stored_schema != [tuple(column) for column in schema]:
+                raise ValueError(
+                    f"Schema of {path} does not match, open it with overwrite=True to replace it."
+                )
+        else:
+            with open(os.path.join(path, SCHEMA_FILE), "w") as schema_file:
+                json.dump({"columns": [list(column) for column in schema]}, schema_file, indent=1)
+
+        self.schema = [tuple(column) for column in schema]
+        self.names = [name for name, _ in self.schema]
+        # drop the tail of a row that was only partly written before a crash
+        self.truncate(_stored_rows(path, self.schema))
+
+    def __len__(self):
+        return self._stored_rows + len(self._buffer)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, row):
+        unknown = set(row) - set(self.names)
+        if unknown:
+            raise KeyError(f"Columns not in the result schema: {sorted(unknown)}")
+        self._buffer.append(row)
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def append_columns(self, columns):
+        """Appends many rows at once, given as equally long arrays per column."""
+        unknown = set(columns) - set(self.names)
+        if unknown:
+            raise KeyError(f"Columns not in the result schema: {sorted(unknown)}")
+        rows = {len(values) for values in columns.values()}
+        if len(rows) > 1:
+            raise ValueError("All columns must have the same length.")
+        rows = rows.pop() if rows else 0
+
+        self.flush()
+        for name, dtype in self.schema:
+            with open(_column_file(self.path, name), "ab") as column_file:
+                if name in columns:
+                    column = np.asarray(columns[name], dtype=dtype)
+                else:
+                    column = np.full(rows, _fill_value(dtype), dtype=dtype)
+                column.tofile(column_file)
+        self._stored_rows += rows
+
+    def flush(self, sync=False):
+        """Writes the buffered rows, with sync=True the columns are also fsync'ed."""
+        for name, dtype in self.schema:
+            with open(_column_file(self.path, name), "ab") as column_file:
+                if self._buffer:
+                    fill = _fill_value(dtype)
+                    column = np.array([row.get(name, fill) for row in self._buffer], dtype=dtype)
+                    column.tofile(column_file)
+                if sync:
+                    column_file.flush()
+                    os.fsync(column_file.fileno())
+        self._stored_rows += len(self._buffer)
+        self._buffer = []
+
+    def truncate(self, rows):
+        """Cuts every column back to `rows` rows, dropping anything buffered."""
+        self._buffer = []
+        for name, dtype in self.schema:
+            file_path = _column_file(self.path, name)
+            with open(file_path, "ab") as column_file:
+                column_file.truncate(rows * np.dtype(dtype).itemsize)
+        self._stored_rows = rows
+
+    def close(self):
+        self.flush()
+
+
+def _stored_rows(path, schema):
+    # the shortest column decides, a half written row is ignored
+    rows = []
+    for name, dtype in schema:
+        file_path = _column_file(path, name)
+        size = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+        rows.append(size // np.dtype(dtype).itemsize)
+    return min(rows) if rows else 0
+
+
+def load_results(path, mmap=True):
+    """Returns {column name: numpy array} for every column of the store.
+
+    With mmap=True the arrays are read-only memory maps of the column files,
+    so even very large campaigns load instantly and only the pages actually
+    used are read.
+    """
+    schema = read_schema(path)
+    rows = _stored_rows(path, schema)
+    results = {}
+    for name, dtype in schema:
+        if rows == 0:
+            results[name] = np.empty(0, dtype=dtype)
+        elif mmap:
+            results[name] = np.memmap(_column_file(path, name), dtype=dtype, mode="r", shape=(rows,))
+        else:
+            results[name] = np.fromfile(_column_file(path, name), dtype=dtype, count=rows)
+    return results
+
+
+def import_text_results(prefix, path):
+    """Converts the old `<prefix>.disp_*.txt` files into a result store.
+
+    Lines are parsed with ast.literal_eval, so nothing in them is executed.
+    """
+    with ResultStore(path, overwrite=True) as store:
+        index = 0
+        with open(prefix + ".disp_inputs.txt") as inputs, open(prefix + ".disp_outputs.txt") as outputs:
+            for setting_line, result_line in zip(inputs, outputs):
+                if setting_line[0] != "{" or result_line[0] != "{":
+                    continue
+                row = {**ast.literal_eval(setting_line), **ast.literal_eval(result_line)}
+                store.append({"index": index, "status": OK, **row})
+                index += 1
+        with open(prefix + ".disp_errors.txt") as errors:
+            for setting_line in errors:
+                if setting_line[0] != "{":
+                    continue
+                store.append({"index": index, "status": FAILED, **ast.literal_eval(setting_line)})
+                index += 1
@@ -0,0 +1,171 @@
+# samplers for the dispersed flight settings and a convergence stopping rule
+#
+# all samplers use the same marginals as `analysis_parameters` always has:
+# (mean, std) tuples are normal, lists are a uniform choice. the quasi monte
+# carlo (sobol, halton) and latin hypercube samplers spread the points much
+# more evenly over the input space than independent draws, so means and
+# dispersion ellipses settle with far fewer flights. every sampler is
+# addressable by sample index so resumed and extended campaigns stay
+# consistent.
+
+import numpy as np
+from scipy.stats import norm, qmc
+
+from streaming_stats import ellipse_axes
+
+# keeps norm.ppf finite
+_EPSILON = 1e-12
+
+
+def settings_from_unit(analysis_parameters, points):
+    """Maps points of the unit hypercube (one column per parameter) to settings."""
+    points = np.clip(points, _EPSILON, 1 - _EPSILON)
+    for point in points:
+        flight_setting = {}
+        for u, (parameter_key, parameter_value) in zip(point, analysis_parameters.items()):
+            if type(parameter_value) is tuple:
+                flight_setting[parameter_key] = float(norm.ppf(u, *parameter_value))
+            else:
+                flight_setting[parameter_key] = parameter_value[int(u * len(parameter_value))]
+        yield flight_setting
+
+
+class RandomSampler:
+    """Independent draws, every sample from its own seeded generator."""
+
+    def __init__(self, analysis_parameters, seed):
+        self.analysis_parameters = analysis_parameters
+        self.seed = seed
+
+    def settings(self, indices):
+        for index in indices:
+            rng = np.random.default_rng([self.seed, index])
+            flight_setting = {}
+            for parameter_key, parameter_value in self.analysis_parameters.items():
+                if type(parameter_value) is tuple:
+                    flight_setting[parameter_key] = rng.normal(*parameter_value)
+                else:
+                    flight_setting[parameter_key] = rng.choice(parameter_value)
+            yield flight_setting
+
+
+class QuasiRandomSampler:
+    """Scrambled Sobol or Halton sequence, sample i is point i of the sequence."""
+
+    engines = {"sobol": qmc.Sobol, "halton": qmc.Halton}
+
+    def __init__(self, analysis_parameters, seed, method="sobol"):
+        self.analysis_parameters = analysis_parameters
+        self.seed = seed
+        self.method = method
+
+    def unit_points(self, indices):
+        indices = np.asarray(list(indices), dtype=int)
+        if len(indices) == 0:
+            return np.empty((0, len(self.analysis_parameters)))
+        engine = self.engines[self.method](len(self.analysis_parameters), seed=self.seed)
+        # whole powers of two keep sobol balanced (and quiet)
+        number = 2 ** int(np.ceil(np.log2(indices.max() + 1)))
+        return engine.random(number)[indices]
+
+    def settings(self, indices):
+        return settings_from_unit(self.analysis_parameters, self.unit_points(indices))
+
+
+class LatinHypercubeSampler:
+    """Latin hypercube designs of `block_size` samples each.
+
+    A latin hypercube cannot grow one point at a time, so samples are
+    grouped in blocks (index // block_size) and each block is its own
+    stratified design; extending a campaign adds new blocks.
+    """
+
+    def __init__(self, analysis_parameters, seed, block_size=1024):
+        self.analysis_parameters = analysis_parameters
+        self.seed = seed
+        self.block_size = block_size
+
+    def unit_points(self, indices):
+        indices = np.asarray(list(indices), dtype=int)
+        points = np.empty((len(indices), len(self.analysis_parameters)))
+        for block in np.unique(indices // self.block_size):
+            engine = qmc.LatinHypercube(len(self.analysis_parameters), seed=np.random.default_rng([self.seed, block]))
+            design = engine.random(self.block_size)
+            in_block = indices // self.block_size == block
+            points[in_block] = design[indices[in_block] % self.block_size]
+        return points
+
+    def settings(self, indices):
+        return settings_from_unit(self.analysis_parameters, self.unit_points(indices))
+
+
+SAMPLERS = ["random", "sobol", "halton", "lhs"]
+
+
+def make_sampler(method, analysis_parameters, seed):
+    if method == "random":
+        return RandomSampler(analysis_parameters, seed)
+    if method in ("sobol", "halton"):
+        return QuasiRandomSampler(analysis_parameters, seed, method)
+    if method == "lhs":
+        return LatinHypercubeSampler(analysis_parameters, seed)
+    raise ValueError(f"Unknown sampling method {method}, choose one of {SAMPLERS}.")
+
+
+# statistics the stopping rule can watch, computed from a CampaignMonitor
+def _ellipse(covariance):
+    width, height, _ = ellipse_axes(covariance.covariance)
+    return [width, height]
+
+
+CONVERGENCE_STATISTICS = {
+    "apogeeMean": lambda monitor: [monitor.stats["apogeeAltitude"].mean],
+    "apogeeStd": lambda monitor: [monitor.stats["apogeeAltitude"].std],
+    "impactMean": lambda monitor: list(monitor.impact.mean),
+    "apogeeEllipse": lambda monitor: _ellipse(monitor.apogee),
+    "impactEllipse": lambda monitor: _ellipse(monitor.impact),
+}
+
+
+class StoppingRule:
+    """Stops a campaign once the watched statistics stop moving.
+
+    Every `check_every` samples the statistics are recomputed; the campaign
+    has converged when, for `patience` checks in a row, none of them changed
+    by more than `tolerance` relative to its value (and at least
+    `min_samples` successful flights are in). `update(monitor)` returns True
+    when it is time to stop.
+    """
+
+    def __init__(
+        self,
+        statistics=("apogeeMean", "impactEllipse"),
+        tolerance=0.01,
+        check_every=50,
+        patience=3,
+        min_samples=100,
+    ):
+        unknown = set(statistics) - set(CONVERGENCE_STATISTICS)
+        if unknown:
+            raise ValueError(f"Unknown convergence statistics: {sorted(unknown)}")
+        self.statistics = statistics
+        self.tolerance = tolerance
+        self.check_every = check_every
+        self.patience = patience
+        self.min_samples = min_samples
+        self.previous = None
+        self.stable_checks = 0
+        self.last_change = np.inf
+
+    def update(self, monitor):
+        successful = monitor.impact.count
+        if successful < self.min_samples or monitor.completed % self.check_every != 0:
+            return False
+
+        values = np.concatenate([CONVERGENCE_STATISTICS[name](monitor) for name in self.statistics])
+        if self.previous is not None:
+            scale = np.maximum(np.abs(values), np.finfo(float).tiny)
+            self.last_change = float(np.nanmax(np.abs(values - self.previous) / scale))
+            self.stable_checks = self.stable_checks + 1 if self.last_change < self.tolerance else 0
+        self.previous = values
+        return self.stable_checks >= self.patience
@@ -0,0 +1,264 @@
+# online statistics for monte carlo campaigns
+#
+# everything here is updated one sample at a time in O(1) memory (welford
+# updates), so a campaign can be watched while it runs: means, standard
+# deviations, min/max, the apogee and impact covariances with their 1/2/3
+# sigma ellipses, plus progress, throughput, time remaining and failures
+# grouped by cause. partial results (e.g. from a resumed campaign or another
+# process) can be merged.
+
+from time import perf_counter
+
+import numpy as np
+
+
+class RunningStats:
+    """Count, mean, variance, min and max of a stream of values.
+
+    NaNs (e.g. metrics of failed samples) are skipped. `std` is the
+    population standard deviation, same as np.std.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def update(self, value):
+        value = float(value)
+        if value != value:
+            return
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def update_array(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        batch = RunningStats()
+        batch.count = len(values)
+        batch.mean = float(np.mean(values))
+        batch.m2 = float(np.sum((values - batch.mean) ** 2))
+        batch.min = float(np.min(values))
+        batch.max = float(np.max(values))
+        self.merge(batch)
+
+    def merge(self, other):
+        """Combines the statistics of another stream into this one."""
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta**2 * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def variance(self):
+        return self.m2 / self.count if self.count > 0 else np.nan
+
+    @property
+    def std(self):
+        return self.variance**0.5
+
+    @property
+    def standard_error(self):
+        # uncertainty of the mean itself, handy to judge convergence
+        return self.std / self.count**0.5 if self.count > 0 else np.nan
+
+
+class RunningCovariance:
+    """Mean and 2x2 covariance of a stream of (x, y) points."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = np.zeros(2)
+        self.comoment = np.zeros((2, 2))
+
+    def update(self, x, y):
+        point = np.array([x, y], dtype=float)
+        if np.isnan(point).any():
+            return
+        self.count += 1
+        delta = point - self.mean
+        self.mean += delta / self.count
+        self.comoment += np.outer(delta, point - self.mean)
+
+    def update_array(self, x, y):
+        points = np.column_stack((x, y)).astype(float)
+        points = points[~np.isnan(points).any(axis=1)]
+        if len(points) == 0:
+            return
+        batch = RunningCovariance()
+        batch.count = len(points)
+        batch.mean = points.mean(axis=0)
+        centred = points - batch.mean
+        batch.comoment = centred.T @ centred
+        self.merge(batch)
+
+    def merge(self, other):
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.comoment += other.comoment + np.outer(delta, delta) * self.count * other.count / count
+        self.mean += delta * other.count / count
+        self.count = count
+
+    @property
+    def covariance(self):
+        # sample covariance, same as np.cov(x, y)
+        if self.count < 2:
+            return np.full((2, 2), np.nan)
+        return self.comoment / (self.count - 1)
+
+    def ellipses(self, sigmas=(1, 2, 3)):
+        """Dispersion ellipses as dicts of matplotlib Ellipse arguments."""
+        width, height, angle = ellipse_axes(self.covariance)
+        return [
+            {"xy": tuple(self.mean), "width": width * j, "height": height * j, "angle": angle}
+            for j in sigmas
+        ]
+
+
+def ellipse_axes(cov):
+    """1 sigma ellipse (full width, full height, angle in degrees) of a 2x2 covariance."""
+    if np.isnan(cov).any():
+        return np.nan, np.nan, np.nan
+    vals, vecs = np.linalg.eigh(cov)
+    order = vals.argsort()[::-1]
+    vals, vecs = vals[order], vecs[:, order]
+    angle = np.degrees(np.arctan2(*vecs[:, 0][::-1]))
+    width, height = 2 * np.sqrt(np.clip(vals, 0, None))
+    return width, height, angle
+
+
+def failure_cause(failure):
+    """Groups failure entries (see monte_carlo_engine.failure_entry) by type and phase."""
+    phase = failure.get("phase")
+    return f"{failure['type']} during {phase}" if phase else failure["type"]
+
+
+class FailureCause:
+    """Count, first sample, simulated and wall time of one failure cause."""
+
+    def __init__(self, first_index=None):
+        self.count = 0
+        self.first_index = first_index
+        self.time = RunningStats()
+        self.wall_time = RunningStats()
+
+    def update(self, failure):
+        self.count += 1
+        self.time.update(failure.get("time", np.nan))
+        self.wall_time.update(failure.get("wall_time", np.nan))
+
+
+class CampaignMonitor:
+    """Live statistics and progress of a monte carlo campaign.
+
+    Feed it every finished sample with `update(result)` (`result` is None for
+    failed samples, whose failure entries go to `update_failure`). `metrics`
+    are the result keys to keep statistics for.
+    """
+
+    def __init__(self, metrics, total_number, completed=0):
+        self.stats = {metric: RunningStats() for metric in metrics}
+        self.apogee = RunningCovariance()
+        self.impact = RunningCovariance()
+        self.total_number = total_number
+        # samples done before this run started (resumed campaigns) count for
+        # progress but not for the throughput
+        self.completed_before = completed
+        self.completed = 0
+        self.failed = 0
+        # failure cause -> FailureCause, earlier runs included
+        self.failures = {}
+        self.start_time = perf_counter()
+
+    def update(self, result):
+        self.completed += 1
+        if result is None:
+            self.failed += 1
+            return
+        for metric, stats in self.stats.items():
+            if metric in result:
+                stats.update(result[metric])
+        self.apogee.update(result["apogeeX"], result["apogeeY"])
+        self.impact.update(result["impactX"], result["impactY"])
+
+    def update_from_results(self, results, successful):
+        """Adds already stored results (columns as returned by load_results)."""
+        for metric, stats in self.stats.items():
+            stats.update_array(results[metric][successful])
+        self.apogee.update_array(results["apogeeX"][successful], results["apogeeY"][successful])
+        self.impact.update_array(results["impactX"][successful], results["impactY"][successful])
+
+    def update_failure(self, failure):
+        """Counts a failure entry, returns True the first time its cause shows up."""
+        cause = failure_cause(failure)
+        new = cause not in self.failures
+        if new:
+            self.failures[cause] = FailureCause(failure.get("index"))
+        self.failures[cause].update(failure)
+        return new
+
+    @property
+    def elapsed(self):
+        return perf_counter() - self.start_time
+
+    @property
+    def throughput(self):
+        """Samples per second in this run."""
+        return self.completed / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def remaining_time(self):
+        remaining = self.total_number - self.completed_before - self.completed
+        return remaining / self.throughput if self.throughput > 0 else np.inf
+
+    def progress(self):
+        done = self.completed_before + self.completed
+        apogee = self.stats.get("apogeeAltitude")
+        line = (
+            f"{done:06d}/{self.total_number:06d} | failed: {self.failed} | "
+            f"{self.throughput:0.2f} runs/s | ETA: {self.remaining_time:0.0f} s"
+        )
+        if self.failures:
+            cause, failures = max(self.failures.items(), key=lambda item: item[1].count)
+            line += f" ({failures.count}x {cause})"
+        if apogee is not None and apogee.count > 0:
+            line += f" | apogee: {apogee.mean:0.1f} ± {apogee.std:0.1f} m"
+        if self.impact.count > 1:
+            width, height, _ = ellipse_axes(self.impact.covariance)
+            line += f" | impact 1σ axes: {width:0.0f} x {height:0.0f} m"
+        return line
+
+    def summary(self):
+        lines = []
+        for metric, stats in self.stats.items():
+            lines.append(
+                f"{metric:>24s} - mean: {stats.mean:0.3f}, std: {stats.std:0.3f}, "
+                f"min: {stats.min:0.3f}, max: {stats.max:0.3f} (n = {stats.count})"
+            )
+        for name, cov in (("apogee", self.apogee), ("impact", self.impact)):
+            for sigma, ellipse in zip((1, 2, 3), cov.ellipses()):
+                lines.append(
+                    f"{name} {sigma} sigma ellipse - centre: ({ellipse['xy'][0]:0.1f}, {ellipse['xy'][1]:0.1f}) m, "
+                    f"axes: {ellipse['width']:0.1f} x {ellipse['height']:0.1f} m, angle: {ellipse['angle']:0.1f} deg"
+                )
+        for cause, failures in sorted(self.failures.items(), key=lambda item: -item[1].count):
+            line = f"failed {failures.count}x - {cause}, first in sample {failures.first_index}"
+            if failures.time.count > 0:
+                line += f", at t = {failures.time.mean:0.2f} s on average"
+            lines.append(line + f", {failures.wall_time.mean:0.1f} s of wall time on average")
+        return "\n".join(lines)
@@ -0,0 +1,240 @@
+# surrogate model of the monte carlo campaigns
+#
+# a polynomial chaos expansion maps the dispersed inputs (the keys of
+# `analysis_parameters`) to apogee and impact outputs. normal inputs get
+# hermite polynomials of their standardised value, uniform choices legendre
+# polynomials on [-1, 1], up to a total degree. the coefficients are a
+# (ridge) least squares fit on the successful flights of a result store, so
+# a prediction is one small matrix product and a whole batch of queries
+# takes microseconds. every prediction comes with the standard deviation of
+# the regression's prediction interval, and the fit reports its error on
+# flights held out of the training set.
+
+import itertools
+import json
+from datetime import datetime
+
+import numpy as np
+
+from result_store import OK, load_results
+
+SURROGATE_OUTPUTS = ["apogeeAltitude", "apogeeX", "apogeeY", "impactX", "impactY", "impactVelocity"]
+
+
+def _hermite(z, degree):
+    # probabilists' hermite polynomials, orthogonal for standard normal z
+    values = [np.ones_like(z), z]
+    for n in range(1, degree):
+        values.append(z * values[n] - n * values[n - 1])
+    return values[: degree + 1]
+
+
+def _legendre(z, degree):
+    values = [np.ones_like(z), z]
+    for n in range(1, degree):
+        values.append(((2 * n + 1) * z * values[n] - n * values[n - 1]) / (n + 1))
+    return values[: degree + 1]
+
+
+def _input_scaling(analysis_parameters):
+    # (kind, centre, scale) per input, normal (mean, std) tuples or uniform lists
+    scaling = []
+    for parameter_value in analysis_parameters.values():
+        if type(parameter_value) is tuple:
+            scaling.append(("normal", float(parameter_value[0]), float(parameter_value[1])))
+        else:
+            low, high = float(min(parameter_value)), float(max(parameter_value))
+            scaling.append(("uniform", (low + high) / 2, max((high - low) / 2, np.finfo(float).tiny)))
+    return scaling
+
+
+class PolynomialChaosSurrogate:
+    """Polynomial chaos regression from flight settings to flight outputs.
+
+    `inputs` are the setting names and `scaling` their (kind, centre, scale)
+    as made from `analysis_parameters` (see from_analysis_parameters).
+    `predict(X)` returns the mean and the standard deviation of every output
+    for a batch of settings (one row each, columns in `inputs` order).
+    """
+
+    def __init__(self, inputs, scaling, outputs=SURROGATE_OUTPUTS, degree=3, ridge=1e-8):
+        self.inputs = list(inputs)
+        self.scaling = [tuple(entry) for entry in scaling]
+        self.outputs = list(outputs)
+        self.degree = degree
+        self.ridge = ridge
+        # multi-indices of total degree <= degree, constant term first
+        self.terms = np.array(
+            [alpha for alpha in itertools.product(range(degree + 1), repeat=len(self.inputs)) if sum(alpha) <= degree]
+        )
+        self.coefficients = None
+        self.covariance = None
+        self.residual_std = None
+        self.validation = {}
+        self.metadata = {}
+
+    @classmethod
+    def from_analysis_parameters(cls, analysis_parameters, outputs=SURROGATE_OUTPUTS, degree=3, ridge=1e-8):
+        return cls(list(analysis_parameters), _input_scaling(analysis_parameters), outputs, degree, ridge)
+
+    def basis(self, X):
+        """Design matrix (one column per polynomial term) of a batch of settings."""
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        polynomials = np.empty((len(X), len(self.inputs), self.degree + 1))
+        for j, (kind, centre, scale) in enumerate(self.scaling):
+            z = (X[:, j] - centre) / scale
+            family = _hermite if kind == "normal" else _legendre
+            polynomials[:, j, :] = np.stack(family(z, self.degree), axis=1)
+        return np.prod(polynomials[:, np.arange(len(self.inputs)), self.terms], axis=2)
+
+    def fit(self, X, Y):
+        Phi = self.basis(X)
+        Y = np.asarray(Y, dtype=float)
+        if len(Phi) <= len(self.terms):
+            raise ValueError(
+                f"{len(Phi)} flights are not enough for {len(self.terms)} terms, lower the degree or run more samples."
+            )
+        normal_matrix = Phi.T @ Phi + self.ridge * np.eye(len(self.terms))
+        self.covariance = np.linalg.inv(normal_matrix)
+        self.coefficients = self.covariance @ (Phi.T @ Y)
+        residuals = Y - Phi @ self.coefficients
+        self.residual_std = np.sqrt(np.sum(residuals**2, axis=0) / (len(Phi) - len(self.terms)))
+        return self
+
+    def predict(self, X):
+        """Mean and standard deviation (prediction interval) of every output."""
+        Phi = self.basis(X)
+        mean = Phi @ self.coefficients
+        leverage = np.sum((Phi @ self.covariance) * Phi, axis=1)
+        std = np.sqrt(1 + leverage)[:, None] * self.residual_std
+        return mean, std
+
+    def predict_settings(self, settings):
+        """Like predict, for a list of setting dicts; returns a dict per setting."""
+        mean, std = self.predict([[setting[name] for name in self.inputs] for setting in settings])
+        return [
+            {output: (mean[i, k], std[i, k]) for k, output in enumerate(self.outputs)}
+            for i in range(len(settings))
+        ]
+
+    def validate(self, X, Y):
+        """Error on flights not used in the fit, per output."""
+        Y = np.asarray(Y, dtype=float)
+        mean, std = self.predict(X)
+        error = mean - Y
+        self.validation = {"flights": len(Y)}
+        for k, output in enumerate(self.outputs):
+            self.validation[output] = {
+                "rmse": float(np.sqrt(np.mean(error[:, k] ** 2))),
+                "mae": float(np.mean(np.abs(error[:, k]))),
+                "max": float(np.max(np.abs(error[:, k]))),
+                "r2": float(1 - np.sum(error[:, k] ** 2) / np.sum((Y[:, k] - Y[:, k].mean()) ** 2)),
+                # share of the held out flights inside the 95 % interval
+                "coverage95": float(np.mean(np.abs(error[:, k]) <= 1.96 * std[:, k])),
+            }
+        return self.validation
+
+    def save(self, path):
+        np.savez(
+            path,
+            coefficients=self.coefficients,
+            covariance=self.covariance,
+            residual_std=self.residual_std,
+            model=json.dumps(
+                {
+                    "inputs": self.inputs,
+                    "scaling": self.scaling,
+                    "outputs": self.outputs,
+                    "degree": self.degree,
+                    "ridge": self.ridge,
+                    "validation": self.validation,
+                    "metadata": self.metadata,
+                }
+            ),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            model = json.loads(str(data["model"]))
+            surrogate = cls(model["inputs"], model["scaling"], model["outputs"], model["degree"], model["ridge"])
+            surrogate.coefficients = data["coefficients"]
+            surrogate.covariance = data["covariance"]
+            surrogate.residual_std = data["residual_std"]
+        surrogate.validation = model["validation"]
+        surrogate.metadata = model["metadata"]
+        return surrogate
+
+    def report(self):
+        lines = [f"polynomial chaos surrogate, degree {self.degree}, {len(self.terms)} terms"]
+        if self.validation:
+            lines.append(f"validation on {self.validation['flights']} held out flights:")
+            for output in self.outputs:
+                error = self.validation[output]
+                lines.append(
+                    f"{output:>16s} - rmse: {error['rmse']:0.3f}, max: {error['max']:0.3f}, "
+                    f"r2: {error['r2']:0.4f}, 95% interval coverage: {error['coverage95']:0.2f}"
+                )
+        return "\n".join(lines)
+
+
+def fit_surrogate(
+    store_path,
+    analysis_parameters,
+    outputs=SURROGATE_OUTPUTS,
+    degree=3,
+    validation_fraction=0.2,
+    seed=0,
+):
+    """Fits a surrogate on the successful flights of a result store.
+
+    A random `validation_fraction` of the flights is held out of the fit and
+    used to measure the error reported in `surrogate.validation`.
+    """
+    results = load_results(store_path)
+    successful = results["status"] == OK
+    X = np.column_stack([results[name][successful] for name in analysis_parameters])
+    Y = np.column_stack([results[name][successful] for name in outputs])
+    finite = np.isfinite(X).all(axis=1) & np.isfinite(Y).all(axis=1)
+    X, Y = X[finite], Y[finite]
+
+    order = np.random.default_rng(seed).permutation(len(X))
+    held_out = order[: int(len(X) * validation_fraction)]
+    training = order[len(held_out):]
+
+    surrogate = PolynomialChaosSurrogate.from_analysis_parameters(analysis_parameters, outputs, degree)
+    surrogate.fit(X[training], Y[training])
+    if len(held_out) > 0:
+        surrogate.validate(X[held_out], Y[held_out])
+    surrogate.metadata = {
+        "store": store_path,
+        "flights": len(X),
+        "trained": datetime.now().isoformat(timespec="seconds"),
+    }
+    return surrogate
+
+
+if __name__ == "__main__":
+    import os
+    from time import perf_counter
+
+    from campaign import STORE_DIRECTORY
+    from monte_carloing import analysis_parameters, campaign_directory, campaign_id
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+    degree = 3 # total polynomial degree, the campaign needs clearly more flights than terms
+    model_file = os.path.join(campaign_directory, campaign_id, "surrogate.npz")
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    surrogate = fit_surrogate(os.path.join(campaign_directory, campaign_id, STORE_DIRECTORY), analysis_parameters, degree = degree)
+    surrogate.save(model_file)
+    print(surrogate.report())
+
+    # a launch day question: rail settings around the nominal ones
+    queries = [{**{name: value[0] for name, value in analysis_parameters.items()}, "inclination": inclination} for inclination in (80, 82, 84, 86)]
+    start_time = perf_counter()
+    predictions = surrogate.predict_settings(queries)
+    print(f"{len(queries)} predictions in {(perf_counter() - start_time) * 1e6:0.0f} us")
+    for query, prediction in zip(queries, predictions):
+        apogee, apogee_std = prediction["apogeeAltitude"]
+        print(f"inclination {query['inclination']} deg - apogee: {apogee:0.1f} ± {apogee_std:0.1f} m")
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from thrust_curve import THRUST_COLUMN, TIME_COLUMN, telemetry_thrust_curve
+
+
+def _write_log(path, seed=0):
+    # readTelemetry.m layout: thrust in Var7, time in Var17 (us), with a
+    # noisy quiet stretch before a 5 s burn and a status line mid log
+    rng = np.random.default_rng(seed)
+    time = np.arange(0, 12, 0.001)
+    thrust = np.where((time > 4.55) & (time < 9.5), 3000 + 50 * np.sin(30 * time), 0.0)
+    thrust += rng.normal(3, 2, time.size)
+    with open(path, "w") as log_file:
+        log_file.write("header line\n")
+        for number, (t, f) in enumerate(zip(time, thrust)):
+            fields = ["0"] * max(THRUST_COLUMN, TIME_COLUMN)
+            fields[THRUST_COLUMN - 1] = f"{f:.3f}"
+            fields[TIME_COLUMN - 1] = str(int(round(t * 1e6)))
+            log_file.write(",".join(fields) + "\n")
+            if number == 6000:
+                log_file.write("STATUS: armed\n")
+    return path
+
+
+@pytest.mark.parametrize("chunk_lines", [50, 200, 4551, 4552])
+def test_chunked_matches_single_chunk(tmp_path, chunk_lines):
+    # ignition straddles the chunk boundary for the small chunk sizes
+    path = str(_write_log(tmp_path / "telemetrylog.txt"))
+    arguments = {"pre_ignition": 0.05, "tare": True}
+    whole = telemetry_thrust_curve(path, chunk_lines=10**6, **arguments)
+    chunked = telemetry_thrust_curve(path, chunk_lines=chunk_lines, **arguments)
+    assert chunked.start_time == whole.start_time
+    assert chunked.ignition_time == whole.ignition_time
+    assert chunked.burnout_time == whole.burnout_time
+    np.testing.assert_array_equal(chunked.time, whole.time)
+    np.testing.assert_array_equal(chunked.thrust, whole.thrust)
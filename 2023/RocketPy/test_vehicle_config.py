@@ -0,0 +1,41 @@
+import os
+
+import pytest
+
+from nimbus_template import NIMBUS_CONFIG_FILE, NIMBUS_PARACHUTES, RocketTemplate, build_motor
+from vehicle_config import build_vehicle, load_config, merge_configs
+
+CONFIGS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "configs")
+
+
+def test_merge_configs():
+    base = {"rocket": {"mass": 50.2, "radius": 0.097}, "surfaces": {"Fins": {"n": 3}, "Canards": {"n": 3}}}
+    merged = merge_configs(base, {"rocket": {"mass": 49}, "surfaces": {"Canards": None}})
+    assert merged == {"rocket": {"mass": 49, "radius": 0.097}, "surfaces": {"Fins": {"n": 3}}}
+    assert base["rocket"]["mass"] == 50.2
+
+
+def test_extends():
+    base = load_config(NIMBUS_CONFIG_FILE)
+    derived = load_config(os.path.join(CONFIGS, "nimbus_2023_canted_fins.json"))
+    assert "Canards" not in derived["surfaces"]
+    assert derived["surfaces"]["Fins"] == {**base["surfaces"]["Fins"], "cant_angle": 25}
+    assert derived["flight"] == {**base["flight"], "terminate_on_apogee": True}
+    # paths are resolved against the file that names them
+    assert derived["motor"] == base["motor"]
+    assert os.path.isfile(derived["motor"]["thrust_source"])
+
+
+def test_derived_config_builds():
+    vehicle = build_vehicle(os.path.join(CONFIGS, "nimbus_2023_canted_fins.json"))
+    rocket = vehicle.template.perturb()
+    assert len(rocket.aerodynamic_surfaces) == 3
+    assert [parachute.name for parachute in rocket.parachutes] == ["Main", "Drogue"]
+
+
+def test_template_is_the_config():
+    template = RocketTemplate.nimbus(build_motor())
+    vehicle = build_vehicle(NIMBUS_CONFIG_FILE)
+    assert template.rocket.total_mass(0) == pytest.approx(vehicle.template.rocket.total_mass(0))
+    assert template.rocket.static_margin(0) == pytest.approx(vehicle.template.rocket.static_margin(0))
+    assert [spec.to_dict() for spec in NIMBUS_PARACHUTES] == [spec.to_dict() for spec in vehicle.template.parachutes]
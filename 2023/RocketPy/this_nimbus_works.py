@@ -213,32 +213,21 @@ NimbusAscentFlight.all_info()
 
 #%% 
 # additional test plots
-# import copy 
-
-# def speed(mass):
-#     mock_rocket = copy.deepcopy(NimbusAscent)
-
-#     # Modify the mass
-#     mock_rocket.mass = mass
-#     mock_rocket.evaluate_dry_mass()
-#     mock_rocket.evaluate_total_mass()
-#     mock_rocket.evaluate_center_of_dry_mass()
-#     mock_rocket.evaluate_center_of_mass()
-#     mock_rocket.evaluate_reduced_mass()
-#     mock_rocket.evaluate_thrust_to_weight()
-#     mock_rocket.evaluate_static_margin()
-
-#     # Simulate Flight until Apogee
-#     test_flight = Flight(
-#         rocket = mock_rocket,
-#         environment = Env,
-#         rail_length = 12,
-#         inclination = 84,
-#         heading = 133,
-#         terminate_on_apogee = True,
-#     )
-#     return test_flight.out_of_rail_velocity
-
-
-# speedbymass = Function(speed, inputs="Mass (kg)", outputs="Out of Rail Speed (m/s)")
-# speedbymass.plot(47, 52, 20)
\ No newline at end of file
+# out of rail speed against mass of the nimbus_template rocket, flown in
+# parallel (see parameter_sweep.py); the atmosphere of this run is saved so
+# the workers need no forecast
+# from atmosphere_cache import save_atmosphere
+# from parameter_sweep import sweep
+
+# save_atmosphere(Env, "nimbus_atmosphere.npz")
+# speedbymass = sweep(
+#     {"rocketMass": np.linspace(47, 52, 20)},
+#     ["outOfRailVelocity"],
+#     atmosphere_file = "nimbus_atmosphere.npz",
+#     environment = Env,
+#     base = {"terminate_on_apogee": True},
+# )
+# Function(
+#     np.column_stack((speedbymass["rocketMass"], speedbymass["outOfRailVelocity"])),
+#     inputs="Mass (kg)", outputs="Out of Rail Speed (m/s)",
+# ).plot(47, 52)
\ No newline at end of file
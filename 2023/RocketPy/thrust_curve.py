@@ -0,0 +1,278 @@
+# hotfire telemetry to RASP .eng thrust curves
+#
+# readTelemetry.m (Thanos hotfire 4) loaded the whole telemetry log with
+# readtable, cut the burn out by hand (rows 37075:37740) and the .eng files
+# were then edited by hand from its output. here the log is streamed in
+# chunks of lines, so its size does not matter: only a short window before
+# ignition and the burn itself are ever kept. ignition is the first sample
+# from which the thrust stays above `ignition_thrust` for `hold` seconds,
+# burnout the first sample from which it stays below `burnout_thrust` for as
+# long. columns are numbered like readtable's Var<n> (thrust Var7, time
+# Var17 in microseconds), separated by commas, semicolons or whitespace;
+# lines that do not parse (headers, status messages) are skipped.
+#
+#   python thrust_curve.py telemetrylog.txt -o nimbus_thrust_hotfire.eng
+#   python thrust_curve.py telemetrylog.txt -o nimbus_thrust_hotfire_cut_off.eng --cut-off 6.72
+
+import argparse
+import os
+import re
+from collections import namedtuple
+
+import numpy as np
+
+THRUST_COLUMN = 7
+TIME_COLUMN = 17
+
+# RASP header of the nimbus motor files: name, diameter (mm), length (mm),
+# delays, propellant and total mass (kg), manufacturer
+NIMBUS_HEADER = ("L101", 150, 220, "4-6-8", 9, 9, "ICLR4A")
+
+ThrustCurve = namedtuple(
+    "ThrustCurve",
+    [
+        "time",  # s from start_time
+        "thrust",  # N
+        "start_time",  # s, log clock of the first sample kept
+        "ignition_time",  # s, log clock
+        "burnout_time",  # s, log clock, None if the log ends burning
+        "total_impulse",  # N s
+        "average_thrust",  # N, over the burn time
+        "peak_thrust",  # N
+        "burn_time",  # s
+        "samples",  # lines of the log read
+    ],
+)
+
+_separators = re.compile(r"[,;\s]+")
+_number_start = set("0123456789+-.")
+
+
+def _parse_chunk(lines, thrust_index, time_index):
+    # (time in s, thrust) of the lines that hold both numbers. numpy parses
+    # the lines that start like a number in one go as long as they all have
+    # the same fields; otherwise the chunk is parsed one line at a time
+    numeric = [line for line in lines if line[:1] in _number_start]
+    if numeric:
+        columns = len(_separators.split(numeric[-1].strip()))
+        if columns > max(thrust_index, time_index):
+            text = " ".join(numeric).replace(",", " ").replace(";", " ")
+            try:
+                values = np.array(text.split(), dtype=float)
+            except ValueError:
+                # a field that is not a number
+                values = np.empty(0)
+            if values.size == len(numeric) * columns:
+                table = values.reshape(len(numeric), columns)
+                return table[:, time_index] * 1e-6, table[:, thrust_index]
+
+    times, thrusts = [], []
+    for line in lines:
+        fields = _separators.split(line.strip())
+        try:
+            time, thrust = float(fields[time_index]), float(fields[thrust_index])
+        except (IndexError, ValueError):
+            continue
+        times.append(time)
+        thrusts.append(thrust)
+    return np.array(times) * 1e-6, np.array(thrusts)
+
+
+def read_telemetry(path, thrust_column=THRUST_COLUMN, time_column=TIME_COLUMN, chunk_lines=100000):
+    """Yields (time in s, thrust) arrays of a telemetry log, `chunk_lines` lines at a time."""
+    with open(path, "r", errors="replace") as log_file:
+        while True:
+            lines = [line for _, line in zip(range(chunk_lines), log_file)]
+            if not lines:
+                return
+            times, thrusts = _parse_chunk(lines, thrust_column - 1, time_column - 1)
+            if len(times):
+                yield times, thrusts
+
+
+def _held(times, met, hold):
+    # index where the first run of `met` samples lasting `hold` s starts
+    # (None if there is none) and where the trailing run starts
+    starts = np.flatnonzero(met & ~np.concatenate(([False], met[:-1])))
+    trailing = int(starts[-1]) if met[-1] else len(met)
+    if len(starts) == 0:
+        return None, trailing
+    run_start = np.full(len(times), -1)
+    run_start[starts] = starts
+    run_start = np.maximum.accumulate(run_start)
+    fired = np.flatnonzero(met & (times - times[np.maximum(run_start, 0)] >= hold))
+    return (int(run_start[fired[0]]) if len(fired) else None), trailing
+
+
+def extract_burn(
+    chunks,
+    ignition_thrust=50.0,
+    burnout_thrust=None,
+    hold=0.05,
+    pre_ignition=0.0,
+    tare=False,
+    max_burn_time=120.0,
+):
+    """Thrust curve of the first burn in a stream of (time, thrust) chunks.
+
+    `burnout_thrust` defaults to `ignition_thrust`. `pre_ignition` s of data
+    before ignition are kept (the start of the ramp up); with `tare` their
+    median is taken as the load cell offset and removed, so pre_ignition
+    should then cover a quiet stretch. The burn ends at burnout or after
+    `max_burn_time` s, which bounds the memory used.
+    """
+    burnout_thrust = ignition_thrust if burnout_thrust is None else burnout_thrust
+    # samples of earlier chunks still needed: before ignition the
+    # pre-ignition window and a run above the threshold that may still last
+    # `hold`, during the burn a run below the threshold
+    carry_times, carry_thrusts = np.empty(0), np.empty(0)
+    burn_times, burn_thrusts = [], []
+    ignition_time = burnout_time = None
+    samples = 0
+
+    for times, thrusts in chunks:
+        samples += len(times)
+        times = np.concatenate((carry_times, times))
+        thrusts = np.concatenate((carry_thrusts, thrusts))
+
+        if ignition_time is None:
+            index, trailing = _held(times, thrusts > ignition_thrust, hold)
+            if index is None:
+                # ignition can only come at or after the trailing run above
+                # the threshold, so the window is measured from its start
+                anchor = times[trailing] if trailing < len(times) else times[-1]
+                keep = int(np.searchsorted(times, anchor - pre_ignition))
+                carry_times, carry_thrusts = times[keep:], thrusts[keep:]
+                continue
+            ignition_time = times[index]
+            window = int(np.searchsorted(times, ignition_time - pre_ignition))
+            burn_times.append(times[window:index])
+            burn_thrusts.append(thrusts[window:index])
+            times, thrusts = times[index:], thrusts[index:]
+
+        index, trailing = _held(times, thrusts < burnout_thrust, hold)
+        end = len(times) if index is None else index
+        end = min(end, int(np.searchsorted(times, ignition_time + max_burn_time, side="right")))
+        burn_times.append(times[:end])
+        burn_thrusts.append(thrusts[:end])
+        if index is not None:
+            burnout_time = times[index]
+            break
+        if end < len(times):
+            break
+        # the trailing run below the threshold is stored, and carried so a
+        # burnout spanning chunks is found; drop it from the stored burn
+        burn_times[-1], burn_thrusts[-1] = times[:trailing], thrusts[:trailing]
+        carry_times, carry_thrusts = times[trailing:], thrusts[trailing:]
+    else:
+        # the log ended during the burn
+        burn_times.append(carry_times if ignition_time is not None else np.empty(0))
+        burn_thrusts.append(carry_thrusts if ignition_time is not None else np.empty(0))
+
+    if ignition_time is None:
+        raise ValueError(f"No ignition found: thrust never stayed above {ignition_thrust} N for {hold} s.")
+
+    time = np.concatenate(burn_times)
+    thrust = np.concatenate(burn_thrusts)
+    if tare:
+        quiet = time < ignition_time
+        if not quiet.any():
+            raise ValueError("Taring needs data before ignition, give a pre_ignition window.")
+        thrust = thrust - np.median(thrust[quiet])
+    # time from the first kept sample, like the hotfire curves
+    return _curve(time - time[0], thrust, time[0], ignition_time, burnout_time, samples)
+
+
+def _curve(time, thrust, start_time, ignition_time, burnout_time, samples):
+    # trapezoid rule (np.trapz is deprecated in numpy 2)
+    total_impulse = float(np.sum((thrust[1:] + thrust[:-1]) * np.diff(time)) / 2)
+    burn_time = float(time[-1] - time[0]) if len(time) > 1 else 0.0
+    return ThrustCurve(
+        time,
+        thrust,
+        start_time,
+        ignition_time,
+        burnout_time,
+        total_impulse,
+        total_impulse / burn_time if burn_time > 0 else 0.0,
+        float(np.max(thrust)),
+        burn_time,
+        samples,
+    )
+
+
+def cut_off(curve, at):
+    """The curve up to `at` s, where the thrust is cut to zero (e.g. a valve closing)."""
+    keep = curve.time < at
+    time = np.append(curve.time[keep], at)
+    thrust = np.append(curve.thrust[keep], np.interp(at, curve.time, curve.thrust))
+    return _curve(time, thrust, curve.start_time, curve.ignition_time, curve.start_time + at, curve.samples)
+
+
+def telemetry_thrust_curve(path, thrust_column=THRUST_COLUMN, time_column=TIME_COLUMN, chunk_lines=100000, **burn_arguments):
+    """Thrust curve of the first burn in the telemetry log at `path` (see extract_burn)."""
+    return extract_burn(read_telemetry(path, thrust_column, time_column, chunk_lines), **burn_arguments)
+
+
+def write_eng(path, curve, header=NIMBUS_HEADER, comment=None):
+    """Writes `curve` as a RASP .eng motor file.
+
+    The RASP curve starts at (0, 0) implicitly, so only points after t = 0
+    are listed, negative thrust is clipped and a final zero thrust point
+    closes the burn one sample spacing after the last point.
+    """
+    time = np.asarray(curve.time, dtype=float)
+    thrust = np.clip(np.asarray(curve.thrust, dtype=float), 0, None)
+    positive = time > 0
+    time, thrust = time[positive], thrust[positive]
+    step = float(np.median(np.diff(time))) if len(time) > 1 else 0.01
+
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "w") as eng_file:
+        for line in (comment or "").splitlines():
+            eng_file.write(f"; {line}\n")
+        eng_file.write(
+            f"; total impulse {curve.total_impulse:0.1f} N s, average thrust {curve.average_thrust:0.1f} N, "
+            f"peak thrust {curve.peak_thrust:0.1f} N, burn time {curve.burn_time:0.3f} s\n"
+        )
+        eng_file.write(" ".join(str(field) for field in header) + "\n")
+        for point_time, point_thrust in zip(time, thrust):
+            eng_file.write(f"{point_time:8.4f} {point_thrust:12.2f}\n")
+        eng_file.write(f"{time[-1] + step:8.4f} {0:12.2f}\n")
+    os.replace(temporary_path, path)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Thrust curve (.eng) of a hotfire telemetry log.")
+    parser.add_argument("log", help="telemetry log, e.g. telemetrylog.txt")
+    parser.add_argument("-o", "--output", default="thrust_curve.eng", help=".eng file to write")
+    parser.add_argument("--thrust-column", type=int, default=THRUST_COLUMN, help="thrust column, 1 based (Var<n>)")
+    parser.add_argument("--time-column", type=int, default=TIME_COLUMN, help="time column in us, 1 based (Var<n>)")
+    parser.add_argument("--ignition", type=float, default=50.0, help="thrust (N) that starts the burn")
+    parser.add_argument("--burnout", type=float, default=None, help="thrust (N) that ends the burn, default --ignition")
+    parser.add_argument("--hold", type=float, default=0.05, help="s a threshold must be crossed for")
+    parser.add_argument("--pre-ignition", type=float, default=0.0, help="s of data kept before ignition")
+    parser.add_argument("--tare", action="store_true", help="remove the pre-ignition median as load cell offset")
+    parser.add_argument("--cut-off", type=float, default=None, help="s after the start where thrust is cut")
+    parser.add_argument("--header", nargs=7, default=NIMBUS_HEADER, help="RASP header fields")
+    arguments = parser.parse_args()
+
+    curve = telemetry_thrust_curve(
+        arguments.log,
+        arguments.thrust_column,
+        arguments.time_column,
+        ignition_thrust=arguments.ignition,
+        burnout_thrust=arguments.burnout,
+        hold=arguments.hold,
+        pre_ignition=arguments.pre_ignition,
+        tare=arguments.tare,
+    )
+    if arguments.cut_off is not None:
+        curve = cut_off(curve, arguments.cut_off)
+    write_eng(arguments.output, curve, arguments.header, comment=f"from {os.path.basename(arguments.log)}")
+    print(
+        f"{arguments.output}: {len(curve.time)} points, burn time {curve.burn_time:0.3f} s, "
+        f"total impulse {curve.total_impulse:0.1f} N s, average thrust {curve.average_thrust:0.1f} N, "
+        f"peak thrust {curve.peak_thrust:0.1f} N ({curve.samples} log samples read)"
+    )
@@ -0,0 +1,277 @@
+# compact archive of full flight trajectories
+#
+# keeping every Flight.solution of a campaign as float64 would need
+# gigabytes, so each trajectory is first decimated: rows are dropped as long
+# as linear interpolation in time between the kept rows reproduces every
+# dropped row within a per-column tolerance (douglas-peucker on the
+# normalised error). the kept rows are stored as float32, flights are packed
+# into chunks that are compressed with zlib, and an index gives the chunk
+# and row offset of every flight. an archive is a directory:
+#   archive.json   columns, tolerances, compression
+#   data.bin       chunks, one after the other
+#   chunks.bin     byte offset, byte length and rows of every chunk
+#   index.bin      flight id, chunk, row offset and rows of every flight
+# data.bin is memory mapped for reading, so replaying one flight only reads
+# (and inflates) the chunk it lives in. chunks and index entries are written
+# after their data, so after a crash anything not fully written is ignored.
+
+import json
+import os
+import warnings
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+from flight_snapshot import STATE_COLUMNS
+
+# largest interpolation error allowed per column, time is not decimated
+DEFAULT_TOLERANCES = {
+    "x": 0.5, "y": 0.5, "z": 0.5,
+    "vx": 0.1, "vy": 0.1, "vz": 0.1,
+    "e0": 1e-4, "e1": 1e-4, "e2": 1e-4, "e3": 1e-4,
+    "w1": 1e-3, "w2": 1e-3, "w3": 1e-3,
+}
+
+ARCHIVE_FILE = "archive.json"
+DATA_FILE = "data.bin"
+CHUNKS_FILE = "chunks.bin"
+INDEX_FILE = "index.bin"
+
+CHUNK_DTYPE = np.dtype([("offset", "<i8"), ("length", "<i8"), ("rows", "<i8")])
+INDEX_DTYPE = np.dtype([("flight", "<i8"), ("chunk", "<i8"), ("row", "<i8"), ("rows", "<i8")])
+
+
+def decimate(solution, columns=STATE_COLUMNS, tolerances=DEFAULT_TOLERANCES):
+    """Rows of `solution` needed to interpolate all others within `tolerances`.
+
+    The first column is time; columns without a tolerance are kept exact
+    only at the kept rows. Returns the kept rows (first and last always).
+    """
+    solution = np.asarray(solution, dtype=float)
+    if len(solution) <= 2:
+        return solution
+    t = solution[:, 0]
+    checked = [j for j, name in enumerate(columns) if name in tolerances and j > 0]
+    values = solution[:, checked]
+    scale = 1 / np.array([tolerances[columns[j]] for j in checked])
+
+    keep = np.zeros(len(solution), dtype=bool)
+    keep[[0, -1]] = True
+    segments = [(0, len(solution) - 1)]
+    while segments:
+        start, end = segments.pop()
+        if end - start < 2:
+            continue
+        span = t[end] - t[start]
+        weight = (t[start + 1:end] - t[start]) / span if span > 0 else np.zeros(end - start - 1)
+        line = values[start] + weight[:, None] * (values[end] - values[start])
+        error = np.max(np.abs(values[start + 1:end] - line) * scale, axis=1)
+        worst = int(np.argmax(error))
+        if error[worst] > 1:
+            split = start + 1 + worst
+            keep[split] = True
+            segments.append((start, split))
+            segments.append((split, end))
+    return solution[keep]
+
+
+class TrajectoryArchive:
+    """Append-only archive of decimated float32 trajectories, read by flight id.
+
+    `append(flight_id, solution)` decimates and buffers a trajectory (pass
+    decimated=True for rows already decimated, e.g. in a worker); every
+    `chunk_flights` flights a compressed chunk is written. `read(flight_id)`
+    returns the stored rows, later appends of the same id replace earlier
+    ones. `compression` is the zlib level, 0 stores chunks raw so they are
+    read straight from the memory map.
+    """
+
+    def __init__(
+        self,
+        path,
+        columns=STATE_COLUMNS,
+        tolerances=DEFAULT_TOLERANCES,
+        chunk_flights=64,
+        compression=6,
+        overwrite=False,
+        cache_chunks=8,
+    ):
+        self.path = path
+        self.chunk_flights = chunk_flights
+        self.cache_chunks = cache_chunks
+        self._buffer = []
+        self._cache = OrderedDict()
+        self._data = None
+
+        if overwrite and os.path.isdir(path):
+            for file_name in (ARCHIVE_FILE, DATA_FILE, CHUNKS_FILE, INDEX_FILE):
+                if os.path.exists(os.path.join(path, file_name)):
+                    os.remove(os.path.join(path, file_name))
+        os.makedirs(path, exist_ok=True)
+
+        settings_path = os.path.join(path, ARCHIVE_FILE)
+        if os.path.exists(settings_path):
+            with open(settings_path, "r") as settings_file:
+                settings = json.load(settings_file)
+        else:
+            settings = {"columns": list(columns), "tolerances": dict(tolerances), "compression": compression}
+            with open(settings_path, "w") as settings_file:
+                json.dump(settings, settings_file, indent=1)
+        self.columns = settings["columns"]
+        self.tolerances = settings["tolerances"]
+        self.compression = settings["compression"]
+
+        self._repair()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _repair(self):
+        # keep only chunks whose data is complete and index entries whose
+        # chunk is, then cut the files back to match
+        data_size = os.path.getsize(self._file(DATA_FILE)) if os.path.exists(self._file(DATA_FILE)) else 0
+        chunks = self._read_table(CHUNKS_FILE, CHUNK_DTYPE)
+        complete = chunks["offset"] + chunks["length"] <= data_size
+        chunks = chunks[: len(chunks) if complete.all() else int(np.argmin(complete))]
+        index = self._read_table(INDEX_FILE, INDEX_DTYPE)
+        index = index[: int(np.sum(index["chunk"] < len(chunks)))]
+
+        for name, table in ((CHUNKS_FILE, chunks), (INDEX_FILE, index)):
+            with open(self._file(name), "ab") as table_file:
+                table_file.truncate(table.nbytes)
+        with open(self._file(DATA_FILE), "ab") as data_file:
+            data_file.truncate(int(chunks["offset"][-1] + chunks["length"][-1]) if len(chunks) else 0)
+
+        self.chunks = chunks
+        self.index = index
+        self._positions = {int(flight): position for position, flight in enumerate(index["flight"])}
+
+    def _read_table(self, name, dtype):
+        file_path = self._file(name)
+        if not os.path.exists(file_path):
+            return np.empty(0, dtype=dtype)
+        count = os.path.getsize(file_path) // dtype.itemsize
+        return np.fromfile(file_path, dtype=dtype, count=count)
+
+    def __len__(self):
+        return len(self._positions) + len({flight for flight, _ in self._buffer} - set(self._positions))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, flight_id, solution, decimated=False):
+        rows = np.asarray(solution, dtype=float)
+        if not decimated:
+            rows = decimate(rows, self.columns, self.tolerances)
+        self._buffer.append((int(flight_id), rows.astype("<f4")))
+        if len(self._buffer) >= self.chunk_flights:
+            self.flush()
+
+    def flush(self, sync=False):
+        """Writes the buffered flights as one chunk, with sync=True also fsync'ed."""
+        if self._buffer:
+            block = np.concatenate([rows for _, rows in self._buffer])
+            payload = block.tobytes()
+            if self.compression:
+                payload = zlib.compress(payload, self.compression)
+
+            offset = int(self.chunks["offset"][-1] + self.chunks["length"][-1]) if len(self.chunks) else 0
+            chunk = np.array([(offset, len(payload), len(block))], dtype=CHUNK_DTYPE)
+            entries = np.empty(len(self._buffer), dtype=INDEX_DTYPE)
+            row = 0
+            for position, (flight_id, rows) in enumerate(self._buffer):
+                entries[position] = (flight_id, len(self.chunks), row, len(rows))
+                row += len(rows)
+
+            # data, then the chunk, then the index entries that point at it
+            for name, content in ((DATA_FILE, payload), (CHUNKS_FILE, chunk.tobytes()), (INDEX_FILE, entries.tobytes())):
+                with open(self._file(name), "ab") as table_file:
+                    table_file.write(content)
+                    if sync:
+                        table_file.flush()
+                        os.fsync(table_file.fileno())
+
+            first = len(self.index)
+            self.chunks = np.concatenate([self.chunks, chunk])
+            self.index = np.concatenate([self.index, entries])
+            for position, flight_id in enumerate(entries["flight"], start=first):
+                self._positions[int(flight_id)] = position
+            self._buffer = []
+            self._data = None
+        elif sync:
+            for name in (DATA_FILE, CHUNKS_FILE, INDEX_FILE):
+                with open(self._file(name), "ab") as table_file:
+                    os.fsync(table_file.fileno())
+
+    def close(self):
+        self.flush()
+        self._data = None
+        self._cache.clear()
+
+    def flight_ids(self):
+        return sorted(set(self._positions) | {flight for flight, _ in self._buffer})
+
+    def _chunk(self, chunk):
+        if chunk in self._cache:
+            self._cache.move_to_end(chunk)
+            return self._cache[chunk]
+        if self._data is None:
+            self._data = np.memmap(self._file(DATA_FILE), dtype=np.uint8, mode="r")
+        offset, length, rows = self.chunks[chunk]
+        payload = self._data[offset:offset + length]
+        if self.compression:
+            payload = zlib.decompress(payload)
+        block = np.frombuffer(payload, dtype="<f4").reshape(int(rows), len(self.columns))
+        self._cache[chunk] = block
+        if len(self._cache) > self.cache_chunks:
+            self._cache.popitem(last=False)
+        return block
+
+    def read(self, flight_id):
+        """Stored (decimated, float32) rows of one flight, columns as in `columns`."""
+        for buffered_id, rows in reversed(self._buffer):
+            if buffered_id == flight_id:
+                return rows
+        _, chunk, row, rows = self.index[self._positions[int(flight_id)]]
+        return self._chunk(int(chunk))[row:row + rows]
+
+    def __getitem__(self, flight_id):
+        return self.read(flight_id)
+
+    def column(self, flight_id, name):
+        return self.read(flight_id)[:, self.columns.index(name)]
+
+    def resample(self, flight_id, times, names=None):
+        """Columns `names` (all but t by default) of a flight interpolated at `times`."""
+        rows = self.read(flight_id)
+        names = self.columns[1:] if names is None else names
+        return np.column_stack(
+            [np.interp(times, rows[:, 0], rows[:, self.columns.index(name)], right=np.nan) for name in names]
+        )
+
+    def envelope(self, name, times, percentiles=(0, 50, 100), flight_ids=None):
+        """Percentiles over all flights of column `name` at `times`.
+
+        Flights that already ended at a time do not count there; reads the
+        flights chunk by chunk, so memory stays at one row of values per
+        flight and time.
+        """
+        flight_ids = self.flight_ids() if flight_ids is None else flight_ids
+        j = self.columns.index(name)
+        values = np.empty((len(flight_ids), len(times)))
+        for position, flight_id in enumerate(sorted(flight_ids, key=self._sort_key)):
+            rows = self.read(flight_id)
+            values[position] = np.interp(times, rows[:, 0], rows[:, j], right=np.nan)
+        # NaN where every flight has ended
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            return np.nanpercentile(values, percentiles, axis=0)
+
+    def _sort_key(self, flight_id):
+        # chunk order, so every chunk is inflated once
+        position = self._positions.get(int(flight_id))
+        return (0, 0) if position is None else (1, int(self.index["chunk"][position]))
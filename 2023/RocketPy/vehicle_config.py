@@ -0,0 +1,324 @@
+# declarative vehicle configurations
+#
+# the nimbus definition was copied into every script (nimbus.py,
+# nimbus_full_flight.py, this_nimbus_works.py, monte_carloing.py, the
+# archived versions and 2024/Nimbus-RocketPy/nimbus.py) and the copies only
+# differ in a few values. a configuration is a json file with one section per
+# part: environment, fluids, tanks, motor, rocket, surfaces, parachutes and
+# flight. configs/nimbus_2023.json is the nimbus every tool flies (through
+# nimbus_template). a file can "extends" another one and only give what
+# changes: dicts are merged key by key, a null removes the key
+# (configs/nimbus_2023_canted_fins.json). file paths (thrust curve, drag
+# curves, airfoil, atmosphere file) are relative to the file that names them.
+#
+# building is the slow part, so built objects are kept per process under the
+# sha1 of everything they are built from: their config sections and the
+# content of the files those name. building a config again, or another config
+# sharing the same tanks and motor (a sweep over surfaces or parachutes),
+# reuses them. rocketpy objects cannot be pickled so they are not kept between
+# runs; the drag curves are, through the drag_tables cache. the rocket comes
+# back as a RocketTemplate: perturb() gives every flight its own copy, the
+# cached rocket is never flown. make_motor and make_rocket build without the
+# cache, for callers that need objects of their own.
+#
+#   python vehicle_config.py configs/nimbus_2023.json configs/nimbus_2023_canted_fins.json
+
+import hashlib
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
+from rocketpy import Environment, Flight, Rocket
+from rocketpy.motors import (
+    CylindricalTank,
+    Fluid,
+    LevelBasedTank,
+    LiquidMotor,
+    MassBasedTank,
+    MassFlowRateBasedTank,
+    SphericalTank,
+    UllageBasedTank,
+)
+
+from atmosphere_cache import load_atmosphere
+from drag_tables import drag_curve
+from parachute_triggers import ParachuteSpec
+
+SECTIONS = ["environment", "fluids", "tanks", "motor", "rocket", "surfaces", "parachutes", "flight"]
+
+# keys whose (string) values are file paths
+PATH_FIELDS = {"thrust_source", "power_off_drag", "power_on_drag", "airfoil", "file"}
+
+GEOMETRIES = {"CylindricalTank": CylindricalTank, "SphericalTank": SphericalTank}
+TANKS = {
+    "MassFlowRateBasedTank": MassFlowRateBasedTank,
+    "LevelBasedTank": LevelBasedTank,
+    "MassBasedTank": MassBasedTank,
+    "UllageBasedTank": UllageBasedTank,
+}
+MOTORS = {"LiquidMotor": LiquidMotor}
+SURFACES = {
+    "nose": Rocket.add_nose,
+    "tail": Rocket.add_tail,
+    "trapezoidal_fins": Rocket.add_trapezoidal_fins,
+    "elliptical_fins": Rocket.add_elliptical_fins,
+}
+
+# built object per (part, content hash), and file path -> (mtime, size, sha1)
+_built = {}
+_file_digests = {}
+
+Vehicle = namedtuple("Vehicle", ["environment", "motor", "template", "flight", "config"])
+
+
+def _resolve_paths(section, directory):
+    # copy of a config with the relative file paths made absolute
+    if isinstance(section, dict):
+        resolved = {}
+        for key, value in section.items():
+            if key in PATH_FIELDS and isinstance(value, str):
+                value = os.path.normpath(os.path.join(directory, value))
+            elif key in PATH_FIELDS and isinstance(value, list) and value and isinstance(value[0], str):
+                value = [os.path.normpath(os.path.join(directory, value[0])), *value[1:]]
+            else:
+                value = _resolve_paths(value, directory)
+            resolved[key] = value
+        return resolved
+    if isinstance(section, list):
+        return [_resolve_paths(value, directory) for value in section]
+    return section
+
+
+def merge_configs(base, changes):
+    """`base` updated with `changes`: dicts merged key by key, None removes a key."""
+    merged = dict(base)
+    for key, value in changes.items():
+        if value is None:
+            merged.pop(key, None)
+        elif isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_configs(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def load_config(path, _seen=()):
+    """Config dict of the json file at `path`, with its "extends" chain applied."""
+    path = os.path.abspath(path)
+    if path in _seen:
+        raise ValueError(f"Config {path} extends itself.")
+    with open(path, "r") as config_file:
+        config = _resolve_paths(json.load(config_file), os.path.dirname(path))
+    parent = config.pop("extends", None)
+    if parent is not None:
+        config = merge_configs(load_config(os.path.join(os.path.dirname(path), parent), (*_seen, path)), config)
+    unknown = set(config) - set(SECTIONS)
+    if unknown:
+        raise ValueError(f"{path}: unknown sections {sorted(unknown)}, choose from {SECTIONS}.")
+    return config
+
+
+def _file_digest(path):
+    status = os.stat(path)
+    cached = _file_digests.get(path)
+    if cached is None or cached[:2] != (status.st_mtime_ns, status.st_size):
+        with open(path, "rb") as data_file:
+            cached = (status.st_mtime_ns, status.st_size, hashlib.sha1(data_file.read()).hexdigest())
+        _file_digests[path] = cached
+    return cached[2]
+
+
+def _hashable(section):
+    # the section with every file it names replaced by the hash of its content
+    if isinstance(section, dict):
+        return {key: _hashable(value) for key, value in section.items()}
+    if isinstance(section, list):
+        return [_hashable(value) for value in section]
+    if isinstance(section, str) and os.path.isfile(section):
+        return "sha1:" + _file_digest(section)
+    return section
+
+
+def content_hash(*sections):
+    """sha1 of config sections and of the content of the files they name."""
+    text = json.dumps([_hashable(section) for section in sections], sort_keys=True)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def _cached(part, key, build):
+    if (part, key) not in _built:
+        _built[part, key] = build()
+    return _built[part, key]
+
+
+def clear_cache():
+    _built.clear()
+
+
+def build_environment(config):
+    section = config["environment"]
+
+    def build():
+        environment = Environment(
+            latitude=section.get("latitude", 0),
+            longitude=section.get("longitude", 0),
+            elevation=section.get("elevation", 0),
+        )
+        if section.get("date") is not None:
+            environment.set_date(tuple(section["date"]))
+        atmosphere = dict(section.get("atmosphere", {"type": "standard_atmosphere"}))
+        if "file" in atmosphere:
+            # a saved column, see atmosphere_cache
+            return load_atmosphere(environment, atmosphere["file"])
+        environment.set_atmospheric_model(**atmosphere)
+        return environment
+
+    return _cached("environment", content_hash(section), build)
+
+
+def _build_tank(name, section, fluids):
+    section = dict(section)
+    tank_type = section.pop("type")
+    geometry = dict(section.pop("geometry"))
+    geometry = GEOMETRIES[geometry.pop("type")](**geometry)
+    for phase in ("liquid", "gas"):
+        fluid = section[phase]
+        section[phase] = Fluid(name=fluid, density=fluids[fluid]["density"])
+    return TANKS[tank_type](name=name, geometry=geometry, **section)
+
+
+def make_tank(config, name):
+    """Tank `name` of the config, built without the cache."""
+    return _build_tank(name, config["tanks"][name], config["fluids"])
+
+
+def build_tank(config, name):
+    section = config["tanks"][name]
+    fluids = {phase: config["fluids"][section[phase]] for phase in ("liquid", "gas")}
+    return _cached(
+        "tank",
+        content_hash(name, section, fluids),
+        lambda: _build_tank(name, section, config["fluids"]),
+    )
+
+
+def _motor_hash(config):
+    section = config["motor"]
+    tanks = {name: config["tanks"][name] for name in section.get("tanks", {})}
+    fluids = {fluid: config["fluids"][fluid] for tank in tanks.values() for fluid in (tank["liquid"], tank["gas"])}
+    return content_hash(section, tanks, fluids)
+
+
+def _build_motor(config, tank):
+    arguments = dict(config["motor"])
+    motor_type = arguments.pop("type", "LiquidMotor")
+    tanks = arguments.pop("tanks", {})
+    motor = MOTORS[motor_type](**arguments)
+    for name, position in tanks.items():
+        motor.add_tank(tank(config, name), position)
+    return motor
+
+
+def make_motor(config):
+    """Motor of the config with tanks of its own, built without the cache.
+
+    A motor evaluates its tanks lazily and keeps the results, so a fresh one
+    costs that evaluation again (see motor_tables).
+    """
+    return _build_motor(config, make_tank)
+
+
+def build_motor(config):
+    return _cached("motor", _motor_hash(config), lambda: _build_motor(config, build_tank))
+
+
+def _drag(value):
+    # a csv is cleaned and cached by drag_tables, numbers and tables pass
+    return drag_curve(value) if isinstance(value, str) and value.endswith(".csv") else value
+
+
+def make_rocket(config, motor=None):
+    """Rocket of the config with its surfaces, no parachutes, built without the cache.
+
+    `motor` replaces the config's motor (the cached one by default).
+    """
+    section = dict(config["rocket"])
+    rail_buttons = section.pop("rail_buttons", None)
+    motor_position = section.pop("motor_position", None)
+    for drag in ("power_off_drag", "power_on_drag"):
+        section[drag] = _drag(section[drag])
+    if "inertia" in section:
+        section["inertia"] = tuple(section["inertia"])
+    rocket = Rocket(**section)
+
+    if rail_buttons is not None:
+        rocket.set_rail_buttons(**rail_buttons)
+    if motor is None and "motor" in config:
+        motor = build_motor(config)
+    if motor is not None and motor_position is not None:
+        rocket.add_motor(motor, position=motor_position)
+    for name, surface in config.get("surfaces", {}).items():
+        surface = dict(surface)
+        add = SURFACES[surface.pop("type")]
+        add(rocket, name=name, **surface)
+    return rocket
+
+
+def parachute_specs(config):
+    """ParachuteSpec per parachute, cd_s given or from "cd" and "diameter"."""
+    specs = []
+    for name, section in config.get("parachutes", {}).items():
+        section = dict(section)
+        if "cd_s" not in section:
+            section["cd_s"] = section.pop("cd") * np.pi * section.pop("diameter") ** 2 / 4
+        specs.append(ParachuteSpec(name=name, **section))
+    return specs
+
+
+def build_template(config):
+    """RocketTemplate of the config's rocket, motor, surfaces and parachutes."""
+    # nimbus_template builds its vehicle from this module
+    from nimbus_template import RocketTemplate
+
+    key = content_hash(config["rocket"], config.get("surfaces", {}), _motor_hash(config) if "motor" in config else None)
+    rocket = _cached("rocket", key, lambda: make_rocket(config))
+    # specs are plain data and cheap, the template shares the cached rocket
+    return RocketTemplate(rocket, parachute_specs(config))
+
+
+def build_vehicle(config):
+    """Vehicle (environment, motor, template, flight settings) of a config dict or json path."""
+    if isinstance(config, (str, os.PathLike)):
+        config = load_config(config)
+    return Vehicle(
+        build_environment(config),
+        build_motor(config) if "motor" in config else None,
+        build_template(config),
+        dict(config.get("flight", {})),
+        config,
+    )
+
+
+def fly(vehicle, rng=None, **flight_arguments):
+    """Flight of a fresh copy of the vehicle's rocket, flight settings overridable."""
+    return Flight(
+        rocket=vehicle.template.perturb(rng=rng),
+        environment=vehicle.environment,
+        **{**vehicle.flight, **flight_arguments},
+    )
+
+
+if __name__ == "__main__":
+    import sys
+    from time import perf_counter
+
+    for path in sys.argv[1:]:
+        start_time = perf_counter()
+        vehicle = build_vehicle(path)
+        built = perf_counter() - start_time
+        flight = fly(vehicle, terminate_on_apogee=True)
+        print(
+            f"{path}: built in {built:0.2f} s ({len(_built)} objects cached), "
+            f"apogee {flight.apogee - vehicle.environment.elevation:0.1f} m AGL"
+        )